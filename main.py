@@ -1,3 +1,6 @@
+import asyncio
+import contextlib
+from contextlib import asynccontextmanager
 from typing import Optional
 
 import uvicorn
@@ -6,8 +9,42 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from quickly_rag import api
+from quickly_rag.chat.message.chat_session_manager import get_session_manager
+from quickly_rag.config.chat_config import default_session_sweep_interval_seconds
+from quickly_rag.config.vector_config import default_warmup_vector_stores
+from quickly_rag.provider.embedding_cache import get_query_embedding_cache
+from quickly_rag.provider.rerank_cache import get_rerank_cache
+from quickly_rag.provider.reranker_provider import close_reranker_clients, aclose_reranker_clients, \
+    get_reranker_circuit_breaker
+from quickly_rag.provider.vector_store_provider import get_vector_store_registry
+from quickly_rag.vector.store.adaptive_rerank import get_rerank_stats
+from quickly_rag.vector.store.search_cache import get_search_cache
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    session_manager = get_session_manager()
+    # 预先创建向量库, 查询时不再承担创建连接的耗时
+    vector_store_registry = get_vector_store_registry()
+    await asyncio.to_thread(vector_store_registry.warm_up, default_warmup_vector_stores)
+    # 后台定时清理过期会话
+    sweeper = None
+    if default_session_sweep_interval_seconds > 0:
+        sweeper = asyncio.create_task(session_manager.run_sweeper(default_session_sweep_interval_seconds))
+    yield
+    if sweeper is not None:
+        sweeper.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await sweeper
+    # 退出前把会话写队列中的对话记录写完
+    session_manager.close()
+    vector_store_registry.shutdown()
+    get_query_embedding_cache().close()
+    close_reranker_clients()
+    await aclose_reranker_clients()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 class ChatRequest(BaseModel):
@@ -24,6 +61,15 @@ def chat_stream(parms: ChatRequest):
     )
 
 
+@app.get('/health')
+def health():
+    vector_stores = get_vector_store_registry().health_check()
+    return {"status": "ok" if all(vector_stores.values()) else "degraded", "vector_stores": vector_stores,
+            "query_embedding_cache": get_query_embedding_cache().stats(),
+            "search_cache": get_search_cache().stats(),
+            "rerank": {**get_rerank_stats().stats(), "circuit": get_reranker_circuit_breaker().stats(),
+                       "score_cache": get_rerank_cache().stats()}}
+
 
 if __name__ == '__main__':
     uvicorn.run('main:app', host="0.0.0.0", port=18000)
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Iterator
+from typing import Iterator, Optional
 
 from langchain_core.runnables.utils import Output
 
@@ -20,7 +20,8 @@ class QuicklyRagAPI:
     @staticmethod
     def vectorize_file(file_path: str | Path, rag_config: RagDocumentInfo = rag_document_info,
                        embedding_type: PlatformEmbeddingType = default_embedding_use_platform,
-                       vectorstore_type: VectorStorageType = default_embedding_database_type
+                       vectorstore_type: VectorStorageType = default_embedding_database_type,
+                       collection_name: Optional[str] = None
                        ) -> bool:
         """
            将指定文件向量化并存储到向量数据库中
@@ -30,6 +31,7 @@ class QuicklyRagAPI:
                rag_config: 文档分割配置
                embedding_type: 嵌入模型类型
                vectorstore_type: 向量存储类型
+               collection_name: 集合名称, 为空时使用该向量库配置的默认集合
 
            Returns:
                bool: 处理是否成功
@@ -38,7 +40,7 @@ class QuicklyRagAPI:
                FileNotFoundError: 当指定文件不存在时
                Exception: 其他处理过程中的异常
            """
-        return vectorize_file(file_path, rag_config, embedding_type, vectorstore_type)
+        return vectorize_file(file_path, rag_config, embedding_type, vectorstore_type, collection_name)
 
     @staticmethod
     def llm_stream_chat(question: str, session_id: str = None, prompt_name: str = 'system',
@@ -0,0 +1,182 @@
+"""
+语义答案缓存
+同义改写的问题 (问题向量的余弦相似度高于阈值) 直接返回之前生成的答案, 跳过检索、重排和模型生成
+缓存按 (向量库类型, 集合名称, 提示词名称, 对话平台, 检索参数) 分区, 文档入库或删除时按集合整体失效
+"""
+import threading
+import time
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from quickly_rag.config.chat_config import default_answer_cache_similarity, default_answer_cache_ttl_seconds, \
+    default_answer_cache_size
+from quickly_rag.config.platform_config import default_embedding_use_platform
+from quickly_rag.enums.platform_enum import PlatformEmbeddingType, PlatformChatModelType
+from quickly_rag.enums.vector_enum import VectorStorageType
+from quickly_rag.provider.embedding_model_provider import QuicklyEmbeddingModelProvider
+
+# (向量库类型, 集合名称, 提示词名称, 对话平台, 除问题外的检索参数)
+_Namespace = Tuple[VectorStorageType, str, str, PlatformChatModelType, Tuple[Tuple[str, Any], ...]]
+
+
+class _AnswerIndex:
+    """单个分区内的问题向量和答案"""
+    __slots__ = ("questions", "answers", "created_at", "vectors", "_matrix")
+
+    def __init__(self):
+        self.questions: List[str] = []
+        self.answers: List[str] = []
+        self.created_at: List[float] = []
+        self.vectors: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def matrix(self) -> np.ndarray:
+        # 只在条目变化后重新拼接矩阵
+        if self._matrix is None:
+            self._matrix = np.stack(self.vectors)
+        return self._matrix
+
+    def append(self, question: str, answer: str, vector: np.ndarray) -> None:
+        self.questions.append(question)
+        self.answers.append(answer)
+        self.created_at.append(time.time())
+        self.vectors.append(vector)
+        self._matrix = None
+
+    def drop(self, count: int) -> None:
+        """丢弃最早的 count 条"""
+        del self.questions[:count]
+        del self.answers[:count]
+        del self.created_at[:count]
+        del self.vectors[:count]
+        self._matrix = None
+
+
+class SemanticAnswerCache:
+    """
+    语义答案缓存
+    每个分区是一个小的暴力检索向量索引, 条目按写入顺序保存, 超出容量或过期时从最早的条目开始丢弃
+    """
+
+    def __init__(self, embedding_type: PlatformEmbeddingType = default_embedding_use_platform,
+                 similarity: float = default_answer_cache_similarity,
+                 ttl_seconds: float = default_answer_cache_ttl_seconds,
+                 max_entries: int = default_answer_cache_size):
+        """
+        Args:
+            embedding_type: 问题向量化使用的平台
+            similarity: 命中需要的最小余弦相似度
+            ttl_seconds: 答案的有效期(秒)
+            max_entries: 每个分区最多缓存的答案数量
+        """
+        self.embedding_type = embedding_type
+        self.similarity = similarity
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._indexes: dict[_Namespace, _AnswerIndex] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _embed(self, question: str) -> np.ndarray:
+        # embed_query 走问题向量缓存, 未命中答案缓存时后续的向量检索不会再次请求嵌入模型
+        vector = np.asarray(QuicklyEmbeddingModelProvider(self.embedding_type).embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _purge_expired(self, index: _AnswerIndex) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        expired = 0
+        while expired < len(index.created_at) and index.created_at[expired] < cutoff:
+            expired += 1
+        if expired:
+            index.drop(expired)
+
+    def lookup(self, question: str, namespace: _Namespace) -> Optional[str]:
+        """
+        查找语义相近问题的答案
+        Returns:
+            命中时返回缓存的答案, 否则返回 None
+        """
+        with self._lock:
+            index = self._indexes.get(namespace)
+            empty = index is None or not index.answers
+        if empty:
+            with self._lock:
+                self._misses += 1
+            return None
+
+        try:
+            vector = self._embed(question)
+        except Exception as e:
+            logger.warning(f"[AnswerCache] 问题向量化失败, 跳过答案缓存: {e}")
+            return None
+
+        with self._lock:
+            index = self._indexes.get(namespace)
+            if index is not None:
+                self._purge_expired(index)
+            if index is None or not index.answers:
+                self._misses += 1
+                return None
+            scores = index.matrix() @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity:
+                self._misses += 1
+                return None
+            self._hits += 1
+            logger.info(f"[AnswerCache] 命中缓存答案 (相似度 {scores[best]:.4f}): {index.questions[best]}")
+            return index.answers[best]
+
+    def store(self, question: str, answer: str, namespace: _Namespace) -> None:
+        """保存问题和答案"""
+        try:
+            vector = self._embed(question)
+        except Exception as e:
+            logger.warning(f"[AnswerCache] 问题向量化失败, 答案不写入缓存: {e}")
+            return
+
+        with self._lock:
+            index = self._indexes.setdefault(namespace, _AnswerIndex())
+            self._purge_expired(index)
+            index.append(question, answer, vector)
+            overflow = len(index.answers) - self.max_entries
+            if overflow > 0:
+                index.drop(overflow)
+
+    def invalidate(self, vectorstore_type: Optional[VectorStorageType] = None,
+                   collection_name: Optional[str] = None) -> None:
+        """
+        使缓存的答案失效, 文档重新入库或删除后调用
+        Args:
+            vectorstore_type: 只清除该向量库的答案, 为空时清除全部
+            collection_name: 只清除该集合的答案, 为空时清除该向量库的全部集合
+        """
+        with self._lock:
+            for namespace in list(self._indexes):
+                if vectorstore_type is not None and namespace[0] != vectorstore_type:
+                    continue
+                if collection_name is not None and namespace[1] != collection_name:
+                    continue
+                del self._indexes[namespace]
+        target = f"{vectorstore_type.value}/{collection_name or '*'}" if vectorstore_type else 'all'
+        logger.info(f"[AnswerCache] 答案缓存已失效: {target}")
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "size": sum(len(index.answers) for index in self._indexes.values()),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 4) if total else 0.0,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_answer_cache() -> SemanticAnswerCache:
+    """获取进程内共享的语义答案缓存"""
+    return SemanticAnswerCache()
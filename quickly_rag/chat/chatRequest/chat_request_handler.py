@@ -1,9 +1,11 @@
 import json
+import time
 import uuid
 from collections.abc import Iterator
+from typing import Optional
 
 from langchain.agents import create_agent
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessageChunk
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, AIMessageChunk, BaseMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables.base import Other
@@ -12,11 +14,18 @@ from loguru import logger
 
 from quickly_rag.core.search_base import VectorSearchParams
 from quickly_rag.enums.platform_enum import  PlatformChatModelType
-from quickly_rag.chat.message.chat_message import convert_history_to_langchain_format
-from quickly_rag.chat.message.chat_session_manager import ChatSessionManager
-from quickly_rag.chat.prompt.system_prompt_manager import SystemPromptManager
+from quickly_rag.chat.cache.answer_cache import get_answer_cache
+from quickly_rag.chat.message.chat_message_manager import ChatMessageManager
+from quickly_rag.chat.message.chat_session_manager import ChatSessionManager, get_session_manager
+from quickly_rag.chat.message.token_counter import count_tokens
+from quickly_rag.chat.prompt.system_prompt_manager import SystemPromptManager, get_system_prompt_manager
+from quickly_rag.config.chat_config import default_history_window_mode, default_prompt_token_budget, \
+    default_session_memory_top_k, default_session_memory_recent_messages, default_prompt_layout_mode, \
+    default_answer_cache_enabled, default_answer_cache_skip_with_history, default_answer_cache_replay_chunk_size
 from quickly_rag.config.platform_config import default_chat_model_use_platform
+from quickly_rag.enums.session_enum import HistoryWindowMode, PromptLayoutMode
 from quickly_rag.provider.chat_model_provider import QuicklyChatModelProvider
+from quickly_rag.provider.vector_store_provider import QuicklyVectorStoreProvider
 from quickly_rag.vector.store.vector_store import search_by_scores
 
 
@@ -26,6 +35,104 @@ def _format_sse(data: str | dict) -> str:
         data = json.dumps(data, ensure_ascii=False)
     # SSE 规范: 以 data: 开头，双换行结尾
     return f"data: {data}\n\n"
+
+
+def _load_history(session: ChatSessionManager, message_manager: ChatMessageManager, session_id: str,
+                  platform_type: PlatformChatModelType, question: str, system_content: str) -> list[BaseMessage]:
+    """
+    按配置的窗口模式获取LangChain格式的历史记录
+    TOKEN_BUDGET 模式下历史可用的 token 数 = 平台预算 - 系统提示词、检索资料和问题占用的 token 数
+    开启长期记忆时, 历史 = 与问题最相关的旧对话 + 最近几条消息
+    """
+    token_budget = None
+    if default_history_window_mode == HistoryWindowMode.TOKEN_BUDGET:
+        budget = default_prompt_token_budget.get(platform_type)
+        if budget is not None:
+            token_budget = max(budget - count_tokens(system_content) - count_tokens(question), 0)
+
+    recalled: list[BaseMessage] = []
+    if session.memory is not None:
+        # 最近的消息已经在提示词里, 按实际的近期消息排除这些轮次 (最新一轮可能还没有向量化)
+        with session.session_lock(session_id):
+            recent = list(message_manager.messages)[-default_session_memory_recent_messages:]
+        turns = session.memory.recall(session_id, question, default_session_memory_top_k,
+                                      exclude_turns=ChatSessionManager._pair_turns(recent))
+        for human, ai in turns:
+            recalled += [HumanMessage(content=human), AIMessage(content=ai)]
+            if token_budget is not None:
+                token_budget = max(token_budget - count_tokens(human) - count_tokens(ai), 0)
+
+    with session.session_lock(session_id):
+        history = message_manager.to_langchain_messages(token_budget)
+
+    if session.memory is not None:
+        history = history[-default_session_memory_recent_messages:]
+        # 不以孤立的 AI 回复开头
+        while history and not isinstance(history[0], HumanMessage):
+            history = history[1:]
+    return recalled + history
+
+
+def _build_input_messages(system_prompt_manager: SystemPromptManager, prompt_name: str, context_str: str,
+                          history: list[BaseMessage], question: str) -> list[BaseMessage]:
+    """
+    按配置的提示词布局组装输入消息
+    CONTEXT_IN_SYSTEM: [系统提示词 + 参考资料] + 历史 + 问题
+    PREFIX_CACHE: 历史 + [参考资料 + 问题], 系统提示词由 agent 放在最前面, 前缀在同一会话的多次请求之间保持不变
+    """
+    if default_prompt_layout_mode == PromptLayoutMode.PREFIX_CACHE:
+        question_content = system_prompt_manager.get_question_content(context_str, question)
+        return history + [HumanMessage(content=question_content)]
+
+    full_system_content = system_prompt_manager.get_system_content(prompt_name, context_str)
+    return [SystemMessage(content=full_system_content)] + history + [HumanMessage(content=question)]
+
+
+def _usage_summary(usage: dict | None, ttft_ms: float | None = None) -> dict:
+    """提取模型返回的 token 用量, cached_tokens 为命中平台提示词缓存的输入 token 数"""
+    usage = usage or {}
+    summary = {
+        "input_tokens": usage.get("input_tokens"),
+        "cached_tokens": (usage.get("input_token_details") or {}).get("cache_read"),
+        "output_tokens": usage.get("output_tokens"),
+    }
+    if ttft_ms is not None:
+        summary["ttft_ms"] = round(ttft_ms, 1)
+    logger.info(f"[Chat] 提示词布局: {default_prompt_layout_mode.value}, token 用量: {summary}")
+    return summary
+
+
+def _answer_cache_namespace(message_manager: ChatMessageManager, search_params: VectorSearchParams,
+                            prompt_name: str, platform_type: PlatformChatModelType) -> Optional[tuple]:
+    """语义答案缓存的分区, 未开启缓存或当前会话需要绕过缓存时返回 None"""
+    if not default_answer_cache_enabled:
+        return None
+    # 已有历史的会话, 同样的问题可能因为上下文不同而需要不同的答案
+    if default_answer_cache_skip_with_history and message_manager.messages:
+        return None
+    collection_name = QuicklyVectorStoreProvider.default_collection_name(search_params.vectorstore_type)
+    # 检索参数 (top_k、混合检索、重排、过滤条件等) 不同时检索到的资料不同, 答案不能共用
+    retrieval = tuple(sorted(search_params.model_dump(exclude={"query", "vectorstore_type"}).items()))
+    return search_params.vectorstore_type, collection_name, prompt_name, platform_type, retrieval
+
+
+def _save_turn(session: ChatSessionManager, message_manager: ChatMessageManager, session_id: str,
+               question: str, answer: str) -> None:
+    """保存一轮对话"""
+    with session.session_lock(session_id):
+        message_manager.add_human_message(question)
+        message_manager.add_ai_message(answer)
+        session.save_session(session_id, message_manager)
+
+
+def _replay_cached_answer(answer: str, session_id: str) -> Iterator[str]:
+    """把缓存的答案按固定大小分片, 以和模型生成相同的 SSE 格式输出"""
+    chunk_size = default_answer_cache_replay_chunk_size
+    for i in range(0, len(answer), chunk_size):
+        yield _format_sse({"content": answer[i:i + chunk_size], "session_id": session_id, "status": "thinking"})
+    yield _format_sse({"content": "", "status": "done", "session_id": session_id, "cached": True})
+
+
 # SSE模型流式对话
 def llm_stream_chat(question: str,
                     session_id: str = None,
@@ -36,25 +143,34 @@ def llm_stream_chat(question: str,
         session_id = str(uuid.uuid4())
 
     # 1.查询对话记忆 先获取管理session 在根据userid获取管理器 在从管理器中获取全部对话记录
-    session = ChatSessionManager(default_max_messages=100, ttl_seconds=3600 * 24 * 7)
+    session = get_session_manager()
     message_manager = session.get_session(session_id)
-    logger.info(f'查询到的消息记录: {message_manager.list_messages()}')
-
-    # 2. 转换历史记录为LangChain格式
-    converted_history = convert_history_to_langchain_format(message_manager.list_messages())
-
-    # 5. 向量检索对话 对话相关的资料
     if search_params is None:
         search_params = VectorSearchParams(query=question)
+
+    # 命中语义答案缓存时直接回放答案, 跳过检索和模型生成
+    cache_namespace = _answer_cache_namespace(message_manager, search_params, prompt_name, platform_type)
+    if cache_namespace is not None:
+        cached_answer = get_answer_cache().lookup(question, cache_namespace)
+        if cached_answer is not None:
+            _save_turn(session, message_manager, session_id, question, cached_answer)
+            yield from _replay_cached_answer(cached_answer, session_id)
+            return
+
+    # 2. 向量检索对话 对话相关的资料
     scores = search_by_scores(search_params)
     context_str = "\n\n".join([f"<资料片段>\n\n: {res.text}\n\n<资料片段>\n\n" for res in scores])
     logger.info(f'向量检索结果: {context_str}')
 
     # 3.添加提示词 获取管理器对象
     # 然后默认读取系统提示词 需要给系统提示词一个名称 默认会读取SystemPromptManager类下的system.md当作系统提示词 也可以传入file_path
-    system_prompt_manager = SystemPromptManager()
+    system_prompt_manager = get_system_prompt_manager()
     system_prompt = system_prompt_manager.get_prompt(prompt_name)
 
+    # 4. 获取LangChain格式的历史记录, 按 token 预算为系统提示词、检索资料和问题留出空间
+    converted_history = _load_history(session, message_manager, session_id, platform_type,
+                                      question, system_prompt + context_str)
+    logger.info(f'查询到的消息记录: {len(converted_history)} 条')
 
     # 获取llm
     llm = QuicklyChatModelProvider(platform_type)
@@ -62,17 +178,25 @@ def llm_stream_chat(question: str,
     try:
         # 使用 yield from 返回生成器，让上层调用者可以流式接收
         full_response = ""
+        usage = None
+        ttft_ms = None
+        started = time.perf_counter()
         agent = create_agent(model=llm.chat_model, tools=[], system_prompt=system_prompt)
 
-        # 4.创建包含历史的提示模板
-        full_system_content = f"{system_prompt}\n\n以下是检索到的参考资料，请基于这些资料回答问题：\n\n{context_str}"
-        input_messages = [SystemMessage(content=full_system_content)] + converted_history + [HumanMessage(content=question)]
+        # 5.创建包含历史的提示模板
+        input_messages = _build_input_messages(system_prompt_manager, prompt_name, context_str,
+                                               converted_history, question)
 
         for msg, metadata in agent.stream({"messages": input_messages}, stream_mode="messages"):
+            # token 用量在最后一个 (内容为空的) 分片中返回
+            if isinstance(msg, AIMessageChunk) and msg.usage_metadata:
+                usage = msg.usage_metadata
 
             # 4. 过滤数据
             if isinstance(msg, AIMessageChunk) and msg.content:
                 content = msg.content
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
                 full_response += content
 
                 payload = {
@@ -84,11 +208,12 @@ def llm_stream_chat(question: str,
 
         # 8. 对话结束后，手动保存对话记录
         if full_response:
-            message_manager.add_human_message(question)
-            message_manager.add_ai_message(full_response)
-            session.save_session(session_id)
+            _save_turn(session, message_manager, session_id, question, full_response)
+            if cache_namespace is not None:
+                get_answer_cache().store(question, full_response, cache_namespace)
 
-        yield _format_sse({"content": "", "status": "done", "session_id": session_id})
+        yield _format_sse({"content": "", "status": "done", "session_id": session_id,
+                           "usage": _usage_summary(usage, ttft_ms)})
 
     except Exception as e:
         logger.error(f"流式对话出错: {e}")
@@ -109,25 +234,37 @@ def llm_chat(question: str = None,
         question = search_params.query
 
     # 1.查询对话记忆 先获取管理session 在根据userid获取管理器 在从管理器中获取全部对话记录
-    session = ChatSessionManager(default_max_messages=100, ttl_seconds=3600 * 24 * 7)
+    session = get_session_manager()
     message_manager = session.get_session(session_id)
-    logger.info(f'查询到的消息记录: {message_manager.list_messages()}')
-
-    # 2. 转换历史记录为LangChain格式
-    converted_history = convert_history_to_langchain_format(message_manager.list_messages())
-
-    # 5. 向量检索对话 对话相关的资料
     if search_params is None:
         search_params = VectorSearchParams(query=question)
+
+    # 命中语义答案缓存时直接返回答案, 跳过检索和模型生成
+    cache_namespace = _answer_cache_namespace(message_manager, search_params, prompt_name, platform_type)
+    if cache_namespace is not None:
+        cached_answer = get_answer_cache().lookup(question, cache_namespace)
+        if cached_answer is not None:
+            _save_turn(session, message_manager, session_id, question, cached_answer)
+            return {
+                "content": AIMessage(content=cached_answer),
+                "session_id": session_id,
+                "cached": True,
+            }
+
+    # 2. 向量检索对话 对话相关的资料
     scores = search_by_scores(search_params)
     context_str = "\n\n".join([f"<资料片段>\n\n: {res.text}\n\n<资料片段>\n\n" for res in scores])
     # logger.info(f'向量检索结果: {context_str}')
 
     # 3.添加提示词 获取管理器对象
     # 然后默认读取系统提示词 需要给系统提示词一个名称 默认会读取SystemPromptManager类下的system.md当作系统提示词 也可以传入file_path
-    system_prompt_manager = SystemPromptManager()
+    system_prompt_manager = get_system_prompt_manager()
     system_prompt = system_prompt_manager.get_prompt(prompt_name)
 
+    # 4. 获取LangChain格式的历史记录, 按 token 预算为系统提示词、检索资料和问题留出空间
+    converted_history = _load_history(session, message_manager, session_id, platform_type,
+                                      question, system_prompt + context_str)
+    logger.info(f'查询到的消息记录: {len(converted_history)} 条')
 
     # 获取llm
     llm = QuicklyChatModelProvider(platform_type)
@@ -135,20 +272,22 @@ def llm_chat(question: str = None,
     try:
 
         agent = create_agent(model=llm.chat_model, tools=[], system_prompt=system_prompt)
-        # 4.创建包含历史的提示模板
-        full_system_content = f"{system_prompt}\n\n以下是检索到的参考资料，请基于这些资料回答问题：\n\n{context_str}"
-        input_messages = [SystemMessage(content=full_system_content)] + converted_history + [HumanMessage(content=question)]
+        # 5.创建包含历史的提示模板
+        input_messages = _build_input_messages(system_prompt_manager, prompt_name, context_str,
+                                               converted_history, question)
         result = agent.invoke({"messages": input_messages})
         response = result["messages"][-1]
+        usage = _usage_summary(getattr(response, "usage_metadata", None))
         # 8. 对话结束后，手动保存对话记录
         if response:
-            message_manager.add_human_message(question)
-            message_manager.add_ai_message(response.content)
-            session.save_session(session_id)
+            _save_turn(session, message_manager, session_id, question, response.content)
+            if cache_namespace is not None and response.content:
+                get_answer_cache().store(question, response.content, cache_namespace)
         #
         return {
             "content": response,
             "session_id": session_id,
+            "usage": usage,
         }
 
     except Exception as e:
@@ -1,14 +1,14 @@
-from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
+from typing import Iterable
 
-from quickly_rag.chat.message.chat_message_manager import Message
+from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
 
 
-def convert_history_to_langchain_format(history_list: list[Message]) -> list[BaseMessage]:
+def convert_history_to_langchain_format(history_list: Iterable) -> list[BaseMessage]:
     """
     将自定义格式的对话历史转换为LangChain消息格式
 
     Args:
-        history_list: 自定义格式的对话历史列表
+        history_list: 自定义格式的对话历史列表 (MessageRecord / Message 对象或 dict)
 
     Returns:
         list: LangChain格式的消息列表
@@ -16,8 +16,12 @@ def convert_history_to_langchain_format(history_list: list[Message]) -> list[Bas
     langchain_messages = []
 
     for message in history_list:
-        role = message.get('role')
-        content = message.get('content')
+        if isinstance(message, dict):
+            role = message.get('role')
+            content = message.get('content')
+        else:
+            role = message.role.value
+            content = message.content
 
         if role == 'human':
             langchain_messages.append(HumanMessage(content=content))
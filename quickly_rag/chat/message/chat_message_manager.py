@@ -3,11 +3,18 @@
 用于管理系统消息、用户消息和AI消息
 """
 
+import threading
+from collections import deque
 from enum import Enum
-from typing import List, Optional, Union
+from typing import Deque, List, Optional, Union
 from datetime import datetime
+
+from langchain_core.messages import BaseMessage
 from pydantic import BaseModel
 
+from quickly_rag.chat.message.chat_message import convert_history_to_langchain_format
+from quickly_rag.chat.message.token_counter import count_tokens
+
 
 # --- 基础定义保持不变 ---
 class MessageType(Enum):
@@ -27,15 +34,95 @@ class Message(BaseModel):
             self.timestamp = datetime.now()
 
 
+class MessageRecord:
+    """
+    轻量的对话消息记录, 用于会话中的历史消息
+    从存储恢复时直接保存原始字段, role 和 timestamp 在第一次访问时才校验和解析
+    token 数在第一次使用时计算, 并随消息一起持久化
+    """
+    __slots__ = ("_role", "content", "_timestamp", "_token_count")
+
+    def __init__(self, role: MessageType | str, content: str, timestamp: datetime | str | None = None,
+                 token_count: Optional[int] = None):
+        self._role = role
+        self.content = content
+        self._timestamp = timestamp if timestamp is not None else datetime.now()
+        self._token_count = token_count
+
+    @property
+    def role(self) -> MessageType:
+        role = self._role
+        if not isinstance(role, MessageType):
+            # 兼容旧数据中 'MessageType.HUMAN' 格式的 role
+            if isinstance(role, str) and "MessageType." in role:
+                role = MessageType[role.split(".")[-1]]
+            else:
+                role = MessageType(role)
+            self._role = role
+        return role
+
+    @property
+    def timestamp(self) -> datetime:
+        timestamp = self._timestamp
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+            self._timestamp = timestamp
+        return timestamp
+
+    @property
+    def token_count(self) -> int:
+        if self._token_count is None:
+            self._token_count = count_tokens(self.content)
+        return self._token_count
+
+    def get(self, key: str, default=None):
+        """兼容按字典方式读取字段的旧代码"""
+        if key == "role":
+            return self.role.value
+        if key in ("content", "timestamp"):
+            return getattr(self, key)
+        return default
+
+    def to_dict(self) -> dict:
+        """转换为可 JSON 序列化的字典, 未访问过的原始字段原样输出"""
+        timestamp = self._timestamp
+        return {
+            "role": self.role.value,
+            "content": self.content,
+            "timestamp": timestamp if isinstance(timestamp, str) else timestamp.isoformat(),
+            "token_count": self.token_count,
+        }
+
+    def to_message(self) -> Message:
+        """转换为经过完整校验的 Message 对象"""
+        return Message(role=self.role, content=self.content, timestamp=self.timestamp)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'MessageRecord':
+        return cls(data.get("role"), data.get("content", ""), data.get("timestamp"), data.get("token_count"))
+
+    def __repr__(self) -> str:
+        return f"MessageRecord(role={self.role.value!r}, content={self.content!r})"
+
+
 class ChatMessageManager:
     """聊天消息管理器"""
 
     def __init__(self, max_messages: int = 50):
-        self.messages: List[Message] = []
+        # 定长环形缓冲区, 超出 max_messages 时自动丢弃最早的消息
+        self.messages: Deque[MessageRecord] = deque(maxlen=max_messages)
         self.max_messages = max_messages
         self.system_message: Optional[Message] = None
         # 新增：记录最后访问时间，用于TTL判断
         self.last_accessed: datetime = datetime.now()
+        # 尚未持久化的新消息, 追加写入模式下每次保存只写这部分
+        self._unsaved: List[MessageRecord] = []
+        # 已进入写队列、尚未确认写入成功的消息, 写入失败时放回 _unsaved
+        self._saving: List[MessageRecord] = []
+        # 写入完成的回调在存储的写线程中执行, 与请求线程一起修改上面两个列表
+        self._save_lock = threading.Lock()
+        # LangChain 格式历史的缓存, 消息变化时失效
+        self._langchain_cache: Optional[List[BaseMessage]] = None
 
     def _touch(self):
         """更新最后访问时间"""
@@ -49,6 +136,7 @@ class ChatMessageManager:
             content: 系统消息内容
         """
         self.system_message = Message(role=MessageType.SYSTEM, content=content)
+        self._langchain_cache = None
         self._touch()
 
     def add_human_message(self, content: str) -> None:
@@ -58,7 +146,7 @@ class ChatMessageManager:
         Args:
             content: 用户消息内容
         """
-        self._add_message(Message(role=MessageType.HUMAN, content=content))
+        self._add_message(MessageRecord(MessageType.HUMAN, content))
 
     def add_ai_message(self, content: str) -> None:
         """
@@ -67,15 +155,16 @@ class ChatMessageManager:
         Args:
             content: AI消息内容
         """
-        self._add_message(Message(role=MessageType.AI, content=content))
+        self._add_message(MessageRecord(MessageType.AI, content))
 
-    def _add_message(self, message: Message) -> None:
+    def _add_message(self, message: MessageRecord) -> None:
         self.messages.append(message)
-        if len(self.messages) > self.max_messages:
-            self.messages.pop(0)
+        with self._save_lock:
+            self._unsaved.append(message)
+        self._langchain_cache = None
         self._touch()  # 每次添加消息都视为一次活跃访问
 
-    def list_messages(self) -> List[Message]:
+    def list_messages(self) -> List[Message | MessageRecord]:
         """
         获取所有消息列表（包括系统消息）
         
@@ -88,6 +177,36 @@ class ChatMessageManager:
         result.extend(self.messages)
         return result
 
+    def to_langchain_messages(self, token_budget: Optional[int] = None) -> List[BaseMessage]:
+        """
+        获取 LangChain 格式的对话历史 (不包括系统消息)
+        转换结果会被缓存, 只有消息变化后才重新转换
+
+        Args:
+            token_budget: 历史消息最多占用的 token 数, 为空时返回全部历史;
+                          否则从最新的消息开始选择, 直到放不下为止
+
+        Returns:
+            LangChain 消息列表的副本
+        """
+        if self._langchain_cache is None:
+            self._langchain_cache = convert_history_to_langchain_format(self.messages)
+        if token_budget is None:
+            return list(self._langchain_cache)
+
+        # 从最新的消息往前累加, 每条消息的 token 数只计算一次
+        used = 0
+        start = len(self.messages)
+        for record in reversed(self.messages):
+            used += record.token_count
+            if used > token_budget:
+                break
+            start -= 1
+        # 不以孤立的 AI 回复开头
+        while start < len(self.messages) and self.messages[start].role != MessageType.HUMAN:
+            start += 1
+        return self._langchain_cache[start:]
+
     def get_messages_for_llm(self) -> List[dict]:
         """
         获取适用于LLM调用的消息格式
@@ -123,12 +242,22 @@ class ChatMessageManager:
     def clear_messages(self) -> None:
         """清空所有非系统消息"""
         self.messages.clear()
+        self._clear_unsaved()
+        self._langchain_cache = None
 
     def clear_all(self) -> None:
         """清空所有消息（包括系统消息）"""
         self.messages.clear()
+        self._clear_unsaved()
+        self._langchain_cache = None
         self.system_message = None
 
+    def _clear_unsaved(self) -> None:
+        """清空后未保存和正在写入的消息都已作废, 写入失败时也不会再放回 _unsaved"""
+        with self._save_lock:
+            self._unsaved.clear()
+            self._saving.clear()
+
     def get_message_count(self) -> int:
         """
         获取消息总数（不包括系统消息）
@@ -150,13 +279,69 @@ class ChatMessageManager:
             count += 1
         return count
 
-    def to_dict(self) -> dict:
-        return {
+    def get_unsaved_messages(self) -> List[MessageRecord]:
+        """
+        获取上次保存之后新增的消息
+
+        Returns:
+            尚未持久化的消息列表 (按添加顺序)
+        """
+        with self._save_lock:
+            return list(self._unsaved)
+
+    def mark_saved(self, count: int) -> None:
+        """
+        标记前 count 条未保存消息已经持久化
+
+        Args:
+            count: 已成功写入的消息数量
+        """
+        with self._save_lock:
+            del self._unsaved[:count]
+
+    def take_unsaved_messages(self) -> List[MessageRecord]:
+        """
+        取出全部未保存消息并标记为正在写入 (异步写入时使用)
+        写入完成后调用 confirm_saved, 写入失败时调用 restore_unsaved
+
+        Returns:
+            取出的消息列表 (按添加顺序)
+        """
+        with self._save_lock:
+            records = list(self._unsaved)
+            del self._unsaved[:len(records)]
+            self._saving.extend(records)
+            return records
+
+    def confirm_saved(self, records: List[MessageRecord]) -> None:
+        """确认 take_unsaved_messages 取出的消息已经写入"""
+        saved = {id(record) for record in records}
+        with self._save_lock:
+            self._saving[:] = [record for record in self._saving if id(record) not in saved]
+
+    def restore_unsaved(self, records: List[MessageRecord]) -> None:
+        """
+        写入失败, 把 take_unsaved_messages 取出的消息放回未保存列表的开头, 下次保存时重新写入
+        期间调用过 clear_messages 的消息已经不在 _saving 中, 不再放回
+        """
+        with self._save_lock:
+            failed = {id(record) for record in records}
+            self._unsaved[:0] = [record for record in self._saving if id(record) in failed]
+            self._saving[:] = [record for record in self._saving if id(record) not in failed]
+
+    def has_pending_writes(self) -> bool:
+        """是否还有未保存或正在写入的消息"""
+        return bool(self._unsaved or self._saving)
+
+    def to_dict(self, include_messages: bool = True) -> dict:
+        data = {
             "max_messages": self.max_messages,
             "last_accessed": self.last_accessed.isoformat(),
             "system_message": self.system_message.model_dump(mode='json') if self.system_message is not None else None,
-            "messages": [i.model_dump(mode='json') if isinstance(i, Message) else i for i in self.messages]
         }
+        if include_messages:
+            data["messages"] = [i.to_dict() for i in self.messages]
+        return data
 
     @classmethod
     def from_dict(cls, data: dict) -> 'ChatMessageManager':
@@ -173,16 +358,9 @@ class ChatMessageManager:
             cls._clean_role_data(sys_msg_data)  # 调用清洗辅助函数
             manager.system_message = Message(**sys_msg_data)
 
-        # 3. 恢复聊天记录
+        # 3. 恢复聊天记录 (字段在首次访问时才校验, role 的清洗也在 MessageRecord.role 中完成)
         if data.get("messages"):
-            manager.messages = data.get("messages")
-        #     clean_messages = []
-        #     for m in data["messages"]:
-        #         # 调用清洗逻辑，将 'MessageType.HUMAN' 转换为 'human'
-        #         cls._clean_role_data(m)
-        #         clean_messages.append(Message(**m))
-        #
-        #     manager.messages = clean_messages
+            manager.messages.extend(MessageRecord.from_dict(m) for m in data["messages"])
         return manager
 
     @staticmethod
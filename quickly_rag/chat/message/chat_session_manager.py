@@ -1,59 +1,94 @@
-import sqlite3
-import json
+import asyncio
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import  Optional, Dict
+from functools import lru_cache
+from typing import Optional, Dict
 
 from loguru import logger
 
-from quickly_rag.chat.message.chat_message_manager import ChatMessageManager
-from quickly_rag.config.chat_config import default_session_db_path
+from quickly_rag.chat.message.chat_message_manager import ChatMessageManager, MessageType, MessageRecord
+from quickly_rag.config.chat_config import default_session_db_path, default_session_max_messages, \
+    default_session_ttl_seconds, default_session_cache_size, default_session_storage_mode, \
+    default_session_write_behind, default_session_flush_interval_ms, default_session_backend_type, \
+    default_session_redis_url, default_session_near_cache_seconds, default_session_memory_enabled, \
+    default_session_memory_max_turns, default_session_sweep_interval_seconds, default_session_sweep_batch_size
+from quickly_rag.config.platform_config import default_embedding_use_platform
+from quickly_rag.chat.message.session_backend import SessionBackend, SqliteSessionBackend, create_session_backend
+from quickly_rag.chat.message.session_memory import SessionMemoryIndex
+from quickly_rag.enums.session_enum import SessionStorageMode
 
 
 class ChatSessionManager:
     """
-    支持 内存管理 + SQLite持久化 + TTL自动过期的会话管理器
+    支持 内存管理(LRU + TTL) + 可插拔持久化(SessionBackend) 的会话管理器
+    进程内应当只使用一个实例, 通过 get_session_manager() 获取
+    使用共享存储(多个 worker)时, 进程内缓存作为近端缓存, 超过 near_cache_seconds 后重新从存储读取
     """
 
-    def __init__(self, db_path: str = default_session_db_path, default_max_messages: int = 50, ttl_seconds: int = 3600):
+    # 会话锁的分段数量, 同一个 session_id 总是映射到同一把锁
+    _LOCK_STRIPES = 64
+
+    def __init__(self, db_path: str = default_session_db_path, default_max_messages: int = 50, ttl_seconds: int = 3600,
+                 max_cached_sessions: int = default_session_cache_size,
+                 storage_mode: SessionStorageMode = default_session_storage_mode,
+                 write_behind: bool = default_session_write_behind,
+                 flush_interval_ms: int = default_session_flush_interval_ms,
+                 backend: Optional[SessionBackend] = None,
+                 near_cache_seconds: float = default_session_near_cache_seconds,
+                 memory: Optional[SessionMemoryIndex] = None):
         """
         Args:
             db_path: SQLite文件路径 (例如 'chat_history.db'). 如果为None，则纯内存运行.
             default_max_messages: 默认消息保留条数.
             ttl_seconds: 会话过期时间(秒)，默认1小时.
+            max_cached_sessions: 内存中最多缓存的会话数量, 超出后淘汰最久未使用的会话.
+            storage_mode: 持久化格式, NORMALIZED 每轮只追加新消息, BLOB 每轮整体重写会话JSON.
+            write_behind: 是否由后台写线程批量提交保存操作.
+            flush_interval_ms: 后台写线程合并提交的时间窗口(毫秒).
+            backend: 自定义会话存储, 传入后忽略 db_path 等 SQLite 参数.
+            near_cache_seconds: 共享存储下进程内缓存的有效期(秒), 0 表示始终信任进程内缓存.
+            memory: 会话长期记忆索引, 传入后每轮对话保存成功时会在后台向量化, 索引中缺少的轮次从会话存储中重建.
         """
         self.default_max_messages = default_max_messages
         self.ttl = timedelta(seconds=ttl_seconds)
         self.db_path = db_path
+        self.max_cached_sessions = max_cached_sessions
+        self.storage_mode = storage_mode
+        self.near_cache_seconds = near_cache_seconds
+        self.memory = memory
+        if memory is not None and memory.turn_loader is None:
+            memory.turn_loader = self._saved_turns
+
+        # 内存缓存 (按访问顺序排列, 末尾为最近使用)
+        self._sessions: OrderedDict[str, ChatMessageManager] = OrderedDict()
+        # 会话进入缓存(或最近一次保存)的时间, 共享存储下用于判断近端缓存是否需要重新读取
+        self._cached_at: Dict[str, float] = {}
+        # 保护 _sessions 和统计数据的全局锁, 只在操作字典时短暂持有
+        self._cache_lock = threading.Lock()
+        # 分段的会话锁, FastAPI 的同步路由运行在线程池中, 同一会话的读写需要串行
+        self._session_locks = [threading.RLock() for _ in range(self._LOCK_STRIPES)]
 
-        # 内存缓存
-        self._sessions: Dict[str, ChatMessageManager] = {}
+        # 缓存命中统计
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._stale = 0
 
         # 如果提供了db_path，初始化数据库
-        if self.db_path:
-            self._init_db()
-
-    def _init_db(self):
-        """初始化SQLite表结构"""
-        with sqlite3.connect(self.db_path) as conn:
-            # 创建一个简单的 key-value 风格的表存储 JSON 数据
-            conn.execute("""
-                         CREATE TABLE IF NOT EXISTS sessions
-                         (
-                             session_id
-                             TEXT
-                             PRIMARY
-                             KEY,
-                             data
-                             TEXT
-                             NOT
-                             NULL,
-                             updated_at
-                             TIMESTAMP
-                             DEFAULT
-                             CURRENT_TIMESTAMP
-                         )
-                         """)
-            conn.commit()
+        self._backend: Optional[SessionBackend] = backend
+        if self._backend is None and self.db_path:
+            self._backend = SqliteSessionBackend(self.db_path, storage_mode=storage_mode,
+                                                 write_behind=write_behind, flush_interval_ms=flush_interval_ms)
+
+    def session_lock(self, session_id: str) -> threading.RLock:
+        """
+        获取会话对应的锁, 修改会话消息并保存时需要持有该锁
+        用法: with manager.session_lock(session_id): ...
+        """
+        return self._session_locks[hash(session_id) % self._LOCK_STRIPES]
 
     def _is_expired(self, manager: ChatMessageManager) -> bool:
         """检查某个管理器是否过期"""
@@ -61,6 +96,51 @@ class ChatSessionManager:
             return True
         return False
 
+    def _get_cached(self, session_id: str) -> Optional[ChatMessageManager]:
+        """从内存缓存中获取会话, 命中时移动到LRU末尾, 过期时直接移除"""
+        with self._cache_lock:
+            manager = self._sessions.get(session_id)
+            if manager is None:
+                self._misses += 1
+                return None
+            if self._is_expired(manager):
+                logger.info(f"[SessionManager] 会话 {session_id} 已过期 (内存)，正在清理...")
+                del self._sessions[session_id]
+                self._cached_at.pop(session_id, None)
+                self._expirations += 1
+                self._misses += 1
+                return None
+            if self._is_stale(session_id, manager):
+                # 其他 worker 可能已经写入了新消息, 丢弃近端缓存重新读取
+                del self._sessions[session_id]
+                self._cached_at.pop(session_id, None)
+                self._stale += 1
+                self._misses += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            self._hits += 1
+            return manager
+
+    def _is_stale(self, session_id: str, manager: ChatMessageManager) -> bool:
+        """共享存储下近端缓存是否已经超过有效期 (有未保存或正在写入的消息的会话不能丢弃)"""
+        if not self.near_cache_seconds or self._backend is None or not self._backend.shared:
+            return False
+        if manager.has_pending_writes():
+            return False
+        return time.monotonic() - self._cached_at.get(session_id, 0.0) > self.near_cache_seconds
+
+    def _put_cached(self, session_id: str, manager: ChatMessageManager) -> None:
+        """放入内存缓存, 超出容量时淘汰最久未使用的会话"""
+        with self._cache_lock:
+            self._sessions[session_id] = manager
+            self._sessions.move_to_end(session_id)
+            self._cached_at[session_id] = time.monotonic()
+            while len(self._sessions) > self.max_cached_sessions:
+                evicted_id, _ = self._sessions.popitem(last=False)
+                self._cached_at.pop(evicted_id, None)
+                self._evictions += 1
+                logger.debug(f"[SessionManager] 缓存已满, 淘汰会话: {evicted_id}")
+
     def get_session(self, session_id: str) -> ChatMessageManager:
         """
         获取会话逻辑：
@@ -70,93 +150,224 @@ class ChatSessionManager:
         4. DB无 -> 新建
         """
         # 1. 尝试从内存获取
-        if session_id in self._sessions:
-            manager = self._sessions[session_id]
-            if self._is_expired(manager):
-                logger.info(f"[SessionManager] 会话 {session_id} 已过期 (内存)，正在清理...")
-                del self._sessions[session_id]
-                # 注意：如果过期了，也要从DB删掉吗？通常是的，或者新建一个覆盖
-            else:
-                return manager
-
-        # 2. 尝试从 DB 加载 (如果启用了DB)
-        if self.db_path:
-            manager = self._load_from_db(session_id)
-            if manager:
-                # 加载后检查是否过期 (防止加载了半年前的陈旧会话)
-                if self._is_expired(manager):
-                    logger.info(f"[SessionManager] 会话 {session_id} 已过期 (磁盘)，忽略并新建...")
-                else:
-                    logger.info(f"[SessionManager] 从磁盘加载了会话: {session_id}")
-                    self._sessions[session_id] = manager
+        manager = self._get_cached(session_id)
+        if manager is not None:
+            return manager
+        return self._load_or_create(session_id)
+
+    def _load_or_create(self, session_id: str) -> ChatMessageManager:
+        """内存缓存未命中时从存储加载会话, 存储中没有(或已过期)时新建"""
+        # 持有会话锁再加载, 避免同一会话的并发请求重复读取磁盘
+        with self.session_lock(session_id):
+            # 等锁期间可能已被其他线程加载
+            with self._cache_lock:
+                manager = self._sessions.get(session_id)
+                if manager is not None and not self._is_expired(manager) \
+                        and not self._is_stale(session_id, manager):
+                    self._sessions.move_to_end(session_id)
                     return manager
 
-        # 3. 新建会话
-        logger.info(f"[SessionManager] 创建新会话: {session_id}")
-        new_manager = ChatMessageManager(max_messages=self.default_max_messages)
-        self._sessions[session_id] = new_manager
-        return new_manager
+            # 2. 尝试从 DB 加载 (如果启用了DB)
+            if self._backend:
+                manager = self._load_from_db(session_id)
+                if manager:
+                    # 加载后检查是否过期 (防止加载了半年前的陈旧会话)
+                    if self._is_expired(manager):
+                        logger.info(f"[SessionManager] 会话 {session_id} 已过期 (磁盘)，忽略并新建...")
+                        # 追加写入模式下需要清掉旧消息, 否则新会话会接着旧的序号继续写
+                        self._delete_from_db(session_id)
+                    else:
+                        logger.info(f"[SessionManager] 从磁盘加载了会话: {session_id}")
+                        self._put_cached(session_id, manager)
+                        return manager
+
+            # 3. 新建会话
+            logger.info(f"[SessionManager] 创建新会话: {session_id}")
+            new_manager = ChatMessageManager(max_messages=self.default_max_messages)
+            self._put_cached(session_id, new_manager)
+            return new_manager
+
+    async def aget_session(self, session_id: str) -> ChatMessageManager:
+        """get_session 的异步版本, 缓存未命中时在线程池中读取存储, 不阻塞事件循环"""
+        manager = self._get_cached(session_id)
+        if manager is not None:
+            return manager
+        return await asyncio.to_thread(self._load_or_create, session_id)
 
-    def save_session(self, session_id: str) -> bool:
+    def save_session(self, session_id: str, manager: Optional[ChatMessageManager] = None) -> bool:
         """
         【手动持久化】将指定会话保存到 SQLite
+        开启 write_behind 时数据先进入写队列, 几毫秒内由后台线程批量提交
+        Args:
+            session_id: 会话id
+            manager: 要保存的会话, 为空时从内存缓存中获取 (会话可能在对话期间被LRU淘汰, 建议显式传入)
         """
-        if not self.db_path:
-            logger.info("[SessionManager] 未配置 db_path，无法保存")
+        if not self._backend:
+            logger.info("[SessionManager] 未配置会话存储，无法保存")
             return False
 
-        if session_id not in self._sessions:
-            return False
+        if manager is None:
+            with self._cache_lock:
+                manager = self._sessions.get(session_id)
+            if manager is None:
+                return False
 
-        manager = self._sessions[session_id]
-        data_json = json.dumps(manager.to_dict(), default=str, ensure_ascii=False)
+        with self.session_lock(session_id):
+            try:
+                unsaved = manager.get_unsaved_messages()
+                self._backend.save(session_id, manager)
+                if self.memory is not None:
+                    self.memory.remember_async(session_id, self._pair_turns(unsaved))
+                with self._cache_lock:
+                    if session_id in self._sessions:
+                        self._cached_at[session_id] = time.monotonic()
+                logger.info(f"[SessionManager] 会话 {session_id} 已保存到磁盘")
+                return True
+            except Exception as e:
+                logger.info(f"[SessionManager] 保存失败: {e}")
+                return False
 
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute(
-                    "INSERT OR REPLACE INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)",
-                    (session_id, data_json, datetime.now())
-                )
-            logger.info(f"[SessionManager] 会话 {session_id} 已保存到磁盘")
-            return True
-        except Exception as e:
-            logger.info(f"[SessionManager] 保存失败: {e}")
-            return False
+    @staticmethod
+    def _pair_turns(records: list) -> list[tuple[str, str]]:
+        """把相邻的 用户消息 + AI回复 组成一轮对话"""
+        turns = []
+        for prev, cur in zip(records, records[1:]):
+            if prev.role == MessageType.HUMAN and cur.role == MessageType.AI:
+                turns.append((prev.content, cur.content))
+        return turns
+
+    def _saved_turns(self, session_id: str) -> list[tuple[str, str]]:
+        """会话已保存的全部对话轮次, 用于重建长期记忆; 没有会话存储时使用内存中的会话"""
+        limit = self.memory.max_turns_per_session * 2 if self.memory is not None else self.default_max_messages
+        if self._backend is None:
+            with self._cache_lock:
+                manager = self._sessions.get(session_id)
+            return self._pair_turns(list(manager.messages)) if manager is not None else []
+        return self._pair_turns([MessageRecord.from_dict(m) for m in self._backend.load_messages(session_id, limit)])
+
+    async def asave_session(self, session_id: str, manager: Optional[ChatMessageManager] = None) -> bool:
+        """save_session 的异步版本, 在线程池中写入存储"""
+        return await asyncio.to_thread(self.save_session, session_id, manager)
 
     def _load_from_db(self, session_id: str) -> Optional[ChatMessageManager]:
         """内部方法：从DB读取并反序列化"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,))
-                row = cursor.fetchone()
-                if row:
-                    data = json.loads(row[0])
-                    return ChatMessageManager.from_dict(data)
+            data = self._backend.load(session_id, self.default_max_messages)
+            if data:
+                return ChatMessageManager.from_dict(data)
         except Exception as e:
             logger.info(f"[SessionManager] 读取失败: {e}")
         return None
 
-    def cleanup_expired(self):
+    def _delete_from_db(self, session_id: str) -> None:
+        """内部方法：删除会话及其全部消息"""
+        if self.memory is not None:
+            self.memory.forget(session_id)
+        try:
+            self._backend.delete(session_id)
+        except Exception as e:
+            logger.info(f"[SessionManager] 删除失败: {e}")
+
+    def cleanup_expired(self, batch_size: int = default_session_sweep_batch_size) -> tuple[int, int]:
         """
-        手动清理所有过期的会话（内存 + 数据库）
-        建议定时任务调用
+        清理所有过期的会话（内存 + 数据库）, 由后台清理任务定时调用
+        内存缓存先在锁外对快照判断过期, 再分批加锁删除; 数据库按 updated_at 索引分批删除
+        Returns:
+            (移除的内存会话数量, 移除的磁盘会话数量)
         """
+        started = time.perf_counter()
         now = datetime.now()
 
         # 1. 清理内存
-        expired_ids = [
-            sid for sid, mgr in self._sessions.items()
-            if self._is_expired(mgr)
-        ]
-        for sid in expired_ids:
-            del self._sessions[sid]
+        with self._cache_lock:
+            snapshot = list(self._sessions.items())
+        candidates = [sid for sid, mgr in snapshot if self._is_expired(mgr)]
+        expired_ids = []
+        for i in range(0, len(candidates), batch_size):
+            with self._cache_lock:
+                for sid in candidates[i:i + batch_size]:
+                    # 快照之后会话可能被重新访问或替换, 加锁后再确认一次
+                    mgr = self._sessions.get(sid)
+                    if mgr is not None and self._is_expired(mgr):
+                        del self._sessions[sid]
+                        self._cached_at.pop(sid, None)
+                        self._expirations += 1
+                        expired_ids.append(sid)
+        if self.memory is not None:
+            for sid in expired_ids:
+                self.memory.forget(sid)
 
         # 2. 清理数据库 (如果有)
-        if self.db_path:
+        removed = 0
+        if self._backend:
             # 计算过期的时间戳
             cutoff = now - self.ttl
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+            removed = self._backend.delete_expired(cutoff, batch_size=batch_size)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"[SessionManager] 清理完成。移除内存会话: {len(expired_ids)}, 移除磁盘会话: {removed}, "
+                    f"耗时: {elapsed_ms:.1f}ms")
+        return len(expired_ids), removed
+
+    async def run_sweeper(self, interval_seconds: float = default_session_sweep_interval_seconds,
+                          batch_size: int = default_session_sweep_batch_size) -> None:
+        """
+        后台过期清理任务, 在 FastAPI lifespan 中通过 asyncio.create_task 启动, 退出时取消
+        清理在线程池中执行, 不阻塞事件循环
+        """
+        logger.info(f"[SessionManager] 后台过期清理已启动, 间隔 {interval_seconds}s")
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await asyncio.to_thread(self.cleanup_expired, batch_size)
+            except Exception as e:
+                logger.error(f"[SessionManager] 后台过期清理失败: {e}")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待写队列中的会话全部落盘"""
+        if not self._backend:
+            return True
+        return self._backend.flush(timeout)
+
+    def close(self) -> None:
+        """关闭会话存储 (会先写完写队列中的数据), 应用退出时调用"""
+        if self.memory is not None:
+            self.memory.close()
+        if self._backend:
+            self._backend.close()
+
+    def stats(self) -> Dict[str, int | float | str | None]:
+        """获取内存缓存的命中统计"""
+        with self._cache_lock:
+            total = self._hits + self._misses
+            return {
+                "backend": type(self._backend).__name__ if self._backend else None,
+                "size": len(self._sessions),
+                "capacity": self.max_cached_sessions,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "stale": self._stale,
+                "hit_rate": self._hits / total if total else 0.0,
+            }
+
 
-        logger.info(f"[SessionManager] 清理完成。移除内存会话: {len(expired_ids)}")
+@lru_cache(maxsize=1)
+def get_session_manager() -> ChatSessionManager:
+    """获取进程内共享的会话管理器 (单例)"""
+    backend = create_session_backend(default_session_backend_type,
+                                     db_path=default_session_db_path,
+                                     storage_mode=default_session_storage_mode,
+                                     write_behind=default_session_write_behind,
+                                     flush_interval_ms=default_session_flush_interval_ms,
+                                     redis_url=default_session_redis_url,
+                                     ttl_seconds=default_session_ttl_seconds)
+    memory = None
+    if default_session_memory_enabled:
+        memory = SessionMemoryIndex(default_embedding_use_platform,
+                                    max_turns_per_session=default_session_memory_max_turns)
+    return ChatSessionManager(default_max_messages=default_session_max_messages,
+                              ttl_seconds=default_session_ttl_seconds,
+                              backend=backend,
+                              memory=memory)
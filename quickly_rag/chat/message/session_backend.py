@@ -0,0 +1,690 @@
+"""
+会话持久化层
+SessionBackend 定义统一的会话存储接口, 提供三种实现:
+1. MemorySessionBackend  进程内存储, 不落盘
+2. SqliteSessionBackend  SQLite 以 WAL 模式运行, 读操作使用线程独占的连接, 写操作由单独的写线程批量提交
+3. RedisSessionBackend   Redis 协议存储, 多个 worker 进程共享同一份会话数据
+"""
+import atexit
+import json
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from loguru import logger
+
+from quickly_rag.chat.message.chat_message_manager import ChatMessageManager
+from quickly_rag.enums.session_enum import SessionStorageMode, SessionBackendType
+
+
+class SessionBackend(ABC):
+    """
+    会话存储接口
+    load 返回 ChatMessageManager.to_dict() 格式的字典, save 只需要写入上次保存之后的新消息
+    """
+
+    # 存储是否被多个进程共享, 共享存储需要定期重新校验进程内的会话缓存
+    shared: bool = False
+
+    @abstractmethod
+    def load(self, session_id: str, window: int) -> Optional[dict]:
+        """
+        读取会话数据
+        Args:
+            session_id: 会话id
+            window: 最多读取的最近消息条数
+        Returns:
+            ChatMessageManager.to_dict() 格式的字典, 不存在时返回 None
+        """
+
+    @abstractmethod
+    def save(self, session_id: str, manager: ChatMessageManager) -> None:
+        """保存会话, 调用方需要持有该会话的锁"""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """删除会话及其全部消息"""
+
+    @abstractmethod
+    def delete_expired(self, cutoff: datetime, batch_size: int = 500) -> int:
+        """删除 cutoff 之前更新的会话, 返回删除的会话数量 (支持分批的存储每批最多删除 batch_size 个)"""
+
+    def load_messages(self, session_id: str, limit: int) -> List[dict]:
+        """
+        读取会话最近 limit 条已保存的消息 (MessageRecord.to_dict() 格式, 按时间顺序)
+        默认实现通过 load 读取, 能保存更多历史的存储可以覆盖
+        """
+        data = self.load(session_id, limit)
+        return data.get("messages", []) if data else []
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待已提交的写操作全部落盘"""
+        return True
+
+    def close(self) -> None:
+        """释放存储占用的资源"""
+
+
+class MemorySessionBackend(SessionBackend):
+    """进程内会话存储, 进程退出后数据丢失, 适合测试和单进程的临时会话"""
+
+    def __init__(self):
+        # session_id -> (元数据, 消息列表, 更新时间)
+        self._store: Dict[str, tuple[dict, Deque[dict], datetime]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str, window: int) -> Optional[dict]:
+        with self._lock:
+            entry = self._store.get(session_id)
+            if entry is None:
+                return None
+            meta, messages, _ = entry
+            data = dict(meta)
+            data["messages"] = list(messages)[-data.get("max_messages", window):]
+            return data
+
+    def save(self, session_id: str, manager: ChatMessageManager) -> None:
+        unsaved = manager.get_unsaved_messages()
+        meta = manager.to_dict(include_messages=False)
+        rows = [m.to_dict() for m in unsaved]
+        with self._lock:
+            entry = self._store.get(session_id)
+            messages = entry[1] if entry else deque(maxlen=manager.max_messages)
+            messages.extend(rows)
+            self._store[session_id] = (meta, messages, datetime.now())
+        manager.mark_saved(len(unsaved))
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._store.pop(session_id, None)
+
+    def delete_expired(self, cutoff: datetime, batch_size: int = 500) -> int:
+        with self._lock:
+            expired = [sid for sid, (_, _, updated_at) in self._store.items() if updated_at < cutoff]
+            for sid in expired:
+                del self._store[sid]
+        return len(expired)
+
+
+class _WriteOp:
+    """写队列中的一个写操作, on_done 在事务提交 (参数为 None) 或写入失败 (参数为异常) 后调用"""
+    __slots__ = ("fn", "session_id", "on_done")
+
+    def __init__(self, fn: Callable[[sqlite3.Connection], Any], session_id: Optional[str],
+                 on_done: Optional[Callable[[Optional[Exception]], None]] = None):
+        self.fn = fn
+        self.session_id = session_id
+        self.on_done = on_done
+
+    def done(self, error: Optional[Exception] = None) -> None:
+        if self.on_done is None:
+            return
+        try:
+            self.on_done(error)
+        except Exception as e:
+            logger.error(f"[SessionBackend] 会话 {self.session_id} 写入回调出错: {e}")
+
+
+# 写线程退出标记
+_STOP = object()
+
+# 尚未关闭的 SQLite 会话存储, 进程退出前统一写完队列中的数据
+_open_backends: "weakref.WeakSet[SqliteSessionBackend]" = weakref.WeakSet()
+
+
+@atexit.register
+def _close_open_backends() -> None:
+    for backend in list(_open_backends):
+        backend.close()
+
+
+class SqliteSessionBackend(SessionBackend):
+    """
+    基于 SQLite 的会话存储, 同一台机器上的多个 worker 可以共享同一个数据库文件
+    1. WAL + synchronous=NORMAL, 读写互不阻塞
+    2. 每个线程复用自己的读连接, 不再每次调用都重新打开数据库
+    3. write_behind=True 时保存操作进入写队列, 写线程每隔 flush_interval_ms 合并提交一次事务
+    """
+
+    # 数据库结构版本, 记录在 PRAGMA user_version 中
+    # 1: 新增 messages 表, sessions.data 只保存元数据
+    # 2: messages 表新增 token_count 列
+    _SCHEMA_VERSION = 2
+
+    shared = True
+
+    # 每个连接打开后执行的 pragma
+    _PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA busy_timeout=5000",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-16000",
+    )
+
+    def __init__(self, db_path: str | Path, storage_mode: SessionStorageMode = SessionStorageMode.NORMALIZED,
+                 write_behind: bool = True, flush_interval_ms: int = 5):
+        """
+        Args:
+            db_path: SQLite文件路径
+            storage_mode: 持久化格式, NORMALIZED 每轮只追加新消息, BLOB 每轮整体重写会话JSON
+            write_behind: 是否异步批量写入, 关闭后每次保存都同步提交
+            flush_interval_ms: 写线程合并提交的时间窗口(毫秒)
+        """
+        self.db_path = str(db_path)
+        self.storage_mode = storage_mode
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval_ms / 1000
+
+        # 读连接池: 每个线程一个连接, 同时记录全部连接用于关闭
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        # 写连接只有一个, 同步写入时由锁保护, 异步写入时只有写线程使用
+        self._write_conn = self._connect()
+        self._write_lock = threading.Lock()
+
+        # 每个会话尚未落盘的写操作数量, 读取这些会话前需要先 flush
+        self._pending: Dict[str, int] = {}
+        self._pending_lock = threading.Lock()
+
+        self._closed = False
+        self._init_db()
+
+        self._queue: queue.Queue = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        if self.write_behind:
+            self._writer = threading.Thread(target=self._writer_loop, name="quickly-rag-session-writer", daemon=True)
+            self._writer.start()
+        # 进程退出前把队列中的数据写完
+        _open_backends.add(self)
+
+    # ------------------------------------------------------------------ 连接管理
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        for pragma in self._PRAGMAS:
+            conn.execute(pragma)
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _read_conn(self) -> sqlite3.Connection:
+        """获取当前线程的读连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        """初始化SQLite表结构"""
+        conn = self._write_conn
+        with conn:
+            # 创建一个简单的 key-value 风格的表存储 JSON 数据
+            conn.execute("""
+                         CREATE TABLE IF NOT EXISTS sessions
+                         (
+                             session_id
+                             TEXT
+                             PRIMARY
+                             KEY,
+                             data
+                             TEXT
+                             NOT
+                             NULL,
+                             updated_at
+                             TIMESTAMP
+                             DEFAULT
+                             CURRENT_TIMESTAMP
+                         )
+                         """)
+            # 过期清理按 updated_at 范围查找, 避免全表扫描
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at)")
+            if self.storage_mode == SessionStorageMode.NORMALIZED:
+                # 消息表: 以 (session_id, seq) 为聚簇主键, 按会话读取最近N条时只扫描索引尾部
+                conn.execute("""
+                             CREATE TABLE IF NOT EXISTS messages
+                             (
+                                 session_id TEXT    NOT NULL,
+                                 seq        INTEGER NOT NULL,
+                                 role       TEXT    NOT NULL,
+                                 content    TEXT    NOT NULL,
+                                 timestamp  TEXT,
+                                 token_count INTEGER,
+                                 PRIMARY KEY (session_id, seq)
+                             ) WITHOUT ROWID
+                             """)
+                self._migrate_schema(conn)
+
+    def _migrate_schema(self, conn: sqlite3.Connection) -> None:
+        """按 PRAGMA user_version 依次升级数据库结构 (每个版本只执行一次)"""
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= self._SCHEMA_VERSION:
+            return
+
+        # 版本 1 之前创建的 messages 表没有 token_count 列
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(messages)")]
+        if "token_count" not in columns:
+            conn.execute("ALTER TABLE messages ADD COLUMN token_count INTEGER")
+        if version >= 1:
+            conn.execute(f"PRAGMA user_version = {self._SCHEMA_VERSION}")
+            return
+
+        # 将旧版 sessions.data 中整体保存的消息拆分写入 messages 表
+
+        migrated = 0
+        for session_id, data_json in conn.execute("SELECT session_id, data FROM sessions").fetchall():
+            try:
+                data = json.loads(data_json)
+            except json.JSONDecodeError:
+                logger.warning(f"[SessionBackend] 会话 {session_id} 数据损坏, 跳过迁移")
+                continue
+            messages = data.pop("messages", None) or []
+            rows = []
+            for seq, message in enumerate(messages):
+                ChatMessageManager._clean_role_data(message)
+                rows.append((session_id, seq, message.get("role"), message.get("content"), message.get("timestamp")))
+            conn.executemany(
+                "INSERT OR IGNORE INTO messages (session_id, seq, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.execute("UPDATE sessions SET data = ? WHERE session_id = ?",
+                         (json.dumps(data, default=str, ensure_ascii=False), session_id))
+            migrated += 1
+
+        conn.execute(f"PRAGMA user_version = {self._SCHEMA_VERSION}")
+        if migrated:
+            logger.info(f"[SessionBackend] 已将 {migrated} 个旧格式会话迁移到 messages 表")
+
+    # ------------------------------------------------------------------ 写队列
+
+    def _submit(self, fn: Callable[[sqlite3.Connection], Any], session_id: Optional[str] = None,
+                wait: bool = False, on_done: Optional[Callable[[Optional[Exception]], None]] = None) -> Any:
+        """
+        提交一个写操作
+        Args:
+            fn: 在写连接上执行的函数, 会和同一批次的其他写操作在同一个事务中提交
+            session_id: 写操作所属的会话, 用于读取前判断是否需要先 flush
+            wait: 是否等待写入完成并返回 fn 的结果, 写入失败时抛出异常
+            on_done: 写入提交或失败后调用, 参数为失败时的异常
+        """
+        if self._closed:
+            raise RuntimeError("会话存储已关闭")
+        if not self.write_behind:
+            op = _WriteOp(fn, session_id, on_done)
+            try:
+                with self._write_lock:
+                    with self._write_conn:
+                        value = fn(self._write_conn)
+            except Exception as e:
+                op.done(e)
+                raise
+            op.done()
+            return value
+
+        result: Dict[str, Any] = {}
+        if wait:
+            def _wrapped(conn, _fn=fn):
+                result["value"] = _fn(conn)
+
+            def _wait_done(error, _on_done=on_done):
+                if error is not None:
+                    result["error"] = error
+                if _on_done is not None:
+                    _on_done(error)
+            op = _WriteOp(_wrapped, session_id, _wait_done)
+        else:
+            op = _WriteOp(fn, session_id, on_done)
+
+        if session_id is not None:
+            with self._pending_lock:
+                self._pending[session_id] = self._pending.get(session_id, 0) + 1
+        self._queue.put(op)
+
+        if wait:
+            self.flush()
+            if "error" in result:
+                raise result["error"]
+            return result.get("value")
+        return None
+
+    def _writer_loop(self) -> None:
+        """写线程: 取出一个写操作后再等待 flush_interval, 把窗口内的写操作合并成一个事务提交"""
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            if isinstance(item, _WriteOp):
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        nxt = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    batch.append(nxt)
+                    # 遇到 flush 或退出请求时立即提交
+                    if not isinstance(nxt, _WriteOp):
+                        break
+
+            self._commit_batch([op for op in batch if isinstance(op, _WriteOp)])
+
+            for op in batch:
+                if isinstance(op, threading.Event):
+                    op.set()
+            if any(op is _STOP for op in batch):
+                return
+
+    def _commit_batch(self, ops: List[_WriteOp]) -> None:
+        if not ops:
+            return
+        # 每个写操作的结果, 事务提交之后再通知, 调用方只在数据真正落盘后才认为保存成功
+        outcomes: List[tuple[_WriteOp, Optional[Exception]]] = []
+        with self._write_lock:
+            try:
+                with self._write_conn:
+                    for op in ops:
+                        op.fn(self._write_conn)
+                outcomes = [(op, None) for op in ops]
+            except Exception as e:
+                # 整批失败时逐条重试, 避免一条坏数据拖垮整批
+                logger.warning(f"[SessionBackend] 批量写入失败, 改为逐条写入: {e}")
+                for op in ops:
+                    try:
+                        with self._write_conn:
+                            op.fn(self._write_conn)
+                        outcomes.append((op, None))
+                    except Exception as inner:
+                        logger.error(f"[SessionBackend] 会话 {op.session_id} 写入失败: {inner}")
+                        outcomes.append((op, inner))
+        for op, error in outcomes:
+            op.done(error)
+
+        with self._pending_lock:
+            for op in ops:
+                if op.session_id is None:
+                    continue
+                left = self._pending.get(op.session_id, 0) - 1
+                if left > 0:
+                    self._pending[op.session_id] = left
+                else:
+                    self._pending.pop(op.session_id, None)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待写队列中已提交的写操作全部落盘
+        Args:
+            timeout: 最长等待时间(秒), None 表示一直等待
+        Returns:
+            是否在超时前完成
+        """
+        if self._writer is None or not self._writer.is_alive():
+            return True
+        barrier = threading.Event()
+        self._queue.put(barrier)
+        return barrier.wait(timeout)
+
+    def close(self) -> None:
+        """写完队列中的数据并关闭全部连接, 可重复调用"""
+        if self._closed:
+            return
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+        self._closed = True
+        _open_backends.discard(self)
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+        logger.info("[SessionBackend] 会话存储已关闭")
+
+    # ------------------------------------------------------------------ 读写接口
+
+    def load(self, session_id: str, window: int) -> Optional[dict]:
+        """
+        读取会话数据
+        Args:
+            session_id: 会话id
+            window: 最多读取的最近消息条数 (仅 NORMALIZED 模式)
+        Returns:
+            ChatMessageManager.to_dict() 格式的字典, 不存在时返回 None
+        """
+        with self._pending_lock:
+            has_pending = session_id in self._pending
+        if has_pending:
+            # 读己之写: 该会话还有未落盘的数据
+            self.flush()
+
+        cursor = self._read_conn().cursor()
+        cursor.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        data = json.loads(row[0])
+        if self.storage_mode == SessionStorageMode.NORMALIZED:
+            # 只读取最近 window 条消息, 更早的消息保留在磁盘上
+            window = data.get("max_messages", window)
+            cursor.execute("""
+                           SELECT role, content, timestamp, token_count
+                           FROM (SELECT seq, role, content, timestamp, token_count
+                                 FROM messages
+                                 WHERE session_id = ?
+                                 ORDER BY seq DESC
+                                 LIMIT ?)
+                           ORDER BY seq
+                           """, (session_id, window))
+            data["messages"] = [{"role": role, "content": content, "timestamp": timestamp, "token_count": token_count}
+                                for role, content, timestamp, token_count in cursor.fetchall()]
+        return data
+
+    def load_messages(self, session_id: str, limit: int) -> List[dict]:
+        """NORMALIZED 模式下 messages 表保存了全部历史, 不受 max_messages 限制"""
+        if self.storage_mode != SessionStorageMode.NORMALIZED:
+            return super().load_messages(session_id, limit)
+        with self._pending_lock:
+            has_pending = session_id in self._pending
+        if has_pending:
+            self.flush()
+        rows = self._read_conn().execute("""
+                                         SELECT role, content, timestamp, token_count
+                                         FROM (SELECT seq, role, content, timestamp, token_count
+                                               FROM messages
+                                               WHERE session_id = ?
+                                               ORDER BY seq DESC
+                                               LIMIT ?)
+                                         ORDER BY seq
+                                         """, (session_id, limit)).fetchall()
+        return [{"role": role, "content": content, "timestamp": timestamp, "token_count": token_count}
+                for role, content, timestamp, token_count in rows]
+
+    def save(self, session_id: str, manager: ChatMessageManager) -> None:
+        """
+        保存会话, 调用方需要持有该会话的锁
+        消息快照在调用时生成, write_behind 模式下返回时数据可能还在写队列中
+        消息在事务提交后才标记为已保存, 写入失败时放回未保存列表, 下次保存时重新写入
+        """
+        now = datetime.now()
+        unsaved = manager.take_unsaved_messages()
+
+        def _done(error: Optional[Exception]) -> None:
+            if error is None:
+                manager.confirm_saved(unsaved)
+            else:
+                manager.restore_unsaved(unsaved)
+
+        if self.storage_mode == SessionStorageMode.NORMALIZED:
+            meta_json = json.dumps(manager.to_dict(include_messages=False), default=str, ensure_ascii=False)
+            rows = [(d["role"], d["content"], d["timestamp"], d["token_count"]) for d in (m.to_dict() for m in unsaved)]
+
+            def _append(conn: sqlite3.Connection) -> None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)",
+                    (session_id, meta_json, now)
+                )
+                if rows:
+                    # 主键索引上取最大序号, 代价与会话长度无关
+                    last_seq = conn.execute("SELECT MAX(seq) FROM messages WHERE session_id = ?",
+                                            (session_id,)).fetchone()[0]
+                    start = -1 if last_seq is None else last_seq
+                    conn.executemany(
+                        "INSERT INTO messages (session_id, seq, role, content, timestamp, token_count) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        [(session_id, start + i + 1, *row) for i, row in enumerate(rows)]
+                    )
+
+            self._submit(_append, session_id, on_done=_done)
+        else:
+            data_json = json.dumps(manager.to_dict(), default=str, ensure_ascii=False)
+
+            def _replace(conn: sqlite3.Connection) -> None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)",
+                    (session_id, data_json, now)
+                )
+
+            self._submit(_replace, session_id, on_done=_done)
+
+    def delete(self, session_id: str) -> None:
+        """删除会话及其全部消息"""
+        normalized = self.storage_mode == SessionStorageMode.NORMALIZED
+
+        def _delete(conn: sqlite3.Connection) -> None:
+            if normalized:
+                conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+        self._submit(_delete, session_id)
+
+    def delete_expired(self, cutoff: datetime, batch_size: int = 500) -> int:
+        """
+        删除 cutoff 之前更新的会话, 返回删除的会话数量
+        通过 updated_at 索引每次只取 batch_size 个会话删除, 每批单独提交,
+        批次之间写线程可以处理正常的对话写入, 数据库很大时也不会长时间占用写锁
+        """
+        normalized = self.storage_mode == SessionStorageMode.NORMALIZED
+
+        def _delete_batch(conn: sqlite3.Connection) -> int:
+            session_ids = [(row[0],) for row in conn.execute(
+                "SELECT session_id FROM sessions WHERE updated_at < ? ORDER BY updated_at LIMIT ?",
+                (cutoff, batch_size))]
+            if not session_ids:
+                return 0
+            if normalized:
+                conn.executemany("DELETE FROM messages WHERE session_id = ?", session_ids)
+            conn.executemany("DELETE FROM sessions WHERE session_id = ?", session_ids)
+            return len(session_ids)
+
+        removed = 0
+        while True:
+            deleted = self._submit(_delete_batch, wait=True) or 0
+            removed += deleted
+            if deleted < batch_size:
+                return removed
+
+
+class RedisSessionBackend(SessionBackend):
+    """
+    基于 Redis 协议的会话存储, 多个 worker 进程共享同一份会话和同一个过期时间
+    每个会话两个键: {prefix}:{session_id}:meta 保存元数据, {prefix}:{session_id}:messages 为消息列表
+    过期由 Redis 的 EXPIRE 负责, 每次保存都会刷新过期时间
+    """
+
+    shared = True
+
+    def __init__(self, url: str = "redis://127.0.0.1:6379/0", ttl_seconds: int = 3600,
+                 key_prefix: str = "quickly_rag:session", client: Any = None):
+        """
+        Args:
+            url: Redis 连接地址, 传入 client 时忽略
+            ttl_seconds: 会话过期时间(秒)
+            key_prefix: 键名前缀
+            client: 已创建的 Redis 客户端 (例如 fakeredis.FakeRedis), 需要支持 get/set/rpush/lrange/ltrim/expire/pipeline
+        """
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise ImportError("使用 Redis 会话存储需要安装 redis: pip install redis") from e
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self._client = client
+        self.ttl_seconds = ttl_seconds
+        self.key_prefix = key_prefix
+
+    def _meta_key(self, session_id: str) -> str:
+        return f"{self.key_prefix}:{session_id}:meta"
+
+    def _messages_key(self, session_id: str) -> str:
+        return f"{self.key_prefix}:{session_id}:messages"
+
+    @staticmethod
+    def _decode(value: Any) -> Any:
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def load(self, session_id: str, window: int) -> Optional[dict]:
+        pipe = self._client.pipeline(transaction=False)
+        pipe.get(self._meta_key(session_id))
+        pipe.lrange(self._messages_key(session_id), -window, -1)
+        meta_json, messages = pipe.execute()
+        if meta_json is None:
+            return None
+        data = json.loads(self._decode(meta_json))
+        data["messages"] = [json.loads(self._decode(m)) for m in messages]
+        return data
+
+    def save(self, session_id: str, manager: ChatMessageManager) -> None:
+        unsaved = manager.get_unsaved_messages()
+        meta_json = json.dumps(manager.to_dict(include_messages=False), default=str, ensure_ascii=False)
+        messages_key = self._messages_key(session_id)
+
+        # 事务内追加消息并刷新两个键的过期时间, 所有 worker 看到的是同一个 TTL
+        pipe = self._client.pipeline(transaction=True)
+        pipe.set(self._meta_key(session_id), meta_json, ex=self.ttl_seconds)
+        if unsaved:
+            pipe.rpush(messages_key, *[json.dumps(m.to_dict(), ensure_ascii=False) for m in unsaved])
+            pipe.ltrim(messages_key, -manager.max_messages, -1)
+        pipe.expire(messages_key, self.ttl_seconds)
+        pipe.execute()
+        manager.mark_saved(len(unsaved))
+
+    def delete(self, session_id: str) -> None:
+        self._client.delete(self._meta_key(session_id), self._messages_key(session_id))
+
+    def delete_expired(self, cutoff: datetime, batch_size: int = 500) -> int:
+        # 过期由 Redis 自己处理
+        return 0
+
+    def close(self) -> None:
+        close = getattr(self._client, "close", None)
+        if close is not None:
+            close()
+
+
+def create_session_backend(backend_type: SessionBackendType, db_path: str | Path = None,
+                           storage_mode: SessionStorageMode = SessionStorageMode.NORMALIZED,
+                           write_behind: bool = True, flush_interval_ms: int = 5,
+                           redis_url: str = None, ttl_seconds: int = 3600) -> SessionBackend:
+    """根据类型创建会话存储"""
+    if backend_type == SessionBackendType.MEMORY:
+        return MemorySessionBackend()
+    elif backend_type == SessionBackendType.SQLITE:
+        return SqliteSessionBackend(db_path, storage_mode=storage_mode,
+                                    write_behind=write_behind, flush_interval_ms=flush_interval_ms)
+    elif backend_type == SessionBackendType.REDIS:
+        return RedisSessionBackend(redis_url, ttl_seconds=ttl_seconds)
+    else:
+        raise ValueError(f"Unsupported session backend type: {backend_type}")
@@ -0,0 +1,193 @@
+"""
+会话长期记忆
+每轮对话保存后在后台线程中向量化, 提问时只取出与问题最相关的 K 轮旧对话放进提示词,
+配合最近几条消息, 长会话的提示词长度保持稳定
+索引只保存在进程内, 重启、淘汰或会话由其他 worker 处理后, 按 turn_loader 从会话存储中读取已保存的对话重建
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from quickly_rag.enums.platform_enum import PlatformEmbeddingType
+from quickly_rag.provider.embedding_model_provider import QuicklyEmbeddingModelProvider
+
+# 一轮对话: (用户消息, AI回复), 同时作为去重的键
+Turn = Tuple[str, str]
+
+
+class _SessionTurns:
+    """单个会话已向量化的对话轮次, 按时间顺序排列"""
+    __slots__ = ("turns", "vectors", "keys")
+
+    def __init__(self):
+        self.turns: List[Turn] = []
+        self.vectors: List[np.ndarray] = []
+        self.keys: set[Turn] = set()
+
+    def replace(self, turns: List[Turn], vectors: List[np.ndarray]) -> None:
+        self.turns = turns
+        self.vectors = vectors
+        self.keys = set(turns)
+
+
+class SessionMemoryIndex:
+    """
+    进程内的会话记忆索引
+    remember_async 在后台线程中向量化一轮对话, recall 按余弦相似度取回最相关的旧对话
+    """
+
+    def __init__(self, embedding_type: PlatformEmbeddingType, max_turns_per_session: int = 500,
+                 max_sessions: int = 1024, max_workers: int = 2,
+                 turn_loader: Optional[Callable[[str], List[Turn]]] = None):
+        """
+        Args:
+            embedding_type: 向量化使用的平台
+            max_turns_per_session: 每个会话最多保留的轮次, 超出后丢弃最早的轮次
+            max_sessions: 最多保留记忆的会话数量, 超出后丢弃最久未使用的会话
+            max_workers: 后台向量化线程数
+            turn_loader: 读取会话已保存的全部对话轮次 (按时间顺序), 索引中缺少轮次时用它重建
+        """
+        self.embedding_type = embedding_type
+        self.max_turns_per_session = max_turns_per_session
+        self.max_sessions = max_sessions
+        self.turn_loader = turn_loader
+        self._sessions: OrderedDict[str, _SessionTurns] = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="quickly-rag-memory")
+
+    def _embedding_model(self) -> QuicklyEmbeddingModelProvider:
+        return QuicklyEmbeddingModelProvider(self.embedding_type)
+
+    def _embed_turns(self, turns: List[Turn]) -> np.ndarray:
+        return self._normalize(self._embedding_model().embed_documents([f"{human}\n{ai}" for human, ai in turns]))
+
+    @staticmethod
+    def _normalize(vectors: list[list[float]]) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _get_turns(self, session_id: str, create: bool = False) -> Optional[_SessionTurns]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None and create:
+                entry = _SessionTurns()
+                self._sessions[session_id] = entry
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            if entry is not None:
+                self._sessions.move_to_end(session_id)
+            return entry
+
+    def remember_async(self, session_id: str, turns: List[Turn]) -> None:
+        """
+        在后台线程中向量化并记住若干轮对话
+        Args:
+            session_id: 会话id
+            turns: (用户消息, AI回复) 列表
+        """
+        if turns:
+            self._executor.submit(self._remember, session_id, turns)
+
+    def _remember(self, session_id: str, turns: List[Turn]) -> None:
+        entry = self._get_turns(session_id, create=True)
+        with self._lock:
+            # 重建索引或重试保存时这些轮次可能已经向量化过
+            turns = [turn for turn in dict.fromkeys(turns) if turn not in entry.keys]
+        if not turns:
+            return
+        try:
+            vectors = self._embed_turns(turns)
+        except Exception as e:
+            logger.warning(f"[SessionMemory] 会话 {session_id} 的对话向量化失败: {e}")
+            return
+
+        with self._lock:
+            for turn, vector in zip(turns, vectors):
+                if turn in entry.keys:
+                    continue
+                entry.turns.append(turn)
+                entry.vectors.append(vector)
+                entry.keys.add(turn)
+            overflow = len(entry.turns) - self.max_turns_per_session
+            if overflow > 0:
+                entry.replace(entry.turns[overflow:], entry.vectors[overflow:])
+
+    def _sync(self, session_id: str) -> Optional[_SessionTurns]:
+        """按会话存储中已保存的对话重建索引, 已经向量化的轮次复用原来的向量, 只向量化缺少的轮次"""
+        try:
+            persisted = list(dict.fromkeys(self.turn_loader(session_id)))[-self.max_turns_per_session:]
+        except Exception as e:
+            logger.warning(f"[SessionMemory] 读取会话 {session_id} 的历史对话失败: {e}")
+            return self._get_turns(session_id)
+        entry = self._get_turns(session_id, create=True)
+        with self._lock:
+            known = dict(zip(entry.turns, entry.vectors))
+        missing = [turn for turn in persisted if turn not in known]
+        if missing:
+            try:
+                known.update(zip(missing, self._embed_turns(missing)))
+            except Exception as e:
+                logger.warning(f"[SessionMemory] 会话 {session_id} 的历史对话向量化失败: {e}")
+                return entry
+            logger.info(f"[SessionMemory] 会话 {session_id} 从会话存储补充了 {len(missing)} 轮记忆")
+
+        with self._lock:
+            # 重建期间后台可能记住了尚未读到的新轮次, 排在已保存的轮次之后
+            persisted_keys = set(persisted)
+            extra = [(turn, vector) for turn, vector in zip(entry.turns, entry.vectors) if turn not in persisted_keys]
+            turns = persisted + [turn for turn, _ in extra]
+            vectors = [known[turn] for turn in persisted] + [vector for _, vector in extra]
+            entry.replace(turns[-self.max_turns_per_session:], vectors[-self.max_turns_per_session:])
+        return entry
+
+    def recall(self, session_id: str, query: str, top_k: int, exclude_turns: Iterable[Turn] = ()) -> List[Turn]:
+        """
+        取回与问题最相关的旧对话
+        Args:
+            session_id: 会话id
+            query: 当前问题
+            top_k: 最多返回的轮次
+            exclude_turns: 不需要取回的轮次 (已经作为近期历史放进提示词的对话)
+        Returns:
+            按时间顺序排列的 (用户消息, AI回复) 列表
+        """
+        if top_k <= 0:
+            return []
+        exclude = set(exclude_turns)
+        entry = self._get_turns(session_id)
+        # 没有索引 (重启或被淘汰), 或者近期历史中有索引里没有的轮次 (由其他 worker 保存) 时重建
+        if self.turn_loader is not None and (entry is None or not exclude <= entry.keys):
+            entry = self._sync(session_id)
+        if entry is None:
+            return []
+        with self._lock:
+            candidates = [(turn, vector) for turn, vector in zip(entry.turns, entry.vectors) if turn not in exclude]
+        if not candidates:
+            return []
+
+        try:
+            query_vector = self._normalize([self._embedding_model().embed_query(query)])[0]
+        except Exception as e:
+            logger.warning(f"[SessionMemory] 问题向量化失败, 不使用长期记忆: {e}")
+            return []
+
+        scores = np.stack([vector for _, vector in candidates]) @ query_vector
+        k = min(top_k, len(candidates))
+        best = np.argpartition(-scores, k - 1)[:k]
+        # 按轮次先后排列, 保持对话的时间顺序
+        return [candidates[i][0] for i in sorted(best.tolist())]
+
+    def forget(self, session_id: str) -> None:
+        """删除会话的全部记忆"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def close(self) -> None:
+        """等待后台向量化任务结束"""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,46 @@
+"""
+对话消息的 token 计数
+优先使用 tiktoken (langchain-openai 的依赖) 的 cl100k_base 编码, 不可用时按字符估算
+不同平台的分词器并不相同, 这里的结果只用于历史窗口的预算控制, 不要求精确
+"""
+from functools import lru_cache
+from typing import Any, Optional
+
+from loguru import logger
+
+
+@lru_cache(maxsize=1)
+def _get_encoding() -> Optional[Any]:
+    """【内部】加载 tiktoken 编码 (单例), 加载失败时返回 None"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # 没有安装 tiktoken 或者无法下载编码文件
+        logger.warning(f"tiktoken 不可用, token 数改为按字符估算: {e}")
+        return None
+
+
+def _estimate_tokens(text: str) -> int:
+    """按字符估算 token 数: 中日韩字符约 1 token/字, 其他字符约 4 字符/token"""
+    cjk = 0
+    for ch in text:
+        if '\u3000' <= ch <= '\u9fff' or '\uac00' <= ch <= '\ud7af' or '\uff00' <= ch <= '\uffef':
+            cjk += 1
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_tokens(text: str) -> int:
+    """
+    计算文本的 token 数
+    Args:
+        text: 文本内容
+    Returns:
+        token 数量
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return _estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -1,9 +1,18 @@
+from functools import lru_cache
 from typing import Dict, Optional, Any, ClassVar
 from pathlib import Path
+import threading
 import time
 
 from loguru import logger
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
+
+from quickly_rag.config.chat_config import default_system_prompt_reload_seconds
+
+# 系统提示词和检索资料之间固定的衔接语
+REFERENCE_HEADER = "\n\n以下是检索到的参考资料，请基于这些资料回答问题：\n\n"
+# 参考资料放在用户消息中时, 资料和问题之间的衔接语
+QUESTION_HEADER = "\n\n问题：\n"
 
 
 class SystemPromptInfo(BaseModel):
@@ -15,12 +24,16 @@ class SystemPromptInfo(BaseModel):
     content: str = Field(default="", description="系统提示词内容")
     last_modified: float = Field(default=0.0, description="最后修改时间戳")
     loaded_at: float = Field(default=0.0, description="加载时间戳")
+    checked_at: float = Field(default=0.0, description="最后一次检查文件是否修改的时间 (monotonic)")
+    rendered_prefix: str = Field(default="", description="预先拼接好参考资料衔接语的提示词")
 
 
 class SystemPromptManager(BaseModel):
     """
     系统提示词管理器
     负责管理多个系统提示词，支持文件I/O读取和内存缓存
+    进程内共享一个实例 (通过 get_system_prompt_manager() 获取), 文件修改检查按 reload_interval_seconds 节流,
+    两次检查之间的请求直接使用内存中的内容, 不做任何文件 I/O
     """
 
     # 默认的系统提示词路径
@@ -30,6 +43,12 @@ class SystemPromptManager(BaseModel):
         default_factory=dict, 
         description="存储系统提示词信息的字典"
     )
+    reload_interval_seconds: float = Field(
+        default=default_system_prompt_reload_seconds,
+        description="检查提示词文件是否修改的最小间隔(秒), 0 表示每次获取都检查"
+    )
+
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
     
     def __init__(self, **data):
         super().__init__(**data)
@@ -49,18 +68,56 @@ class SystemPromptManager(BaseModel):
         Returns:
             系统提示词内容
         """
+        return self._get_prompt_info(name, file_path).content
+
+    def get_system_content(self, name: str, context_str: str, file_path: Optional[str] = None) -> str:
+        """
+        获取带检索资料的完整系统提示词
+        提示词和衔接语已经预先拼接好, 这里只做一次字符串拼接
+
+        Args:
+            name: 提示词名称
+            context_str: 检索到的参考资料
+            file_path: 提示词文件路径，如果为None则使用已存储的路径
+
+        Returns:
+            系统提示词 + 参考资料衔接语 + 参考资料
+        """
+        return self._get_prompt_info(name, file_path).rendered_prefix + context_str
+
+    @staticmethod
+    def get_question_content(context_str: str, question: str) -> str:
+        """
+        PREFIX_CACHE 布局下最后一条用户消息的内容: 参考资料 + 问题
+        系统提示词中不再包含每次都不同的检索资料, 请求前缀可以被平台缓存复用
+        """
+        return f"{REFERENCE_HEADER.lstrip()}{context_str}{QUESTION_HEADER}{question}"
+
+    def _get_prompt_info(self, name: str, file_path: Optional[str] = None) -> SystemPromptInfo:
+        """获取提示词信息, 距离上次检查超过 reload_interval_seconds 时才检查文件是否修改"""
+        prompt_info = self.prompts.get(name)
+        if prompt_info is not None and (file_path is None or str(file_path) == str(prompt_info.file_path)) \
+                and time.monotonic() - prompt_info.checked_at < self.reload_interval_seconds:
+            return prompt_info
+
+        with self._lock:
+            return self._refresh_prompt(name, file_path)
+
+    def _refresh_prompt(self, name: str, file_path: Optional[str] = None) -> SystemPromptInfo:
         # 检查是否已经存在该提示词
         if name in self.prompts:
             prompt_info = self.prompts[name]
             
             # 如果传入了新的文件路径，更新路径
-            if file_path is not None:
+            if file_path is not None and str(file_path) != str(prompt_info.file_path):
                 prompt_info.file_path = file_path
-                
+                self._load_prompt_content(prompt_info)
             # 检查文件是否已更新
-            if self._is_file_updated(prompt_info):
+            elif self._is_file_updated(prompt_info):
                 # 重新加载文件内容
+                logger.info(f'系统提示词 {name} 文件已修改, 重新加载')
                 self._load_prompt_content(prompt_info)
+            prompt_info.checked_at = time.monotonic()
         else:
             # 如果是新的提示词，创建新的SystemPromptInfo
             if file_path is None:
@@ -72,7 +129,7 @@ class SystemPromptManager(BaseModel):
             self.prompts[name] = prompt_info
             self._load_prompt_content(prompt_info)
         
-        return self.prompts[name].content
+        return self.prompts[name]
     
     def _is_file_updated(self, prompt_info: SystemPromptInfo) -> bool:
         """
@@ -112,6 +169,8 @@ class SystemPromptManager(BaseModel):
         # 更新修改时间和加载时间
         prompt_info.last_modified = file_path.stat().st_mtime
         prompt_info.loaded_at = time.time()
+        prompt_info.checked_at = time.monotonic()
+        prompt_info.rendered_prefix = prompt_info.content + REFERENCE_HEADER
     
     def add_prompt(self, name: str, file_path: str) -> None:
         """
@@ -121,12 +180,13 @@ class SystemPromptManager(BaseModel):
             name: 提示词名称
             file_path: 提示词文件路径
         """
-        if name in self.prompts:
-            raise ValueError(f"提示词名称 '{name}' 已存在")
-        
-        prompt_info = SystemPromptInfo(name=name, file_path=file_path)
-        self.prompts[name] = prompt_info
-        self._load_prompt_content(prompt_info)
+        with self._lock:
+            if name in self.prompts:
+                raise ValueError(f"提示词名称 '{name}' 已存在")
+
+            prompt_info = SystemPromptInfo(name=name, file_path=file_path)
+            self._load_prompt_content(prompt_info)
+            self.prompts[name] = prompt_info
     
     def update_prompt_path(self, name: str, new_file_path: str) -> None:
         """
@@ -136,12 +196,13 @@ class SystemPromptManager(BaseModel):
             name: 提示词名称
             new_file_path: 新的文件路径
         """
-        if name not in self.prompts:
-            raise ValueError(f"提示词名称 '{name}' 不存在")
-        
-        self.prompts[name].file_path = new_file_path
-        # 重新加载新路径的文件内容
-        self._load_prompt_content(self.prompts[name])
+        with self._lock:
+            if name not in self.prompts:
+                raise ValueError(f"提示词名称 '{name}' 不存在")
+
+            self.prompts[name].file_path = new_file_path
+            # 重新加载新路径的文件内容
+            self._load_prompt_content(self.prompts[name])
     
     def remove_prompt(self, name: str) -> None:
         """
@@ -150,8 +211,14 @@ class SystemPromptManager(BaseModel):
         Args:
             name: 要移除的提示词名称
         """
-        if name in self.prompts:
-            del self.prompts[name]
+        with self._lock:
+            self.prompts.pop(name, None)
+
+    def reload(self) -> None:
+        """立即重新检查所有提示词文件 (例如收到文件修改通知时调用)"""
+        with self._lock:
+            for name in list(self.prompts):
+                self._refresh_prompt(name)
     
     def list_prompts(self) -> list:
         """
@@ -172,4 +239,10 @@ class SystemPromptManager(BaseModel):
         Returns:
             系统提示词信息，如果不存在则返回None
         """
-        return self.prompts.get(name)
\ No newline at end of file
+        return self.prompts.get(name)
+
+
+@lru_cache(maxsize=1)
+def get_system_prompt_manager() -> SystemPromptManager:
+    """获取进程内共享的系统提示词管理器"""
+    return SystemPromptManager()
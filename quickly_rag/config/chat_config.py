@@ -1,8 +1,75 @@
 # 对话记忆数据默认保存的文件位置 默认为当前项目下
+import os
 from pathlib import Path
 
+import dotenv
+
+from quickly_rag.enums.platform_enum import PlatformChatModelType
+from quickly_rag.enums.session_enum import SessionStorageMode, SessionBackendType, HistoryWindowMode, PromptLayoutMode
+dotenv.load_dotenv()
+
 # 默认sqlite数据存储路径
 default_session_db_path = Path(__file__).parent.parent.parent / 'chat.db'
 
+# 每个会话默认保留的消息条数
+default_session_max_messages = 100
+# 会话过期时间(秒) 默认7天
+default_session_ttl_seconds = 3600 * 24 * 7
+# 进程内会话缓存最多保留的会话数量, 超出后按LRU淘汰最久未使用的会话
+default_session_cache_size = 1024
+# 会话持久化格式, NORMALIZED 为消息表追加写入 (旧的 BLOB 数据会在启动时自动迁移)
+default_session_storage_mode = SessionStorageMode.NORMALIZED
+# 是否开启会话的异步批量写入 (后台写线程合并提交, 应用退出时会自动写完队列)
+default_session_write_behind = True
+# 批量写入的合并时间窗口(毫秒)
+default_session_flush_interval_ms = 5
+
+# 后台过期清理的执行间隔(秒), 0 表示不启动后台清理
+default_session_sweep_interval_seconds = 600
+# 过期清理每批删除的会话数量
+default_session_sweep_batch_size = 500
+
+# 会话存储类型 MEMORY(仅内存) SQLITE(本地文件) REDIS(多个 worker 共享)
+default_session_backend_type = SessionBackendType.SQLITE
+# Redis 会话存储的连接地址
+default_session_redis_url = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+# 共享存储(SQLITE/REDIS)下进程内缓存的有效期(秒), 超过后重新从存储读取, 以便看到其他 worker 写入的消息
+# 0 表示始终信任进程内缓存, 单 worker 部署时使用
+default_session_near_cache_seconds = 0
+
+# 系统提示词文件修改检查的最小间隔(秒), 间隔内的请求不读取文件
+default_system_prompt_reload_seconds = 2.0
+
+# 提示词布局, PREFIX_CACHE 让每次请求的前缀(系统提示词 + 历史)保持不变, 可以命中平台的提示词缓存
+default_prompt_layout_mode = PromptLayoutMode.CONTEXT_IN_SYSTEM
+
+# 历史消息的选择方式, TOKEN_BUDGET 只发送能放进预算的最新消息
+default_history_window_mode = HistoryWindowMode.TOKEN_BUDGET
+# 各平台单次请求的输入 token 预算 (系统提示词 + 检索资料 + 历史 + 问题)
+default_prompt_token_budget = {
+    PlatformChatModelType.SILICONFLOW: 16000,
+    PlatformChatModelType.ALIYUN: 32000,
+    PlatformChatModelType.OLLAMA: 4000,
+}
 
+# 会话长期记忆: 开启后每轮对话保存时在后台向量化, 提问时只放入最相关的 K 轮旧对话 + 最近几条消息
+default_session_memory_enabled = False
+# 每次提问取回的旧对话轮数
+default_session_memory_top_k = 4
+# 开启长期记忆时, 最多放入提示词的最近消息条数
+default_session_memory_recent_messages = 6
+# 每个会话最多保留记忆的轮数
+default_session_memory_max_turns = 500
 
+# 语义答案缓存: 与之前问题的向量相似度超过阈值时直接返回缓存的答案 (跳过检索和模型生成)
+default_answer_cache_enabled = False
+# 命中答案缓存需要的最小余弦相似度
+default_answer_cache_similarity = 0.95
+# 缓存答案的有效期(秒)
+default_answer_cache_ttl_seconds = 3600
+# 每个分区(向量库 + 提示词 + 对话平台)最多缓存的答案数量
+default_answer_cache_size = 1024
+# 已有历史消息的会话不使用答案缓存 (答案可能依赖上下文)
+default_answer_cache_skip_with_history = True
+# 回放缓存答案时每个 SSE 分片的字符数
+default_answer_cache_replay_chunk_size = 32
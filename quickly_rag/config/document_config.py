@@ -12,6 +12,37 @@ default_vector_search_score = 0.3
 # 3. relevance_score 使用重排分数
 default_score_filter_strategy = ScoreField.AUTO
 
+# 是否开启 BM25 + 向量的混合检索 (两路结果用 RRF 融合), 索引在文档入库时建立
+default_hybrid_search = True
+# RRF 融合的平滑常数, 越大排名靠后的文档权重越高
+default_rrf_k = 60
+
+# 检索结果缓存最多保留的查询数量, 0 表示不缓存 (文档入库或删除后缓存自动失效)
+default_search_cache_size = 2048
+# 检索结果缓存的有效期(秒)
+default_search_cache_ttl_seconds = 600
+
+# 自适应重排: 召回 top_k × 倍数 的候选文档交给重排模型挑选, 1 表示不多召回
+default_rerank_oversample = 3
+# 最多发送给重排模型的文档数量
+default_rerank_max_documents = 30
+# 第一名与第二名的相关性 (向量分数换算到 0~1, 越大越相似) 差距不小于该值时认为排名已经确定, 跳过重排
+# 跳过重排会改变排序和 AUTO 过滤策略使用的分数, 默认 None 表示总是重排, 需要时按向量库和语料调优后开启
+default_rerank_skip_gap = None
+
+# MMR 多样性筛选: 相关性的权重 (0~1), 越小越偏向与已选片段不同的内容; None 表示不做筛选
+# 开启后每次检索都要从向量库读取结果片段的向量 (读取不到时重新计算), 结果顺序也会改变, 因此默认关闭
+default_mmr_lambda = None
+# MMR 最多保留的片段数量, None 表示不限制 (只去掉重复片段)
+default_mmr_top_k = None
+# 与已选片段的余弦相似度不小于该值时视为重复片段, 直接丢弃
+default_mmr_duplicate_threshold = 0.95
+
+# 异步检索时, 没有原生异步方法的向量库检索和 BM25 检索所用线程池的大小
+default_async_search_workers = 16
+# 联邦检索同时查询多个集合时所用线程池的大小
+default_federated_search_workers = 8
+
 
 # 文档拆分配置
 rag_document_info = RagDocumentInfo(
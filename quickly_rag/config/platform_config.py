@@ -13,6 +13,25 @@ default_embedding_use_platform = PlatformEmbeddingType.SILICONFLOW
 # 聊天模型默认使用的平台
 default_chat_model_use_platform = PlatformChatModelType.SILICONFLOW
 
+# 问题向量缓存: 进程内最多缓存的向量数量, 相同的问题不再重复请求嵌入模型
+default_query_embedding_cache_size = 4096
+# 问题向量的持久化缓存文件, 为 None 时只使用进程内缓存, 例如 Path(__file__).parent.parent.parent / 'embedding_cache.db'
+default_query_embedding_cache_path = None
+
+# 重排模型请求: 各阶段的超时(秒), 连接池中等待空闲连接的时间也单独限制
+default_rerank_connect_timeout = 3.0
+default_rerank_read_timeout = 10.0
+default_rerank_write_timeout = 5.0
+default_rerank_pool_timeout = 2.0
+# 重排模型请求失败 (连接错误、超时、429、5xx) 后的重试次数, 每次等待 退避基数 × 2^n 加上随机抖动
+default_rerank_max_retries = 2
+default_rerank_retry_backoff_seconds = 0.2
+# 熔断: 连续失败达到次数后熔断, 熔断期间直接跳过重排, 冷却结束后放行一个请求试探服务是否恢复
+default_rerank_circuit_failure_threshold = 5
+default_rerank_circuit_reset_seconds = 30.0
+# 重排分数缓存: 最多缓存的 (问题, 文档片段) 分数数量, 0 表示不缓存
+default_rerank_cache_size = 50000
+
 # 硅基流动平台配置 推荐优先使用硅基流动平台, 因为目前重排模型默认使用了硅基流动的 可以在quickly_rag/provider/reranker_provider.py改动
 MySiliconflowAiInfo = QuicklySiliconflowAiConfig(
     base_url='https://api.siliconflow.cn/v1',
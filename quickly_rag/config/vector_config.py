@@ -2,12 +2,11 @@
 import os
 
 import dotenv
-from langchain_community.docstore import InMemoryDocstore
 
 from quickly_rag.config.platform_config import default_embedding_use_platform
-from quickly_rag.core.Vector_base import QuicklyMilvusConfig, MyFaissConfig, QuicklyChromaConfig
+from quickly_rag.core.Vector_base import QuicklyMilvusConfig, MyFaissConfig, QuicklyChromaConfig, QuicklyNumpyConfig
 from quickly_rag.enums.platform_enum import PlatformEmbeddingType
-from quickly_rag.enums.vector_enum import VectorStorageType, VectorMetricType, VectorIndexType
+from quickly_rag.enums.vector_enum import VectorStorageType, VectorMetricType, VectorIndexType, VectorQuantization
 from quickly_rag.provider.embedding_model_provider import QuicklyEmbeddingModelProvider
 dotenv.load_dotenv()
 
@@ -19,6 +18,8 @@ def get_embedding_model(
 
 # 向量存储 默认使用的向量库
 default_embedding_database_type = VectorStorageType.CHROMA
+# 应用启动时预先创建并检查的向量库, 避免第一次查询承担创建连接的耗时
+default_warmup_vector_stores = [default_embedding_database_type]
 
 # 本地使用Chroma存储向量数据是的配置, 只需要默认关心存储路径即可
 MyChromaInfo = QuicklyChromaConfig(
@@ -27,6 +28,14 @@ MyChromaInfo = QuicklyChromaConfig(
     collection_name = "quickly_rag_chroma_collection",
 )
 
+# 本地 NumPy 暴力检索的配置, 适合十万级以内的语料, 向量量化保存以减少内存
+MyNumpyInfo = QuicklyNumpyConfig(
+    embedding_model=get_embedding_model(default_embedding_use_platform),
+    persist_dir="./quickly_rag_data/numpy",
+    collection_name="quickly_rag_numpy_collection",
+    quantization=VectorQuantization.FLOAT16,  # FLOAT16 或 INT8
+)
+
 # Milvus 的链接配置
 MyMilieusInfo = QuicklyMilvusConfig(
     uri=os.getenv("MILVUS_URL"),
@@ -44,9 +53,19 @@ MyMilieusInfo = QuicklyMilvusConfig(
     search_params={'ef': 128}
 )
 
+# 本地 FAISS 的配置, 索引和文档内容保存在 persist_dir/collection_name 目录下
 MyFaissInfo = MyFaissConfig(
     metric_type=VectorMetricType.COSINE,  # 默认为COSINE 余弦相似度算法
     embedding=get_embedding_model(default_embedding_use_platform),
-    docstore=InMemoryDocstore({}),
-    index=None,
+    docstore=None,  # 文档内容保存在索引旁的 SQLite 文件中
+    index=None,  # 索引在初始化时按 dimension 创建
+    index_type=VectorIndexType.HNSW,  # 支持 FLAT / IVF_FLAT / HNSW
+    dimension=4096,  # 向量维度, 必须与嵌入模型一致 (Qwen/Qwen3-Embedding-8B 为 4096), 为 None 时在第一次写入时确定
+    persist_dir="./quickly_rag_data/faiss",
+    collection_name="quickly_rag_faiss_collection",
+    nlist=1024,  # IVF 聚类中心数量
+    ivf_min_train_size=None,  # IVF 开始训练所需的最少向量数量, 为 None 时为 nlist × 39, 之前使用精确检索
+    nprobe=16,  # IVF 检索时访问的聚类数量
+    hnsw_m=32,  # HNSW 每个节点的邻居数量
+    ef_search=128,  # HNSW 检索时的候选队列长度
 )
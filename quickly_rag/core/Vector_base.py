@@ -6,7 +6,7 @@ from langchain_community.docstore import InMemoryDocstore
 
 from pydantic import BaseModel, Field
 
-from quickly_rag.enums.vector_enum import VectorMetricType
+from quickly_rag.enums.vector_enum import VectorMetricType, VectorQuantization
 from quickly_rag.provider.embedding_model_provider import QuicklyEmbeddingModelProvider
 
 class QuicklyChromaConfig(BaseModel):
@@ -16,6 +16,13 @@ class QuicklyChromaConfig(BaseModel):
     pass
 
 
+class QuicklyNumpyConfig(BaseModel):
+    embedding_model: QuicklyEmbeddingModelProvider = Field(..., description="嵌入模型实例")
+    persist_dir: str | Path = Field(..., description="向量矩阵和文档的保存目录")
+    collection_name: str = Field(..., description="集合名称")
+    quantization: VectorQuantization = Field(default=VectorQuantization.FLOAT16, description="向量保存精度")
+
+
 class QuicklyMilvusConfig(BaseModel):
     uri: str = Field(..., description="Milvus的服务地址")
     port: str | int = Field(..., description="Milvus的服务端口")
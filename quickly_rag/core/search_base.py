@@ -1,8 +1,13 @@
-from pydantic import BaseModel, Field
+from typing import Optional
 
-from quickly_rag.config.document_config import default_top_k, default_vector_search_score, default_score_filter_strategy
+from pydantic import BaseModel, Field, field_validator
+
+from quickly_rag.config.document_config import default_top_k, default_vector_search_score, default_score_filter_strategy, \
+    default_hybrid_search, default_rerank_oversample, default_rerank_max_documents, default_rerank_skip_gap, \
+    default_mmr_lambda, default_mmr_top_k, default_mmr_duplicate_threshold
 from quickly_rag.config.vector_config import default_embedding_database_type
 from quickly_rag.enums.vector_enum import ScoreField, VectorStorageType
+from quickly_rag.vector.store.metadata_filter import parse_filter
 
 
 # 向量搜索的查询参数类, 只有query是必须传入的
@@ -12,8 +17,34 @@ class VectorSearchParams(BaseModel):
     score: float = Field(default=default_vector_search_score, description="文档过滤分数")
     filter_strategy: ScoreField = Field(default=default_score_filter_strategy, description="过滤策略")
     vectorstore_type: VectorStorageType = Field(default=default_embedding_database_type, description="向量存储库类型")
+    hybrid: bool = Field(default=default_hybrid_search, description="是否融合 BM25 关键词检索的结果")
+    rerank_oversample: int = Field(default=default_rerank_oversample, ge=1, description="重排候选文档数量为 top_k 的倍数")
+    rerank_max_documents: int = Field(default=default_rerank_max_documents, ge=1, description="最多发送给重排模型的文档数量")
+    rerank_skip_gap: Optional[float] = Field(default=default_rerank_skip_gap,
+                                             description="前两名相关性 (0~1) 差距达到该值时跳过重排, 为空时总是重排")
+    mmr_lambda: Optional[float] = Field(default=default_mmr_lambda, ge=0, le=1,
+                                        description="MMR 相关性权重, 越小结果越多样, 为空时不做 MMR 筛选")
+    mmr_top_k: Optional[int] = Field(default=default_mmr_top_k, ge=1, description="MMR 最多保留的片段数量, 为空时不限制")
+    mmr_duplicate_threshold: float = Field(default=default_mmr_duplicate_threshold,
+                                           description="与已选片段的相似度达到该值时视为重复片段")
+    filter_expr: Optional[str] = Field(default=None,
+                                       description="元数据过滤表达式, 例如 source in ['a.pdf'] and doc_type == 'pdf'")
+
+    @field_validator("filter_expr")
+    @classmethod
+    def _check_filter_expr(cls, value: Optional[str]) -> Optional[str]:
+        # 创建参数时就检查语法, 不等到检索时才报错
+        if value is not None:
+            parse_filter(value)
+        return value
+
+# 联邦检索的一个目标集合
+class VectorSearchTarget(BaseModel):
+    vectorstore_type: VectorStorageType = Field(..., description="向量存储库类型")
+    collection_name: Optional[str] = Field(default=None, description="集合名称, 为空时使用该向量库配置的默认集合")
+
 
 class VectorSearchResult(BaseModel):
     text: str = Field(description="文档内容")
     relevance_score: float = Field(description="重排模型分数")
-    score: float = Field(description="向量搜索分数")
\ No newline at end of file
+    score: Optional[float] = Field(description="向量搜索分数, 只被 BM25 召回的文档没有向量分数, 为 None")
\ No newline at end of file
@@ -0,0 +1,28 @@
+from enum import Enum
+
+
+class SessionStorageMode(Enum):
+    # 每个会话一条JSON记录, 每轮对话都整体重写 (旧版格式)
+    BLOB = "blob"
+    # 会话元数据与消息分表存储, 每轮对话只追加新消息
+    NORMALIZED = "normalized"
+
+
+class SessionBackendType(Enum):
+    MEMORY = "memory"
+    SQLITE = "sqlite"
+    REDIS = "redis"
+
+
+class HistoryWindowMode(Enum):
+    # 发送会话中保留的全部历史消息 (最多 max_messages 条)
+    FULL = "full"
+    # 按 token 预算从最新的消息开始选择, 为检索资料和问题留出空间
+    TOKEN_BUDGET = "token_budget"
+
+
+class PromptLayoutMode(Enum):
+    # 检索资料拼接在系统提示词后面 (旧版布局)
+    CONTEXT_IN_SYSTEM = "context_in_system"
+    # 系统提示词 + 历史在前保持不变, 检索资料放在最后的问题旁边, 便于平台复用提示词前缀缓存
+    PREFIX_CACHE = "prefix_cache"
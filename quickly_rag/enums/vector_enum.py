@@ -29,6 +29,11 @@ class VectorStorageType(Enum):
     # REDIS = "redis" 暂不支持
     MILVUS = "milvus"
     CHROMA = "chroma"
-    FAISS = 'FAISS'  #暂不支持
+    FAISS = 'FAISS'
+    NUMPY = 'numpy'
 
 
+class VectorQuantization(Enum):
+    """NumPy 向量库的向量保存精度"""
+    FLOAT16 = "float16"             # 内存为 float32 的一半
+    INT8 = "int8"                   # 每行一个缩放系数, 内存约为 float32 的四分之一
@@ -6,11 +6,11 @@ from langchain_core.language_models import BaseChatModel, LanguageModelInput
 from langchain_core.messages import AIMessage
 from langchain_core.runnables import RunnableConfig
 from langchain_ollama import ChatOllama
-from langchain_openai import ChatOpenAI, AzureChatOpenAI
+from langchain_openai import ChatOpenAI
 from loguru import logger
 from pydantic import BaseModel, Field
 
-from quickly_rag.config.platform_config import MySiliconflowAiInfo, MyAzureAiInfo, MyOllamaInfo, MyAliyunAiInfo
+from quickly_rag.config.platform_config import MySiliconflowAiInfo, MyOllamaInfo, MyAliyunAiInfo
 from quickly_rag.enums.platform_enum import PlatformChatModelType
 
 
@@ -50,8 +50,6 @@ class QuicklyChatModelProvider(BaseModel):
         try:
             if platform_type == PlatformChatModelType.SILICONFLOW:
                 return self.__siliconflow_chat()
-            elif platform_type == PlatformChatModelType.AZURE:
-                return self.__azure_chat()
             elif platform_type == PlatformChatModelType.OLLAMA:
                 return self.__ollama_chat()
             elif platform_type == PlatformChatModelType.ALIYUN:
@@ -82,6 +80,8 @@ class QuicklyChatModelProvider(BaseModel):
                 model=MySiliconflowAiInfo.chat_model,
                 base_url=MySiliconflowAiInfo.base_url,
                 api_key=MySiliconflowAiInfo.key,
+                # 流式输出时在最后一个分片返回 token 用量 (包含命中提示词缓存的 token 数)
+                stream_usage=True,
             )
             logger.info("SiliconFlow chat model initialized successfully.")
             return model
@@ -104,6 +104,8 @@ class QuicklyChatModelProvider(BaseModel):
                 model=MyAliyunAiInfo.chat_model,
                 base_url=MyAliyunAiInfo.base_url,
                 api_key=MyAliyunAiInfo.key,
+                # 流式输出时在最后一个分片返回 token 用量 (包含命中提示词缓存的 token 数)
+                stream_usage=True,
             )
             logger.info("aliyun chat model initialized successfully.")
             return model
@@ -111,28 +113,6 @@ class QuicklyChatModelProvider(BaseModel):
             logger.error(f"Error creating aliyun chat model: {e}")
             raise ChatModelInitializationError("aliyun chat model initialization failed.") from e
 
-    @staticmethod
-    @lru_cache(maxsize=1)
-    def __azure_chat() -> AzureChatOpenAI:
-        """【内部】创建并返回 Azure 聊天模型实例 (单例)"""
-        try:
-            # 提前检查一下 key是否存在, 不存在就抛出报错
-            if not MyAzureAiInfo.key:
-                logger.error('Azure API key 没有设置, 请在platform_config文件中设置。')
-                raise RuntimeError('Azure API key 没有设置, 请在platform_config文件中设置。')
-
-            model = AzureChatOpenAI(
-                api_key=MyAzureAiInfo.key,
-                azure_endpoint=MyAzureAiInfo.base_url,
-                api_version=MyAzureAiInfo.api_version,
-                model=MyAzureAiInfo.chat_model,
-            )
-            logger.info("Azure chat model initialized successfully.")
-            return model
-        except Exception as e:
-            logger.error(f"Error creating Azure chat model: {e}")
-            raise ChatModelInitializationError("Azure chat model initialization failed.") from e
-
     @staticmethod
     @lru_cache(maxsize=1)
     def __ollama_chat() -> ChatOllama:
@@ -0,0 +1,82 @@
+"""
+熔断器
+依赖的服务连续失败后进入熔断状态, 熔断期间的请求直接失败, 不再等待超时
+冷却时间结束后放行一个试探请求 (半开状态), 成功则恢复, 失败则重新熔断
+"""
+import threading
+import time
+
+from loguru import logger
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断期间拒绝请求"""
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        """
+        Args:
+            name: 服务名称, 用于日志
+            failure_threshold: 连续失败多少次后熔断
+            reset_seconds: 熔断后多久放行试探请求
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def before_call(self) -> None:
+        """请求前调用, 熔断期间抛出 CircuitOpenError"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._state = self.HALF_OPEN
+                self._probing = False
+            # 半开状态只放行一个试探请求, 试探请求被取消而没有结果时, 冷却时间后再放行一个
+            if self._state == self.HALF_OPEN and (
+                    not self._probing or time.monotonic() - self._probe_started >= self.reset_seconds):
+                self._probing = True
+                self._probe_started = time.monotonic()
+                return
+            self._rejected += 1
+        raise CircuitOpenError(f"{self.name} 服务熔断中, 跳过请求")
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"[CircuitBreaker] {self.name} 服务已恢复")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"[CircuitBreaker] {self.name} 服务连续失败 {self._failures} 次, "
+                                   f"熔断 {self.reset_seconds} 秒")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self) -> dict[str, str | int]:
+        with self._lock:
+            return {"state": self._state, "consecutive_failures": self._failures, "rejected": self._rejected}
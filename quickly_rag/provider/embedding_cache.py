@@ -0,0 +1,243 @@
+"""
+问题向量缓存
+相同的问题 (平台 + 模型 + 规范化后的文本) 只向嵌入模型请求一次向量
+第一层为进程内 LRU, 可选第二层为本地 SQLite 文件, 进程重启后仍然可以命中
+"""
+import asyncio
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from loguru import logger
+
+from quickly_rag.config.platform_config import default_query_embedding_cache_size, default_query_embedding_cache_path
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """规范化问题文本: 全角转半角, 合并连续空白, 去掉首尾空白"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class QueryEmbeddingCache:
+    """
+    问题向量的两级缓存
+    1. 进程内 LRU, 超出 max_entries 后淘汰最久未使用的向量
+    2. 可选的 SQLite 持久化层 (db_path 不为空时启用), 向量以 float64 二进制保存
+    """
+
+    def __init__(self, max_entries: int = 4096, db_path: Optional[str | Path] = None):
+        """
+        Args:
+            max_entries: 进程内最多缓存的向量数量
+            db_path: 持久化缓存的 SQLite 文件路径, 为空时只使用进程内缓存
+        """
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._entries: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if db_path is not None:
+            self._init_db()
+
+    def _init_db(self) -> None:
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("""
+                               CREATE TABLE IF NOT EXISTS query_embeddings
+                               (
+                                   cache_key  TEXT PRIMARY KEY,
+                                   vector     BLOB NOT NULL,
+                                   created_at REAL NOT NULL
+                               ) WITHOUT ROWID
+                               """)
+
+    @staticmethod
+    def make_key(platform: str, model: str, text: str) -> str:
+        return f"{platform}\x1f{model}\x1f{normalize_query(text)}"
+
+    def get_or_compute(self, platform: str, model: str, text: str,
+                       compute: Callable[[str], list[float]]) -> list[float]:
+        """
+        获取问题向量, 两级缓存都未命中时调用 compute 请求嵌入模型并写入缓存
+        Args:
+            platform: 嵌入模型平台
+            model: 嵌入模型名称
+            text: 问题文本
+            compute: 未命中时计算向量的函数
+        Returns:
+            向量 (返回副本, 调用方修改不会影响缓存)
+        """
+        key = self.make_key(platform, model, text)
+        vector = self._get_from_memory(key)
+        if vector is not None:
+            return vector
+
+        vector = self._load_from_db(key)
+        if vector is not None:
+            with self._lock:
+                self._disk_hits += 1
+            self._put(key, vector)
+            return list(vector)
+
+        with self._lock:
+            self._misses += 1
+        vector = list(compute(text))
+        self._put(key, vector)
+        self._save_to_db(key, vector)
+        return list(vector)
+
+    async def aget_or_compute(self, platform: str, model: str, text: str,
+                              acompute: Callable[[str], Awaitable[list[float]]]) -> list[float]:
+        """get_or_compute 的异步版本, 持久化层的读写放到线程中执行, 不阻塞事件循环"""
+        key = self.make_key(platform, model, text)
+        vector = self._get_from_memory(key)
+        if vector is not None:
+            return vector
+
+        vector = await asyncio.to_thread(self._load_from_db, key) if self._conn is not None else None
+        if vector is not None:
+            with self._lock:
+                self._disk_hits += 1
+            self._put(key, vector)
+            return list(vector)
+
+        with self._lock:
+            self._misses += 1
+        vector = list(await acompute(text))
+        self._put(key, vector)
+        if self._conn is not None:
+            await asyncio.to_thread(self._save_to_db, key, vector)
+        return list(vector)
+
+    def get_or_compute_many(self, platform: str, model: str, texts: list[str],
+                            compute_many: Callable[[list[str]], list[list[float]]]) -> list[list[float]]:
+        """
+        批量获取问题向量, 所有未命中的问题 (去重后) 合并为一次 compute_many 调用
+        Returns:
+            与 texts 顺序一致的向量列表
+        """
+        keys = [self.make_key(platform, model, text) for text in texts]
+        vectors: dict[str, list[float]] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None and key not in vectors:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    vectors[key] = vector
+
+        missing: dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key in vectors or key in missing:
+                continue
+            vector = self._load_from_db(key)
+            if vector is None:
+                missing[key] = text
+                continue
+            with self._lock:
+                self._disk_hits += 1
+            self._put(key, vector)
+            vectors[key] = vector
+
+        if missing:
+            with self._lock:
+                self._misses += len(missing)
+            computed = compute_many(list(missing.values()))
+            for key, vector in zip(missing, computed):
+                vector = list(vector)
+                self._put(key, vector)
+                self._save_to_db(key, vector)
+                vectors[key] = vector
+        return [list(vectors[key]) for key in keys]
+
+    def _get_from_memory(self, key: str) -> Optional[list[float]]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return list(vector)
+
+    def _put(self, key: str, vector: list[float]) -> None:
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load_from_db(self, key: str) -> Optional[list[float]]:
+        if self._conn is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._conn.execute("SELECT vector FROM query_embeddings WHERE cache_key = ?",
+                                         (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"[EmbeddingCache] 读取持久化缓存失败: {e}")
+            return None
+        if row is None:
+            return None
+        return array("d", row[0]).tolist()
+
+    def _save_to_db(self, key: str, vector: list[float]) -> None:
+        if self._conn is None:
+            return
+        try:
+            with self._db_lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (cache_key, vector, created_at) VALUES (?, ?, ?)",
+                    (key, array("d", vector).tobytes(), time.time()))
+        except sqlite3.Error as e:
+            logger.warning(f"[EmbeddingCache] 写入持久化缓存失败: {e}")
+
+    def clear(self) -> None:
+        """清空两级缓存 (例如更换了嵌入模型的参数)"""
+        with self._lock:
+            self._entries.clear()
+        if self._conn is not None:
+            with self._db_lock, self._conn:
+                self._conn.execute("DELETE FROM query_embeddings")
+
+    def close(self) -> None:
+        if self._conn is not None:
+            with self._db_lock:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict[str, int | float]:
+        """缓存命中统计"""
+        with self._lock:
+            total = self._hits + self._disk_hits + self._misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.max_entries,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": round((self._hits + self._disk_hits) / total, 4) if total else 0.0,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    """获取进程内共享的问题向量缓存"""
+    return QueryEmbeddingCache(max_entries=default_query_embedding_cache_size,
+                               db_path=default_query_embedding_cache_path)
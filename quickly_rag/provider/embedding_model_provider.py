@@ -2,6 +2,7 @@ import traceback
 from functools import lru_cache
 from httpx import ConnectError, TimeoutException
 from langchain_community.embeddings import DashScopeEmbeddings
+from langchain_community.embeddings.dashscope import embed_with_retry
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from langchain_ollama import OllamaEmbeddings
@@ -11,6 +12,7 @@ from pydantic import BaseModel, Field
 
 from quickly_rag.config.platform_config import MySiliconflowAiInfo, MyOllamaInfo, MyAliyunAiInfo
 from quickly_rag.enums.platform_enum import PlatformEmbeddingType
+from quickly_rag.provider.embedding_cache import get_query_embedding_cache
 
 
 class QuicklyEmbeddingModelProvider(Embeddings,BaseModel):
@@ -32,8 +34,6 @@ class QuicklyEmbeddingModelProvider(Embeddings,BaseModel):
         try:
             if platform_type == PlatformEmbeddingType.SILICONFLOW:
                 return self.__siliconflow_embed()
-            elif platform_type == PlatformEmbeddingType.AZURE:
-                raise NotImplementedError("Azure embedding model provider not implemented yet.")
             elif platform_type == PlatformEmbeddingType.ALIYUN:
                 return self.__aliyun_embed()
             else:
@@ -169,4 +169,42 @@ class QuicklyEmbeddingModelProvider(Embeddings,BaseModel):
     def embed_query(self, text: str) -> list[float]:
         if not hasattr(self, '_embeddings_model') or self._embeddings_model is None:
              raise RuntimeError("Embedding model is not initialized.")
-        return self._embeddings_model.embed_query(text)
+        # 相同的问题直接使用缓存的向量, 不再请求嵌入模型
+        return get_query_embedding_cache().get_or_compute(
+            self.platform_type.value, self.model_name, text, self._embeddings_model.embed_query)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        if not hasattr(self, '_embeddings_model') or self._embeddings_model is None:
+             raise RuntimeError("Embedding model is not initialized.")
+        return await get_query_embedding_cache().aget_or_compute(
+            self.platform_type.value, self.model_name, text, self._embeddings_model.aembed_query)
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """批量获取问题向量, 未命中缓存的问题合并为一次问题模式的请求, 结果与逐条 embed_query 一致"""
+        if not hasattr(self, '_embeddings_model') or self._embeddings_model is None:
+             raise RuntimeError("Embedding model is not initialized.")
+        return get_query_embedding_cache().get_or_compute_many(
+            self.platform_type.value, self.model_name, texts, self._embed_query_batch)
+
+    def _embed_query_batch(self, texts: list[str]) -> list[list[float]]:
+        """
+        以问题模式批量请求向量, 与 embed_query 共用同一份缓存
+        DashScope 区分 text_type="query"/"document", 不能用 embed_documents 代替;
+        OpenAI 兼容接口和 Ollama 不区分, embed_documents 与逐条 embed_query 结果相同
+        """
+        if isinstance(self._embeddings_model, DashScopeEmbeddings):
+            response = embed_with_retry(self._embeddings_model, input=texts, text_type="query",
+                                        model=self._embeddings_model.model)
+            return [item["embedding"] for item in response]
+        return self._embeddings_model.embed_documents(texts)
+
+    @property
+    def model_name(self) -> str:
+        """当前平台配置的嵌入模型名称"""
+        if self.platform_type == PlatformEmbeddingType.SILICONFLOW:
+            return MySiliconflowAiInfo.embedding_model
+        elif self.platform_type == PlatformEmbeddingType.ALIYUN:
+            return MyAliyunAiInfo.embedding_model
+        elif self.platform_type == PlatformEmbeddingType.OLLAMA:
+            return MyOllamaInfo.embedding_model
+        return self.platform_type.value
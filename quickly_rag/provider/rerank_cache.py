@@ -0,0 +1,80 @@
+"""
+重排分数缓存
+相同的 (重排模型, 规范化后的问题, 文档片段内容的哈希) 只请求一次重排模型
+候选文档部分重叠时, 只把没有缓存的文档发送给重排模型, 再与缓存的分数合并排序
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+from quickly_rag.config.platform_config import default_rerank_cache_size
+from quickly_rag.provider.embedding_cache import normalize_query
+
+
+class RerankScoreCache:
+    """重排分数的进程内 LRU 缓存"""
+
+    def __init__(self, max_entries: int = 50000):
+        """
+        Args:
+            max_entries: 最多缓存的分数数量, 0 表示不缓存
+        """
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str, str], float] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def make_key(model: str, query: str, document: str) -> tuple[str, str, str]:
+        return model, normalize_query(query), hashlib.sha1(document.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, query: str, documents: list[str]) -> list[Optional[float]]:
+        """按顺序返回每个文档缓存的分数, 未缓存的为 None"""
+        keys = [self.make_key(model, query, document) for document in documents]
+        scores = []
+        with self._lock:
+            for key in keys:
+                score = self._entries.get(key)
+                if score is None:
+                    self._misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                scores.append(score)
+        return scores
+
+    def put_many(self, model: str, query: str, documents: list[str], scores: list[float]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            for document, score in zip(documents, scores):
+                key = self.make_key(model, query, document)
+                self._entries[key] = score
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """清空缓存 (例如更换了重排模型的指令)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 4) if total else 0.0,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_rerank_cache() -> RerankScoreCache:
+    """获取进程内共享的重排分数缓存"""
+    return RerankScoreCache(max_entries=default_rerank_cache_size)
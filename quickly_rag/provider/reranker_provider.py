@@ -1,172 +1,251 @@
+import asyncio
+import importlib.util
 import json
+import random
+import threading
+import time
+import weakref
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
 import httpx
 from loguru import logger
 from pydantic import BaseModel, Field
 
-from quickly_rag.config.platform_config import MySiliconflowAiInfo
+from quickly_rag.config.platform_config import MySiliconflowAiInfo, default_rerank_connect_timeout, \
+    default_rerank_read_timeout, default_rerank_write_timeout, default_rerank_pool_timeout, \
+    default_rerank_max_retries, default_rerank_retry_backoff_seconds, default_rerank_circuit_failure_threshold, \
+    default_rerank_circuit_reset_seconds
+from quickly_rag.provider.circuit_breaker import CircuitBreaker
+
+# 这些状态码说明服务暂时不可用, 值得重试
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# 安装了 h2 时使用 HTTP/2, 多个并发请求复用同一个连接
+_HTTP2 = importlib.util.find_spec("h2") is not None
+
+_TIMEOUT = httpx.Timeout(connect=default_rerank_connect_timeout, read=default_rerank_read_timeout,
+                         write=default_rerank_write_timeout, pool=default_rerank_pool_timeout)
+_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+
+# 异步客户端的连接属于创建它的事件循环, 每个事件循环一个
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_async_clients_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _get_http_client() -> httpx.Client:
+    """进程内共享的同步客户端, 保持长连接"""
+    return httpx.Client(http2=_HTTP2, timeout=_TIMEOUT, limits=_LIMITS)
+
+
+def _get_async_http_client() -> httpx.AsyncClient:
+    """当前事件循环共享的异步客户端, 保持长连接"""
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        client = _async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = _async_clients[loop] = httpx.AsyncClient(http2=_HTTP2, timeout=_TIMEOUT, limits=_LIMITS)
+        return client
+
+
+@lru_cache(maxsize=1)
+def get_reranker_circuit_breaker() -> CircuitBreaker:
+    """重排服务的熔断器, 同步和异步请求共用"""
+    return CircuitBreaker("reranker", failure_threshold=default_rerank_circuit_failure_threshold,
+                          reset_seconds=default_rerank_circuit_reset_seconds)
+
+
+def close_reranker_clients() -> None:
+    """关闭同步客户端 (服务退出时调用)"""
+    if _get_http_client.cache_info().currsize:
+        _get_http_client().close()
+        _get_http_client.cache_clear()
+
+
+async def aclose_reranker_clients() -> None:
+    """关闭当前事件循环的异步客户端 (服务退出时调用)"""
+    with _async_clients_lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _retry_delay(attempt: int) -> float:
+    """指数退避加随机抖动, 避免大量请求在同一时刻重试"""
+    backoff = default_rerank_retry_backoff_seconds * (2 ** attempt)
+    return backoff + random.uniform(0, backoff)
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in _RETRYABLE_STATUS
+    return isinstance(error, httpx.TransportError)
 
 
 class QuicklyRerankerProvider(BaseModel):
     """
     硅基流动平台重排序模型服务提供者。
     提供对文档进行重排序的功能，使用 SiliconFlow 的 rerank API。
+    同步和异步请求分别复用进程内共享的长连接客户端, 失败时带抖动重试, 服务连续失败后熔断
     """
     model: str = Field(default='Qwen/Qwen3-Reranker-0.6B', description="指定要使用的重排模型平台类型")
     base_url: str = Field(default=MySiliconflowAiInfo.base_url.rstrip('/'), description="请求的地址")
     api_key: str = Field(default=MySiliconflowAiInfo.key, description="平台的密钥")
     rerank_url: str = Field(default=MySiliconflowAiInfo.base_url.rstrip('/') + '/rerank', description="重排模型的地址")
+    max_retries: int = Field(default=default_rerank_max_retries, description="请求失败后的重试次数")
 
+    def _build_request(self,
+                       query: str,
+                       documents: List[str],
+                       top_n: Optional[int],
+                       instruction: str,
+                       return_documents: bool,
+                       max_chunks_per_doc: Optional[int],
+                       overlap_tokens: Optional[int]) -> tuple[dict, dict]:
+        """构造请求数据和请求头"""
+        payload = {
+            "model": self.model,
+            "query": query,
+            "documents": documents,
+            "instruction": instruction,
+            "return_documents": return_documents
+        }
+
+        # 添加可选参数
+        if top_n is not None:
+            payload["top_n"] = top_n
+        if max_chunks_per_doc is not None:
+            payload["max_chunks_per_doc"] = max_chunks_per_doc
+        if overlap_tokens is not None:
+            payload["overlap_tokens"] = overlap_tokens
+
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        return payload, headers
 
     def rerank(self,
                query: str,
                documents: List[str],
                top_n: Optional[int] = None,
                instruction: str = "Please rerank the documents based on the query.",
-               return_documents: bool = True,
+               return_documents: bool = False,
                max_chunks_per_doc: Optional[int] = None,
                overlap_tokens: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         对文档进行重排序。
-        
+
         Args:
             query: 查询语句
             documents: 待排序的文档列表
             top_n: 返回前N个结果，默认返回所有结果
             instruction: 指令文本
-            return_documents: 是否返回文档内容
+            return_documents: 是否返回文档内容 (默认不返回, 调用方按 index 对应到自己的文档)
             max_chunks_per_doc: 每个文档的最大块数
             overlap_tokens: 重叠的token数
-            
+
         Returns:
             重排序后的结果列表，每个元素包含索引、分数和可能的文档内容
+
+        Raises:
+            CircuitOpenError: 重排服务熔断中
         """
-        # 准备请求数据
-        payload = {
-            "model": self.model,
-            "query": query,
-            "documents": documents,
-            "instruction": instruction,
-            "return_documents": return_documents
-        }
-        
-        # 添加可选参数
-        if top_n is not None:
-            payload["top_n"] = top_n
-        if max_chunks_per_doc is not None:
-            payload["max_chunks_per_doc"] = max_chunks_per_doc
-        if overlap_tokens is not None:
-            payload["overlap_tokens"] = overlap_tokens
-            
-        # 设置请求头
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        try:
-            # 发送POST请求
-            response = httpx.post(
-                self.rerank_url,
-                headers=headers,
-                json=payload,
-                timeout=30.0
-            )
-            
-            # 检查响应状态
-            response.raise_for_status()
-            
-            # 解析响应
-            result = response.json()
-            return result.get("results", [])
-            
-        except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP error occurred during reranking: {e}")
-            logger.error(f"Response content: {e.response.text}")
-            raise
-        except httpx.RequestError as e:
-            logger.error(f"Request error occurred during reranking: {e}")
-            raise
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decode error in reranking response: {e}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error during reranking: {e}")
-            raise
+        payload, headers = self._build_request(query, documents, top_n, instruction, return_documents,
+                                               max_chunks_per_doc, overlap_tokens)
+        breaker = get_reranker_circuit_breaker()
+        breaker.before_call()
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = _get_http_client().post(self.rerank_url, headers=headers, json=payload)
+                response.raise_for_status()
+                result = response.json()
+                breaker.record_success()
+                return result.get("results", [])
+
+            except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                if not _is_retryable(e):
+                    # 服务有响应, 只是请求本身有问题, 不计入熔断
+                    breaker.record_success()
+                    logger.error(f"HTTP error occurred during reranking: {e}")
+                    logger.error(f"Response content: {e.response.text}")
+                    raise
+                if attempt >= self.max_retries:
+                    breaker.record_failure()
+                    logger.error(f"Request error occurred during reranking after {attempt + 1} attempts: {e}")
+                    raise
+                delay = _retry_delay(attempt)
+                logger.warning(f"Reranking attempt {attempt + 1} failed, retrying in {delay:.2f}s: {e}")
+                time.sleep(delay)
+            except json.JSONDecodeError as e:
+                # 服务返回了无法解析的内容, 按失败计入熔断, 同时结束半开状态的试探请求
+                breaker.record_failure()
+                logger.error(f"JSON decode error in reranking response: {e}")
+                raise
+            except Exception as e:
+                breaker.record_failure()
+                logger.error(f"Unexpected error during reranking: {e}")
+                raise
+        return []
 
     async def arerank(self,
                       query: str,
                       documents: List[str],
                       top_n: Optional[int] = None,
                       instruction: str = "Please rerank the documents based on the query.",
-                      return_documents: bool = True,
+                      return_documents: bool = False,
                       max_chunks_per_doc: Optional[int] = None,
                       overlap_tokens: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         异步对文档进行重排序。
-        
+
         Args:
             query: 查询语句
             documents: 待排序的文档列表
             top_n: 返回前N个结果，默认返回所有结果
             instruction: 指令文本
-            return_documents: 是否返回文档内容
+            return_documents: 是否返回文档内容 (默认不返回, 调用方按 index 对应到自己的文档)
             max_chunks_per_doc: 每个文档的最大块数
             overlap_tokens: 重叠的token数
-            
+
         Returns:
             重排序后的结果列表，每个元素包含索引、分数和可能的文档内容
+
+        Raises:
+            CircuitOpenError: 重排服务熔断中
         """
-        # 准备请求数据
-        payload = {
-            "model": self.model,
-            "query": query,
-            "documents": documents,
-            "instruction": instruction,
-            "return_documents": return_documents
-        }
-        
-        # 添加可选参数
-        if top_n is not None:
-            payload["top_n"] = top_n
-        if max_chunks_per_doc is not None:
-            payload["max_chunks_per_doc"] = max_chunks_per_doc
-        if overlap_tokens is not None:
-            payload["overlap_tokens"] = overlap_tokens
-            
-        # 设置请求头
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        try:
-            # 发送异步POST请求
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.rerank_url,
-                    headers=headers,
-                    json=payload,
-                    timeout=30.0
-                )
-                
-                # 检查响应状态
+        payload, headers = self._build_request(query, documents, top_n, instruction, return_documents,
+                                               max_chunks_per_doc, overlap_tokens)
+        breaker = get_reranker_circuit_breaker()
+        breaker.before_call()
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await _get_async_http_client().post(self.rerank_url, headers=headers, json=payload)
                 response.raise_for_status()
-                
-                # 解析响应
                 result = response.json()
+                breaker.record_success()
                 return result.get("results", [])
-                
-        except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP error occurred during async reranking: {e}")
-            logger.error(f"Response content: {e.response.text}")
-            raise
-        except httpx.RequestError as e:
-            logger.error(f"Request error occurred during async reranking: {e}")
-            raise
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decode error in async reranking response: {e}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error during async reranking: {e}")
-            raise
\ No newline at end of file
+
+            except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                if not _is_retryable(e):
+                    breaker.record_success()
+                    logger.error(f"HTTP error occurred during async reranking: {e}")
+                    logger.error(f"Response content: {e.response.text}")
+                    raise
+                if attempt >= self.max_retries:
+                    breaker.record_failure()
+                    logger.error(f"Request error occurred during async reranking after {attempt + 1} attempts: {e}")
+                    raise
+                delay = _retry_delay(attempt)
+                logger.warning(f"Async reranking attempt {attempt + 1} failed, retrying in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+            except json.JSONDecodeError as e:
+                breaker.record_failure()
+                logger.error(f"JSON decode error in async reranking response: {e}")
+                raise
+            except Exception as e:
+                breaker.record_failure()
+                logger.error(f"Unexpected error during async reranking: {e}")
+                raise
+        return []
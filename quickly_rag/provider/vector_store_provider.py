@@ -1,17 +1,18 @@
 import os
+import threading
 from functools import lru_cache
-from typing import Type, Any
+from typing import Type, Any, Iterable, Optional
 
 from langchain_chroma import Chroma
-from langchain_community.docstore import InMemoryDocstore
-from langchain_community.vectorstores import FAISS
 from langchain_core.vectorstores import VectorStore
 from langchain_milvus import Milvus
 from loguru import logger
 from pydantic import BaseModel, Field
 
-from quickly_rag.config.vector_config import MyMilieusInfo, MyFaissInfo, MyChromaInfo
+from quickly_rag.config.vector_config import MyMilieusInfo, MyFaissInfo, MyChromaInfo, MyNumpyInfo
 from quickly_rag.enums.vector_enum import VectorStorageType
+from quickly_rag.vector.store.faiss_store import QuicklyFaissStore
+from quickly_rag.vector.store.numpy_store import QuicklyNumpyStore
 
 
 class VectorStoreInitializationError(Exception):
@@ -25,12 +26,15 @@ class QuicklyVectorStoreProvider(BaseModel):
     该类负责处理连接、初始化错误，并提供对底层 VectorStore 实例的访问。
     """
     platform_type: VectorStorageType = Field(..., description="指定要使用的向量数据库平台类型")
+    collection_name: Optional[str] = Field(default=None, description="集合名称, 为空时使用配置中的默认集合")
 
     def __init__(self, platform_type: VectorStorageType, /, **data: Any):
         """
         初始化 QuicklyVectorStoreProvider 实例。
+        应用内请通过 get_vector_store_registry().get(...) 获取, 以复用已经创建好的实例
         Args:
             platform_type (VectorStorageType): 指定要使用的向量数据库平台类型。
+            collection_name (str): 集合名称, 为空时使用配置中的默认集合。
         Raises:
             VectorStoreInitializationError: 如果指定平台的向量库初始化失败。
             ValueError: 如果 platform_type 不受支持。
@@ -38,7 +42,7 @@ class QuicklyVectorStoreProvider(BaseModel):
         super().__init__(platform_type=platform_type, **data)
         self._vector_store: VectorStore | None = None
         try:
-            self._vector_store = self._get_vector_store_instance(platform_type)
+            self._vector_store = self._get_vector_store_instance(platform_type, self.collection_name)
         except VectorStoreInitializationError:
             logger.error(f"Critical failure initializing vector store for {platform_type.name}. Provider is unusable.")
             raise
@@ -47,9 +51,9 @@ class QuicklyVectorStoreProvider(BaseModel):
              raise VectorStoreInitializationError(f"Unexpected error initializing {platform_type.name}") from e
 
     @staticmethod
-    @lru_cache(maxsize=1)
-    def __create_milvus_store() -> Milvus:
-        """【内部】创建并返回 Milvus 向量库实例 (单例)"""
+    @lru_cache(maxsize=None)
+    def __create_milvus_store(collection_name: str) -> Milvus:
+        """【内部】创建并返回 Milvus 向量库实例 (每个集合一个单例)"""
         try:
             milvus_instance = Milvus(
                 embedding_function=MyMilieusInfo.embedding_model,
@@ -59,7 +63,7 @@ class QuicklyVectorStoreProvider(BaseModel):
                     "user": MyMilieusInfo.user,
                     "password": MyMilieusInfo.password
                 },
-                collection_name=MyMilieusInfo.collection_name,
+                collection_name=collection_name,
                 auto_id=True,
                 enable_dynamic_field=False,
                 drop_old=MyMilieusInfo.drop_old,
@@ -77,9 +81,10 @@ class QuicklyVectorStoreProvider(BaseModel):
             raise VectorStoreInitializationError("Milvus connection or initialization failed.") from e
 
     @staticmethod
-    def __create_chroma_store() -> Chroma:
+    @lru_cache(maxsize=None)
+    def __create_chroma_store(collection_name: str) -> Chroma:
         """
-        【内部】创建并返回 Chroma 向量库实例 (本地持久化)
+        【内部】创建并返回 Chroma 向量库实例 (本地持久化, 每个集合一个单例)
         这就是任何人都能跑的关键！
         """
         try:
@@ -91,7 +96,7 @@ class QuicklyVectorStoreProvider(BaseModel):
             logger.info(f"Initializing ChromaDB at {persist_dir}...")
 
             chroma_instance = Chroma(
-                collection_name=MyChromaInfo.collection_name,  # 集合名称
+                collection_name=collection_name,  # 集合名称
                 embedding_function=MyChromaInfo.embedding_model,  # 使用你的 Embedding 模型
                 persist_directory=persist_dir,  # 数据持久化到本地文件夹
             )
@@ -102,31 +107,93 @@ class QuicklyVectorStoreProvider(BaseModel):
             raise VectorStoreInitializationError("ChromaDB initialization failed.") from e
 
     @staticmethod
-    @lru_cache(maxsize=1)
-    def __create_faiss_store() -> FAISS:
-        """【内部】创建并返回 FAISS 向量库实例 (初始空状态, 单例)"""
+    @lru_cache(maxsize=None)
+    def __create_faiss_store(collection_name: str) -> QuicklyFaissStore:
+        """【内部】创建并返回本地 FAISS 向量库实例 (每个集合一个单例, 索引文件以 mmap 方式加载)"""
         try:
-            faiss_instance = FAISS.from_texts(
-                texts=["dummy"],
-                embedding=MyFaissInfo.embedding
+            faiss_instance = QuicklyFaissStore(
+                embedding=MyFaissInfo.embedding,
+                persist_dir=os.path.join(MyFaissInfo.persist_dir, collection_name),
+                metric_type=MyFaissInfo.metric_type,
+                index_type=MyFaissInfo.index_type,
+                dimension=MyFaissInfo.dimension,
+                nlist=MyFaissInfo.nlist,
+                ivf_min_train_size=MyFaissInfo.ivf_min_train_size,
+                hnsw_m=MyFaissInfo.hnsw_m,
+                ef_search=MyFaissInfo.ef_search,
+                nprobe=MyFaissInfo.nprobe,
             )
-            faiss_instance.index_to_docstore_id = {}
-            faiss_instance.docstore = InMemoryDocstore({})
             logger.info("FAISS instance created.")
             return faiss_instance
         except Exception as e:
             logger.error(f"Failed to create FAISS instance: {e}")
             raise VectorStoreInitializationError("FAISS initialization failed.") from e
 
-    def _get_vector_store_instance(self, platform_type: VectorStorageType) -> VectorStore:
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def __create_numpy_store(collection_name: str) -> QuicklyNumpyStore:
+        """【内部】创建并返回本地 NumPy 向量库实例 (每个集合一个单例, 向量矩阵以 mmap 方式加载)"""
+        try:
+            numpy_instance = QuicklyNumpyStore(
+                embedding=MyNumpyInfo.embedding_model,
+                persist_dir=os.path.join(MyNumpyInfo.persist_dir, collection_name),
+                quantization=MyNumpyInfo.quantization,
+            )
+            logger.info("NumPy vector store created.")
+            return numpy_instance
+        except Exception as e:
+            logger.error(f"Failed to create NumPy vector store: {e}")
+            raise VectorStoreInitializationError("NumPy vector store initialization failed.") from e
+
+    @staticmethod
+    def default_collection_name(platform_type: VectorStorageType) -> str:
+        """配置中的默认集合名称"""
+        if platform_type == VectorStorageType.MILVUS:
+            return MyMilieusInfo.collection_name
+        elif platform_type == VectorStorageType.CHROMA:
+            return MyChromaInfo.collection_name
+        elif platform_type == VectorStorageType.FAISS:
+            return MyFaissInfo.collection_name
+        elif platform_type == VectorStorageType.NUMPY:
+            return MyNumpyInfo.collection_name
+        else:
+            raise ValueError(f"Unsupported vector store platform type: {platform_type}")
+
+    @staticmethod
+    def embedding_name(platform_type: VectorStorageType) -> str:
+        """向量库使用的嵌入模型平台"""
+        if platform_type == VectorStorageType.MILVUS:
+            return MyMilieusInfo.embedding_model.platform_type.value
+        elif platform_type == VectorStorageType.CHROMA:
+            return MyChromaInfo.embedding_model.platform_type.value
+        elif platform_type == VectorStorageType.FAISS:
+            return MyFaissInfo.embedding.platform_type.value
+        elif platform_type == VectorStorageType.NUMPY:
+            return MyNumpyInfo.embedding_model.platform_type.value
+        else:
+            raise ValueError(f"Unsupported vector store platform type: {platform_type}")
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        """清空已创建的向量库实例缓存"""
+        cls.__create_milvus_store.cache_clear()
+        cls.__create_chroma_store.cache_clear()
+        cls.__create_faiss_store.cache_clear()
+        cls.__create_numpy_store.cache_clear()
+
+    def _get_vector_store_instance(self, platform_type: VectorStorageType,
+                                   collection_name: Optional[str] = None) -> VectorStore:
         """根据平台类型获取对应的向量库实例"""
         try:
+            collection_name = collection_name or self.default_collection_name(platform_type)
             if platform_type == VectorStorageType.MILVUS:
-                return self.__create_milvus_store()
+                return self.__create_milvus_store(collection_name)
             elif platform_type == VectorStorageType.CHROMA:
-                return self.__create_chroma_store()
-            # elif platform_type == VectorStorageType.FAISS:
-            #     return self.__create_faiss_store()
+                return self.__create_chroma_store(collection_name)
+            elif platform_type == VectorStorageType.FAISS:
+                return self.__create_faiss_store(collection_name)
+            elif platform_type == VectorStorageType.NUMPY:
+                return self.__create_numpy_store(collection_name)
             else:
                 raise ValueError(f"Unsupported vector store platform type: {platform_type}")
         except VectorStoreInitializationError:
@@ -152,4 +219,112 @@ class QuicklyVectorStoreProvider(BaseModel):
 
     def is_available(self) -> bool:
         """检查向量库实例是否已成功初始化并可用。"""
-        return self._vector_store is not None
\ No newline at end of file
+        return self._vector_store is not None
+
+    @property
+    def vector_store_collection_name(self) -> str:
+        """实际使用的集合名称"""
+        return self.collection_name or self.default_collection_name(self.platform_type)
+
+    def ping(self) -> bool:
+        """
+        健康检查: 对底层向量库执行一次轻量请求
+        Raises:
+            Exception: 向量库不可用时抛出底层异常
+        """
+        store = self.vector_store
+        if isinstance(store, Milvus):
+            store.client.has_collection(store.collection_name)
+        elif isinstance(store, Chroma):
+            store._collection.count()
+        elif isinstance(store, (QuicklyFaissStore, QuicklyNumpyStore)):
+            store.index_size()
+        return True
+
+    def close(self) -> None:
+        """释放底层客户端的连接 (如果客户端支持)"""
+        store = self._vector_store
+        if isinstance(store, (QuicklyFaissStore, QuicklyNumpyStore)):
+            store.close()
+            return
+        client = getattr(store, "client", None) if isinstance(store, Milvus) else getattr(store, "_client", None)
+        close = getattr(client, "close", None)
+        if close is not None:
+            close()
+
+
+class VectorStoreRegistry:
+    """
+    进程内共享的向量库注册表
+    以 (存储类型, 集合名称, 嵌入模型) 为键, 每个向量库只创建一次, 之后的查询直接复用
+    应用启动时 warm_up 提前创建实例, 退出时 shutdown 释放连接
+    """
+
+    def __init__(self):
+        self._providers: dict[tuple[VectorStorageType, str, str], QuicklyVectorStoreProvider] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(platform_type: VectorStorageType,
+                 collection_name: Optional[str] = None) -> tuple[VectorStorageType, str, str]:
+        collection_name = collection_name or QuicklyVectorStoreProvider.default_collection_name(platform_type)
+        return platform_type, collection_name, QuicklyVectorStoreProvider.embedding_name(platform_type)
+
+    def get(self, platform_type: VectorStorageType, collection_name: Optional[str] = None) -> QuicklyVectorStoreProvider:
+        """获取向量库, 第一次获取时创建 (同一个键只会创建一次)"""
+        key = self.make_key(platform_type, collection_name)
+        provider = self._providers.get(key)
+        if provider is not None:
+            return provider
+        with self._lock:
+            provider = self._providers.get(key)
+            if provider is None:
+                provider = QuicklyVectorStoreProvider(platform_type, collection_name=key[1])
+                self._providers[key] = provider
+                logger.info(f"[VectorStoreRegistry] 已创建向量库 {platform_type.value}/{key[1]} (embedding: {key[2]})")
+        return provider
+
+    def warm_up(self, stores: Iterable[VectorStorageType | tuple[VectorStorageType, str]]) -> None:
+        """
+        提前创建并检查向量库, 失败只记录日志, 查询时会再次尝试创建
+        Args:
+            stores: 存储类型, 或 (存储类型, 集合名称)
+        """
+        for store in stores:
+            platform_type, collection_name = store if isinstance(store, tuple) else (store, None)
+            try:
+                self.get(platform_type, collection_name).ping()
+            except Exception as e:
+                logger.warning(f"[VectorStoreRegistry] 向量库 {platform_type.value} 预热失败: {e}")
+
+    def health_check(self) -> dict[str, bool]:
+        """检查所有已创建的向量库, 返回 {"类型/集合": 是否可用}"""
+        with self._lock:
+            providers = list(self._providers.items())
+        health = {}
+        for (platform_type, collection_name, _), provider in providers:
+            try:
+                health[f"{platform_type.value}/{collection_name}"] = provider.ping()
+            except Exception as e:
+                logger.warning(f"[VectorStoreRegistry] 向量库 {platform_type.value}/{collection_name} 不可用: {e}")
+                health[f"{platform_type.value}/{collection_name}"] = False
+        return health
+
+    def shutdown(self) -> None:
+        """关闭所有向量库连接并清空注册表"""
+        with self._lock:
+            providers = list(self._providers.values())
+            self._providers.clear()
+        for provider in providers:
+            try:
+                provider.close()
+            except Exception as e:
+                logger.warning(f"[VectorStoreRegistry] 关闭向量库 {provider.platform_type.value} 出错: {e}")
+        QuicklyVectorStoreProvider.clear_cache()
+        logger.info("[VectorStoreRegistry] 向量库已全部关闭")
+
+
+@lru_cache(maxsize=1)
+def get_vector_store_registry() -> VectorStoreRegistry:
+    """获取进程内共享的向量库注册表"""
+    return VectorStoreRegistry()
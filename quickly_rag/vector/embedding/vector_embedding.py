@@ -1,6 +1,8 @@
 from langchain_core.documents import Document
 
 from pathlib import Path
+from typing import Optional
+
 from loguru import logger
 
 from quickly_rag.config.document_config import rag_document_info
@@ -38,7 +40,8 @@ def vectorize_file(
         file_path: str | Path,
         rag_config: RagDocumentInfo = rag_document_info,
         embedding_type: PlatformEmbeddingType = default_embedding_use_platform,
-        vectorstore_type: VectorStorageType = default_embedding_database_type
+        vectorstore_type: VectorStorageType = default_embedding_database_type,
+        collection_name: Optional[str] = None
 ) -> bool:
     """
     将指定文件向量化并存储到向量数据库中
@@ -48,6 +51,7 @@ def vectorize_file(
         rag_config: 文档分割配置
         embedding_type: 嵌入模型类型
         vectorstore_type: 向量存储类型
+        collection_name: 集合名称, 为空时使用该向量库配置的默认集合
 
     Returns:
         bool: 处理是否成功
@@ -81,7 +85,7 @@ def vectorize_file(
 
         # 4. 存储向量
         logger.info("正在存储向量到数据库...")
-        store_vector_by_documents(documents, vectorstore_type)
+        store_vector_by_documents(documents, vectorstore_type, collection_name)
         logger.success(f"文档存储成功，共存储 {len(documents)} 个文档片段")
 
         logger.info(f"文件 {file_path} 处理完成")
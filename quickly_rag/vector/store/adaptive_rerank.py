@@ -0,0 +1,92 @@
+"""
+自适应重排
+1. 召回 top_k × rerank_oversample 个候选文档, 让重排模型有更多的文档可以挑选
+2. 前两名的相关性差距足够大 (混合检索时还要求 BM25 融合后的前两名与向量检索一致) 时认为排名已经确定, 跳过重排
+   相关性为各向量库的分数经 _select_relevance_score_fn 换算后的 [0, 1] 分数, 不同向量库的差距含义一致; 默认关闭
+3. 发送给重排模型的文档数量不超过 rerank_max_documents
+"""
+import threading
+from functools import lru_cache
+from typing import Optional
+
+from langchain_core.documents import Document
+
+from quickly_rag.core.search_base import VectorSearchParams
+from quickly_rag.enums.vector_enum import ScoreField
+
+
+def candidate_count(search_params: VectorSearchParams) -> int:
+    """召回的候选文档数量"""
+    return search_params.top_k * search_params.rerank_oversample
+
+
+def should_skip_rerank(search_params: VectorSearchParams,
+                       candidates: list[tuple[Document, float]],
+                       relevance_results: Optional[list[tuple[Document, float]]]) -> bool:
+    """
+    排名已经确定时跳过重排
+    Args:
+        search_params: 检索参数
+        candidates: 最终的候选文档 (混合检索时为 RRF 融合后的结果)
+        relevance_results: 向量检索的结果, 分数已换算为 [0, 1] 的相关性, 按相似程度从高到低排列;
+            向量库无法换算时为 None, 此时不跳过
+    """
+    # 强制按重排分数过滤时必须重排, 否则所有结果的重排分数都是 0
+    if search_params.rerank_skip_gap is None or search_params.filter_strategy == ScoreField.RELEVANCE:
+        return False
+    if len(candidates) <= 1:
+        return True
+    if relevance_results is None or len(relevance_results) < 2:
+        return False
+    if [doc.page_content for doc, _ in candidates[:2]] != [doc.page_content for doc, _ in relevance_results[:2]]:
+        return False
+    return relevance_results[0][1] - relevance_results[1][1] >= search_params.rerank_skip_gap
+
+
+def rerank_documents(search_params: VectorSearchParams, candidates: list[tuple[Document, float]]) -> list[str]:
+    """发送给重排模型的文档 (按召回顺序截取前 rerank_max_documents 个)"""
+    return [doc.page_content for doc, _ in candidates[:search_params.rerank_max_documents]]
+
+
+class RerankStats:
+    """进程内的重排统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._searches = 0
+        self._reranked = 0
+        self._skipped = 0
+        self._failed = 0
+        self._candidates = 0
+        self._documents_sent = 0
+
+    def record(self, candidates: int, documents_sent: int = 0, skipped: bool = False, failed: bool = False) -> None:
+        """documents_sent 为实际发送给重排模型的文档数量 (命中重排分数缓存的文档不计入)"""
+        with self._lock:
+            self._searches += 1
+            self._candidates += candidates
+            self._documents_sent += documents_sent
+            if skipped:
+                self._skipped += 1
+            elif failed:
+                self._failed += 1
+            else:
+                self._reranked += 1
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            return {
+                "searches": self._searches,
+                "reranked": self._reranked,
+                "skipped": self._skipped,
+                "failed": self._failed,
+                "skip_rate": round(self._skipped / self._searches, 4) if self._searches else 0.0,
+                "avg_candidates": round(self._candidates / self._searches, 2) if self._searches else 0.0,
+                "avg_documents_sent": round(self._documents_sent / self._reranked, 2) if self._reranked else 0.0,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_rerank_stats() -> RerankStats:
+    """获取进程内共享的重排统计"""
+    return RerankStats()
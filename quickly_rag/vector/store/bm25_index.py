@@ -0,0 +1,234 @@
+"""
+本地 BM25 倒排索引
+文档入库时同步写入, 与向量检索并行执行后用 RRF 融合, 弥补向量检索对专有名词、赛项名称等精确词匹配较弱的问题
+中文按相邻两个字切分 (bigram), 英文和数字按单词切分, 不依赖分词库
+索引文件不在每次增删后立即重写, 修改后最多每 _SAVE_INTERVAL_SECONDS 保存一次, 进程退出前保存剩余的修改
+"""
+import atexit
+import json
+import math
+import re
+import threading
+import time
+import weakref
+from collections import Counter, defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Optional
+
+from langchain_core.documents import Document
+from loguru import logger
+
+from quickly_rag.config.vector_config import MyChromaInfo
+from quickly_rag.enums.vector_enum import VectorStorageType
+from quickly_rag.vector.store.metadata_filter import FilterNode, matches
+
+# 连续的中日韩文字, 或连续的字母数字
+_TOKEN_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]+|[a-z0-9]+")
+_CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+
+# 有未保存修改的索引, 进程退出前统一保存
+_open_indexes: "weakref.WeakSet[BM25Index]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_open_indexes() -> None:
+    for index in list(_open_indexes):
+        index.flush()
+
+
+def tokenize(text: str) -> list[str]:
+    """CJK 文本切成 bigram (单字的片段保留单字), 其他文本按单词小写切分"""
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text.lower()):
+        if _CJK_PATTERN.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+class BM25Index:
+    """
+    增量更新的 BM25 索引, 保存为 JSON 文件
+    每个文档记录词频, 加载时据此重建倒排表, 不需要重新切词
+    批量导入时每批都重写整个文件的代价与语料规模成正比, 因此修改只标记为未保存,
+    距上次保存超过 _SAVE_INTERVAL_SECONDS 后由后台定时器统一写一次
+    """
+
+    _FORMAT_VERSION = 1
+    _SAVE_INTERVAL_SECONDS = 5.0
+
+    def __init__(self, path: Optional[str | Path] = None, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            path: 索引文件路径, 为空时只保存在内存中
+            k1: 词频饱和参数
+            b: 文档长度归一化参数
+        """
+        self.path = Path(path) if path is not None else None
+        self.k1 = k1
+        self.b = b
+        # 文档 id 为递增整数, 删除后对应位置置为 None
+        self._docs: list[Optional[dict]] = []
+        self._postings: dict[str, dict[int, int]] = defaultdict(dict)
+        self._doc_count = 0
+        self._total_length = 0
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._saved_at = 0.0
+        self._save_timer: Optional[threading.Timer] = None
+        if self.path is not None and self.path.exists():
+            self._load()
+
+    def __len__(self) -> int:
+        return self._doc_count
+
+    def _index_doc(self, doc_id: int, doc: dict) -> None:
+        for term, tf in doc["tf"].items():
+            self._postings[term][doc_id] = tf
+        self._doc_count += 1
+        self._total_length += doc["length"]
+
+    def add_documents(self, documents: Iterable[Document], ids: Optional[Iterable[str]] = None) -> None:
+        """
+        添加文档, 索引文件按时间间隔保存
+        Args:
+            documents: 文档列表
+            ids: 文档在向量库中的 id, 用于之后按 id 删除
+        """
+        documents = list(documents)
+        ids = [str(i) for i in ids] if ids is not None else [None] * len(documents)
+        with self._lock:
+            for document, store_id in zip(documents, ids):
+                tokens = tokenize(document.page_content)
+                doc = {
+                    "id": store_id,
+                    "text": document.page_content,
+                    "metadata": document.metadata,
+                    "tf": dict(Counter(tokens)),
+                    "length": len(tokens),
+                }
+                self._docs.append(doc)
+                self._index_doc(len(self._docs) - 1, doc)
+            self._mark_dirty()
+
+    def _remove(self, doc_id: int) -> None:
+        doc = self._docs[doc_id]
+        for term in doc["tf"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._doc_count -= 1
+        self._total_length -= doc["length"]
+        self._docs[doc_id] = None
+
+    def delete(self, ids: Iterable[str | int]) -> int:
+        """按向量库 id 删除文档, 返回删除的数量"""
+        targets = {str(i) for i in ids}
+        removed = 0
+        with self._lock:
+            for doc_id, doc in enumerate(self._docs):
+                if doc is None or doc["id"] not in targets:
+                    continue
+                self._remove(doc_id)
+                removed += 1
+            if removed:
+                self._mark_dirty()
+        return removed
+
+    def delete_where(self, filter_node: FilterNode) -> list[Optional[str]]:
+        """删除元数据满足过滤条件的文档, 返回被删除文档的向量库 id"""
+        removed = []
+        with self._lock:
+            for doc_id, doc in enumerate(self._docs):
+                if doc is None or not matches(filter_node, doc["metadata"]):
+                    continue
+                removed.append(doc["id"])
+                self._remove(doc_id)
+            if removed:
+                self._mark_dirty()
+        return removed
+
+    def search(self, query: str, k: int, filter_node: Optional[FilterNode] = None) -> list[tuple[Document, float]]:
+        """返回 BM25 分数最高的 k 个文档, filter_node 为 metadata_filter.parse_filter 解析的过滤条件"""
+        terms = tokenize(query)
+        with self._lock:
+            if not terms or not self._doc_count:
+                return []
+            avgdl = self._total_length / self._doc_count
+            scores: dict[int, float] = defaultdict(float)
+            for term in set(terms):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (self._doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    if filter_node is not None and not matches(filter_node, self._docs[doc_id]["metadata"]):
+                        continue
+                    length = self._docs[doc_id]["length"]
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (
+                            tf + self.k1 * (1 - self.b + self.b * length / avgdl))
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(Document(id=self._docs[doc_id]["id"], page_content=self._docs[doc_id]["text"],
+                              metadata=self._docs[doc_id]["metadata"]), score)
+                    for doc_id, score in best]
+
+    def _mark_dirty(self) -> None:
+        """索引已修改, 距离上次保存超过 _SAVE_INTERVAL_SECONDS 时立即保存, 否则等定时器到期后保存"""
+        if self.path is None:
+            return
+        self._dirty = True
+        _open_indexes.add(self)
+        delay = self._saved_at + self._SAVE_INTERVAL_SECONDS - time.monotonic()
+        if delay <= 0:
+            self._save()
+        elif self._save_timer is None:
+            self._save_timer = threading.Timer(delay, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self) -> None:
+        """立即保存尚未写入文件的修改"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _save(self) -> None:
+        if self._save_timer is not None:
+            self._save_timer.cancel()
+            self._save_timer = None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self._FORMAT_VERSION, "docs": [doc for doc in self._docs if doc is not None]},
+                      f, ensure_ascii=False, default=str)
+        # 先写临时文件再替换, 写入中途退出也不会损坏原索引
+        tmp_path.replace(self.path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        _open_indexes.discard(self)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"[BM25Index] 索引文件 {self.path} 读取失败, 使用空索引: {e}")
+            return
+        for doc in data.get("docs", []):
+            self._docs.append(doc)
+            self._index_doc(len(self._docs) - 1, doc)
+        logger.info(f"[BM25Index] 已加载 {self._doc_count} 个文档: {self.path}")
+
+
+@lru_cache(maxsize=None)
+def get_bm25_index(vectorstore_type: VectorStorageType, collection_name: str) -> BM25Index:
+    """获取集合对应的 BM25 索引, 索引文件保存在 Chroma 数据目录旁"""
+    path = Path(MyChromaInfo.persist_dir).parent / "bm25" / f"{vectorstore_type.value}_{collection_name}.json"
+    return BM25Index(path)
@@ -0,0 +1,354 @@
+"""
+本地 FAISS 向量库
+1. 空索引在初始化时按配置的向量维度创建, 不需要为了初始化调用嵌入模型, 写入的向量维度不一致时报错
+2. 支持 FLAT / IVF_FLAT / HNSW 三种索引, 通过 MyFaissConfig.index_type 选择
+   IVF 的向量数量达到训练所需的最小数量之前使用 FLAT 精确检索, 达到后用全部向量训练并重建为 IVF 索引
+3. 索引文件以 mmap 方式只读加载, 同一台机器上的多个 worker 共享操作系统页缓存中的向量数据:
+   FLAT / HNSW 的向量通过 IO_FLAG_MMAP_IFC 映射, IVF 的倒排表通过 IO_FLAG_MMAP 映射;
+   HNSW 的邻居图和 id 映射表仍然读入每个进程的内存
+4. 文档内容保存在索引旁的 SQLite 文件中, 检索时只读取 top-k 对应的文档
+5. 写入后索引文件按 _SAVE_INTERVAL_SECONDS 节流保存, 批量入库结束时调用 flush 立即保存;
+   文档库每批提交, 进程在保存前退出时这部分文档只是检索不到, 重新入库即可
+"""
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from loguru import logger
+
+from quickly_rag.enums.vector_enum import VectorIndexType, VectorMetricType
+from quickly_rag.vector.store.metadata_filter import parse_filter, to_sqlite_where
+from quickly_rag.vector.store.sqlite_docstore import SqliteDocstore
+
+
+class QuicklyFaissStore(VectorStore):
+    """
+    基于 FAISS 的 LangChain VectorStore 实现
+    目录结构: {persist_dir}/index.faiss (向量索引) + {persist_dir}/docstore.db (文档内容)
+    写入由一个进程负责 (例如入库脚本), 其他进程检测到索引文件更新后会重新以 mmap 方式加载
+    """
+
+    _INDEX_FILE = "index.faiss"
+    _DOCSTORE_FILE = "docstore.db"
+    # 检查其他进程是否更新了索引文件的最小间隔(秒)
+    _RELOAD_CHECK_SECONDS = 1.0
+    # 写入后保存索引文件的最小间隔(秒), 避免每批写入都重写整个索引文件
+    _SAVE_INTERVAL_SECONDS = 5.0
+
+    def __init__(self, embedding: Embeddings, persist_dir: str | Path,
+                 metric_type: VectorMetricType = VectorMetricType.COSINE,
+                 index_type: VectorIndexType = VectorIndexType.FLAT,
+                 dimension: Optional[int] = None,
+                 nlist: int = 1024,
+                 ivf_min_train_size: Optional[int] = None,
+                 hnsw_m: int = 32,
+                 ef_search: int = 128,
+                 nprobe: int = 16):
+        """
+        Args:
+            embedding: 嵌入模型
+            persist_dir: 索引和文档的保存目录
+            metric_type: COSINE (向量归一化后内积, 分数越大越相似) 或 L2 (距离, 越小越相似)
+            index_type: FLAT / IVF_FLAT / HNSW
+            dimension: 向量维度, 为空时在第一次写入时根据向量确定
+            nlist: IVF 的聚类中心数量
+            ivf_min_train_size: IVF 开始训练所需的最少向量数量, 为空时为 nlist × 39 (FAISS 建议每个聚类至少 39 个向量)
+            hnsw_m: HNSW 每个节点的邻居数量
+            ef_search: HNSW 检索时的候选队列长度
+            nprobe: IVF 检索时访问的聚类数量
+        """
+        if index_type not in (VectorIndexType.FLAT, VectorIndexType.IVF_FLAT, VectorIndexType.HNSW):
+            raise ValueError(f"FAISS 不支持的索引类型: {index_type}")
+        self.embedding = embedding
+        self.persist_dir = Path(persist_dir)
+        self.metric_type = metric_type
+        self.index_type = index_type
+        self.dimension = dimension
+        self.nlist = nlist
+        self.ivf_min_train_size = max(ivf_min_train_size or nlist * 39, nlist)
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+
+        self.persist_dir.mkdir(parents=True, exist_ok=True)
+        self._index: Optional[faiss.Index] = None
+        self._index_mtime = 0.0
+        self._checked_at = 0.0
+        self._read_only = False
+        self._dirty = False
+        self._saved_at = 0.0
+        # 文档库中的文档数量, HNSW 删除后向量仍留在索引中, 检索时按两者之差多取候选
+        self._live_count = 0
+        self._lock = threading.RLock()
+        self.docstore = SqliteDocstore(self.persist_dir / self._DOCSTORE_FILE)
+        self._live_count = self.docstore.count()
+        self._load_index()
+        if self._index is None and self.dimension is not None:
+            self._index = self._create_index(self.dimension)
+
+    # ------------------------------------------------------------------ 文件
+
+    @property
+    def index_path(self) -> Path:
+        return self.persist_dir / self._INDEX_FILE
+
+    def _mmap_flags(self) -> int:
+        """IO_FLAG_MMAP 只映射 IVF 的倒排表, FLAT / HNSW 的向量需要 IO_FLAG_MMAP_IFC (两者不能同时使用)"""
+        if self.index_type != VectorIndexType.IVF_FLAT and hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+            return faiss.IO_FLAG_MMAP_IFC
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+    def _load_index(self) -> None:
+        """以 mmap 只读方式加载索引文件, 写入前再复制到内存"""
+        if not self.index_path.exists():
+            return
+        mtime = self.index_path.stat().st_mtime
+        try:
+            index = faiss.read_index(str(self.index_path), self._mmap_flags())
+            self._read_only = True
+        except RuntimeError:
+            index = faiss.read_index(str(self.index_path))
+            self._read_only = False
+        if self.dimension is not None and index.d != self.dimension:
+            raise ValueError(f"索引文件的向量维度 {index.d} 与配置的维度 {self.dimension} 不一致: {self.index_path}")
+        self._set_search_params(index)
+        self._index = index
+        self._index_mtime = mtime
+        self.dimension = index.d
+        self._live_count = self.docstore.count()
+        logger.info(f"[FaissStore] 已加载索引 {self.index_path}, 向量数量: {index.ntotal}")
+
+    def _maybe_reload(self) -> None:
+        """其他进程更新了索引文件时重新加载 (按 _RELOAD_CHECK_SECONDS 节流)"""
+        now = time.monotonic()
+        if now - self._checked_at < self._RELOAD_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        try:
+            mtime = self.index_path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime != self._index_mtime:
+            with self._lock:
+                self._load_index()
+        elif self.index_type == VectorIndexType.HNSW:
+            # HNSW 的删除只修改文档库, 索引文件不变
+            self._live_count = self.docstore.count()
+
+    def _save_index(self) -> None:
+        tmp_path = self.index_path.with_suffix(".faiss.tmp")
+        faiss.write_index(self._index, str(tmp_path))
+        # 先写临时文件再替换, 正在 mmap 旧文件的进程不受影响
+        tmp_path.replace(self.index_path)
+        self._index_mtime = self.index_path.stat().st_mtime
+        self._saved_at = time.monotonic()
+        self._dirty = False
+
+    def _mark_dirty(self) -> None:
+        """索引已修改, 距离上次保存超过 _SAVE_INTERVAL_SECONDS 时保存"""
+        self._dirty = True
+        if time.monotonic() - self._saved_at >= self._SAVE_INTERVAL_SECONDS:
+            self._save_index()
+
+    def flush(self) -> None:
+        """立即保存尚未写入文件的索引修改, 批量入库或删除结束时调用"""
+        with self._lock:
+            if self._dirty and self._index is not None:
+                self._save_index()
+
+    # ------------------------------------------------------------------ 索引
+
+    @property
+    def _faiss_metric(self) -> int:
+        return faiss.METRIC_L2 if self.metric_type == VectorMetricType.L2 else faiss.METRIC_INNER_PRODUCT
+
+    def _create_index(self, dimension: int) -> faiss.Index:
+        """按维度创建空索引, IVF 在向量数量足够训练之前先使用 FLAT 索引"""
+        if self.index_type == VectorIndexType.HNSW:
+            base = faiss.index_factory(dimension, f"HNSW{self.hnsw_m}", self._faiss_metric)
+        else:
+            base = faiss.index_factory(dimension, "Flat", self._faiss_metric)
+        index = faiss.IndexIDMap2(base)
+        self._set_search_params(index)
+        self.dimension = dimension
+        logger.info(f"[FaissStore] 创建 {self.index_type.value} 索引, 维度: {dimension}")
+        return index
+
+    def _base_index(self, index: faiss.Index) -> faiss.Index:
+        return faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+
+    def _maybe_train_ivf(self, index: faiss.Index) -> faiss.Index:
+        """
+        IVF 索引的向量数量达到 ivf_min_train_size 后, 用全部向量训练聚类中心并重建索引
+        IVF 在倒排表中直接保存向量 id, 不使用 IndexIDMap2 (IndexIDMap2.remove_ids 会压缩 id 映射表,
+        而 IVF 内部的序号不变, 删除后的 id 会整体错位); 哈希表直接映射用于按 id 读取向量
+        """
+        if self.index_type != VectorIndexType.IVF_FLAT or isinstance(self._base_index(index), faiss.IndexIVF) \
+                or index.ntotal < self.ivf_min_train_size:
+            return index
+        ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+        vectors = self._base_index(index).reconstruct_n(0, index.ntotal)
+        ivf_index = faiss.index_factory(index.d, f"IVF{self.nlist},Flat", self._faiss_metric)
+        ivf_index.train(vectors)
+        ivf_index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        ivf_index.add_with_ids(vectors, ids)
+        self._set_search_params(ivf_index)
+        logger.info(f"[FaissStore] 已用 {index.ntotal} 个向量训练 IVF{self.nlist} 索引")
+        return ivf_index
+
+    def _set_search_params(self, index: faiss.Index) -> None:
+        base = self._base_index(index)
+        if isinstance(base, faiss.IndexHNSW):
+            base.hnsw.efSearch = self.ef_search
+        elif isinstance(base, faiss.IndexIVF):
+            base.nprobe = self.nprobe
+
+    def _search_parameters(self, index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+        """带 IDSelector 的检索参数, 需要与底层索引的类型一致, 否则 FAISS 会拒绝"""
+        base = self._base_index(index)
+        if isinstance(base, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+        if isinstance(base, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        return faiss.SearchParameters(sel=selector)
+
+    def _writable_index(self) -> Optional[faiss.Index]:
+        """mmap 加载的索引是只读的, 写入前复制一份到内存"""
+        if self._index is not None and self._read_only:
+            self._index = faiss.read_index(str(self.index_path))
+            self._set_search_params(self._index)
+            self._read_only = False
+        return self._index
+
+    def _to_matrix(self, vectors: List[List[float]]) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        if self.metric_type != VectorMetricType.L2:
+            faiss.normalize_L2(matrix)
+        return matrix
+
+    # ------------------------------------------------------------------ VectorStore
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    def index_size(self) -> int:
+        """可以检索到的向量数量 (不包括已删除但仍留在 HNSW 索引中的向量)"""
+        return min(self._index.ntotal, self._live_count) if self._index is not None else 0
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  *, ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = [doc_id or str(uuid.uuid4()) for doc_id in ids] if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = self._to_matrix(self.embedding.embed_documents(texts))
+        if self.dimension is not None and vectors.shape[1] != self.dimension:
+            raise ValueError(f"向量维度 {vectors.shape[1]} 与索引的维度 {self.dimension} 不一致, 请检查嵌入模型和 dimension 配置")
+
+        # 文档库的 row_id 即索引中的向量 id, 索引写入失败时文档一起回滚
+        with self._lock, self.docstore.transaction():
+            faiss_ids = self.docstore.add(ids, texts, metadatas)
+            index = self._writable_index()
+            if index is None:
+                index = self._create_index(vectors.shape[1])
+            index.add_with_ids(vectors, np.asarray(faiss_ids, dtype=np.int64))
+            self._index = self._maybe_train_ivf(index)
+            self._live_count += len(faiss_ids)
+            self._mark_dirty()
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """按文档 id 删除; HNSW 不支持从索引中删除, 只删除文档内容, 检索时自动跳过"""
+        if not ids:
+            return False
+        with self._lock:
+            faiss_ids = self.docstore.delete(ids)
+            self._live_count = max(self._live_count - len(faiss_ids), 0)
+            if not faiss_ids or self._index is None or self.index_type == VectorIndexType.HNSW:
+                return True
+            index = self._writable_index()
+            index.remove_ids(np.asarray(faiss_ids, dtype=np.int64))
+            self._mark_dirty()
+        return True
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vectors([embedding], k, **kwargs)[0]
+
+    def similarity_search_with_score_by_vectors(self, embeddings: List[List[float]], k: int = 4,
+                                                **kwargs: Any) -> List[List[Tuple[Document, float]]]:
+        """
+        多个问题向量一次 index.search 完成检索, 返回与 embeddings 顺序一致的结果
+        kwargs 中的 filter 为元数据过滤表达式 (字符串或 parse_filter 的结果), 通过 IDSelector 在索引内过滤
+        """
+        self._maybe_reload()
+        index = self._index
+        if index is None or index.ntotal == 0:
+            return [[] for _ in embeddings]
+        params = None
+        filter_node = kwargs.get("filter")
+        if filter_node is not None:
+            filter_node = parse_filter(filter_node) if isinstance(filter_node, str) else filter_node
+            allowed = np.asarray(self.docstore.filter_row_ids(*to_sqlite_where(filter_node)), dtype=np.int64)
+            if not len(allowed):
+                return [[] for _ in embeddings]
+            selector = faiss.IDSelectorBatch(allowed)
+            params = self._search_parameters(index, selector)
+        # 已删除的向量仍留在 HNSW 索引中, 按删除的数量多取候选; 按条件过滤时 IDSelector 已经排除了它们
+        stale = index.ntotal - self._live_count if params is None else 0
+        fetch_k = min(index.ntotal, k + max(stale, 0))
+        distances, labels = index.search(self._to_matrix(embeddings), fetch_k, params=params)
+        hits_per_query = [[(int(label), float(distance)) for label, distance in zip(row_labels, row_distances)
+                           if label >= 0] for row_labels, row_distances in zip(labels, distances)]
+        documents = self.docstore.get(list({label for hits in hits_per_query for label, _ in hits}))
+        return [[(documents[label], distance) for label, distance in hits if label in documents][:k]
+                for hits in hits_per_query]
+
+    def get_vectors_by_ids(self, ids: List[str]) -> dict[str, List[float]]:
+        """按文档 id 读取索引中的向量, 无法读取的向量不会出现在结果中"""
+        index = self._index
+        if index is None:
+            return {}
+        vectors = {}
+        for doc_id, row_id in self.docstore.row_ids(ids).items():
+            try:
+                vectors[doc_id] = index.reconstruct(row_id).tolist()
+            except RuntimeError:
+                continue
+        return vectors
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        if self.metric_type == VectorMetricType.L2:
+            return self._euclidean_relevance_score_fn
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   *, ids: Optional[List[str]] = None, **kwargs: Any) -> "QuicklyFaissStore":
+        store = cls(embedding=embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    def close(self) -> None:
+        self.flush()
+        self.docstore.close()
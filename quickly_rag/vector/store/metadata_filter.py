@@ -0,0 +1,258 @@
+"""
+元数据过滤表达式
+与向量库无关的过滤语法, 编译成各个向量库自己的过滤条件, 在索引内部完成过滤, 不再召回后在 Python 中筛选
+    source in ['a.pdf', 'b.pdf'] and doc_type == 'pdf'
+    not (tenant == 'demo' or page < 3)
+支持 == != > >= < <= in, not in, and, or, not 和括号, 值可以是字符串、数字、true / false, 列表元素之间必须用逗号分隔
+
+缺少字段 (或值为 null) 的文档: 只满足 != 和 not in, 不满足其他比较条件
+not 在解析时按德摩根定律下推到比较条件, 例如 not (page < 3) 等价于 page >= 3, 不包含缺少 page 的文档
+这是 Chroma 自身的语义 (Chroma 的 where 没有判断字段是否存在的运算符), 其他编译目标按同样的语义生成
+> >= < <= 只比较数值, 字符串和 true / false 不满足大小比较
+
+编译目标:
+1. Chroma 的 where 字典
+2. Milvus 的布尔表达式 (与 milvus_util.list_documents 的 filter_expr 语法相同)
+3. SQLite 的 WHERE 子句 (本地 FAISS / NumPy 向量库的文档库)
+4. Python 的匹配函数 (BM25 索引)
+"""
+import json
+import re
+from functools import lru_cache
+from typing import Any, Union
+
+# 语法树节点: ("and", [节点...]) / ("or", [节点...]) / ("cmp", 字段, 运算符, 值)
+FilterNode = tuple
+
+# 缺少字段的文档满足的运算符
+_MISSING_FIELD_OPS = {"!=", "not in"}
+_ORDER_OPS = {">", ">=", "<", "<="}
+
+_TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<number>-?\d+(?:\.\d+)?(?![A-Za-z_]))
+      | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+      | (?P<op>==|!=|>=|<=|>|<|\(|\)|\[|\]|,)
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+    )""", re.VERBOSE)
+_KEYWORDS = {"and", "or", "not", "in", "true", "false"}
+_COMPARE_OPS = {"==", "!=", ">", ">=", "<", "<="}
+_NEGATED_OPS = {"==": "!=", "!=": "==", ">": "<=", "<=": ">", "<": ">=", ">=": "<", "in": "not in", "not in": "in"}
+
+Value = Union[str, int, float, bool]
+
+
+class FilterSyntaxError(ValueError):
+    """过滤表达式语法错误"""
+
+
+def _tokenize(expression: str) -> list[tuple[str, Any]]:
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN_PATTERN.match(expression, position)
+        if match is None or match.end() == position:
+            raise FilterSyntaxError(f"过滤表达式第 {position + 1} 个字符无法识别: {expression[position:]!r}")
+        position = match.end()
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == "number":
+            tokens.append(("value", float(text) if "." in text else int(text)))
+        elif kind == "string":
+            tokens.append(("value", re.sub(r"\\(.)", r"\1", text[1:-1])))
+        elif kind == "name" and text.lower() in ("true", "false"):
+            tokens.append(("value", text.lower() == "true"))
+        elif kind == "name" and text.lower() in _KEYWORDS:
+            tokens.append(("keyword", text.lower()))
+        else:
+            tokens.append((kind, text))
+    return tokens
+
+
+class _Parser:
+    """递归下降解析: or_expr := and_expr (or and_expr)*, and_expr := not_expr (and not_expr)*"""
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.position = 0
+
+    def _peek(self) -> tuple[str, Any] | None:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _next(self) -> tuple[str, Any]:
+        token = self._peek()
+        if token is None:
+            raise FilterSyntaxError(f"过滤表达式不完整: {self.expression!r}")
+        self.position += 1
+        return token
+
+    def _expect(self, kind: str, text: Any = None) -> tuple[str, Any]:
+        token = self._next()
+        if token[0] != kind or (text is not None and token[1] != text):
+            raise FilterSyntaxError(f"过滤表达式中应为 {text or kind}, 实际为 {token[1]!r}: {self.expression!r}")
+        return token
+
+    def parse(self) -> FilterNode:
+        node = self._or()
+        if self._peek() is not None:
+            raise FilterSyntaxError(f"过滤表达式中多余的内容 {self._peek()[1]!r}: {self.expression!r}")
+        return node
+
+    def _or(self) -> FilterNode:
+        children = [self._and()]
+        while self._peek() == ("keyword", "or"):
+            self._next()
+            children.append(self._and())
+        return children[0] if len(children) == 1 else ("or", children)
+
+    def _and(self) -> FilterNode:
+        children = [self._not()]
+        while self._peek() == ("keyword", "and"):
+            self._next()
+            children.append(self._not())
+        return children[0] if len(children) == 1 else ("and", children)
+
+    def _not(self) -> FilterNode:
+        if self._peek() == ("keyword", "not"):
+            self._next()
+            return negate(self._not())
+        if self._peek() == ("op", "("):
+            self._next()
+            node = self._or()
+            self._expect("op", ")")
+            return node
+        return self._comparison()
+
+    def _comparison(self) -> FilterNode:
+        field = self._expect("name")[1]
+        token = self._next()
+        if token == ("keyword", "not"):
+            self._expect("keyword", "in")
+            return "cmp", field, "not in", self._list()
+        if token == ("keyword", "in"):
+            return "cmp", field, "in", self._list()
+        if token[0] != "op" or token[1] not in _COMPARE_OPS:
+            raise FilterSyntaxError(f"字段 {field} 后应为比较运算符, 实际为 {token[1]!r}: {self.expression!r}")
+        return "cmp", field, token[1], self._expect("value")[1]
+
+    def _list(self) -> tuple[Value, ...]:
+        self._expect("op", "[")
+        if self._peek() == ("op", "]"):
+            raise FilterSyntaxError(f"in 的列表不能为空: {self.expression!r}")
+        values = [self._expect("value")[1]]
+        while self._peek() == ("op", ","):
+            self._next()
+            values.append(self._expect("value")[1])
+        self._expect("op", "]")
+        return tuple(values)
+
+
+def negate(node: FilterNode) -> FilterNode:
+    """把 not 下推到比较条件 (德摩根定律), Chroma 的 where 不支持 not"""
+    if node[0] == "cmp":
+        return "cmp", node[1], _NEGATED_OPS[node[2]], node[3]
+    return "or" if node[0] == "and" else "and", [negate(child) for child in node[1]]
+
+
+@lru_cache(maxsize=1024)
+def parse_filter(expression: str) -> FilterNode:
+    """解析过滤表达式, 相同的表达式只解析一次"""
+    if not expression or not expression.strip():
+        raise FilterSyntaxError("过滤表达式不能为空")
+    return _Parser(expression).parse()
+
+
+# ---------------------------------------------------------------------- Chroma
+
+_CHROMA_OPS = {"==": "$eq", "!=": "$ne", ">": "$gt", ">=": "$gte", "<": "$lt", "<=": "$lte", "in": "$in",
+               "not in": "$nin"}
+
+
+def to_chroma_where(node: FilterNode) -> dict:
+    """编译成 Chroma 的 where 字典, Chroma 的 $ne / $nin 本身就包含缺少字段的文档"""
+    if node[0] == "cmp":
+        _, field, op, value = node
+        return {field: {_CHROMA_OPS[op]: list(value) if isinstance(value, tuple) else value}}
+    return {"$" + node[0]: [to_chroma_where(child) for child in node[1]]}
+
+
+# ---------------------------------------------------------------------- Milvus
+
+def _milvus_value(value: Value | tuple) -> str:
+    if isinstance(value, tuple):
+        return "[" + ", ".join(_milvus_value(item) for item in value) + "]"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False)
+    return repr(value)
+
+
+def to_milvus_expr(node: FilterNode) -> str:
+    """编译成 Milvus 的布尔表达式, 字段为 null 的文档满足 != 和 not in"""
+    if node[0] == "cmp":
+        _, field, op, value = node
+        expr = f"{field} {op} {_milvus_value(value)}"
+        return f"({field} is null or {expr})" if op in _MISSING_FIELD_OPS else expr
+    return f" {node[0]} ".join(f"({to_milvus_expr(child)})" for child in node[1])
+
+
+# ---------------------------------------------------------------------- SQLite
+
+def to_sqlite_where(node: FilterNode, column: str = "metadata") -> tuple[str, list]:
+    """编译成 SQLite 的 WHERE 子句和参数, 元数据以 JSON 保存在 column 列中"""
+    if node[0] == "cmp":
+        _, field, op, value = node
+        target = f"json_extract({column}, ?)"
+        if isinstance(value, tuple):
+            placeholders = ", ".join("?" * len(value))
+            sql, params = f"{target} {op.upper()} ({placeholders})", [f"$.{field}", *value]
+        else:
+            sql, params = f"{target} {'=' if op == '==' else op} ?", [f"$.{field}", value]
+        if op in _ORDER_OPS:
+            # SQLite 中字符串大于任何数值, true / false 保存为 1 / 0, 大小比较只保留数值
+            return f"(json_type({column}, ?) IN ('integer', 'real') AND {sql})", [f"$.{field}", *params]
+        if op in _MISSING_FIELD_OPS:
+            # 缺少字段时 json_extract 为 NULL, 与任何值比较的结果都不为真
+            return f"({target} IS NULL OR {sql})", [f"$.{field}", *params]
+        return sql, params
+    parts, params = [], []
+    for child in node[1]:
+        sql, child_params = to_sqlite_where(child, column)
+        parts.append(f"({sql})")
+        params.extend(child_params)
+    return f" {node[0].upper()} ".join(parts), params
+
+
+# ---------------------------------------------------------------------- Python
+
+def _compare(actual: Any, op: str, value: Any) -> bool:
+    if op == "in":
+        return actual in value
+    if op == "not in":
+        return actual not in value
+    if op == "==":
+        return actual == value
+    if op == "!=":
+        return actual != value
+    if isinstance(actual, bool) or isinstance(value, bool):
+        return False
+    try:
+        return {">": actual > value, ">=": actual >= value, "<": actual < value, "<=": actual <= value}[op]
+    except TypeError:
+        return False
+
+
+def matches(node: FilterNode, metadata: dict) -> bool:
+    """判断元数据是否满足过滤条件, 缺少字段的文档只满足 != 和 not in"""
+    if node[0] == "cmp":
+        _, field, op, value = node
+        actual = metadata.get(field)
+        if actual is None:
+            return op in _MISSING_FIELD_OPS
+        return _compare(actual, op, value)
+    if node[0] == "and":
+        return all(matches(child, metadata) for child in node[1])
+    return any(matches(child, metadata) for child in node[1])
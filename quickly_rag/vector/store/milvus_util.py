@@ -1,6 +1,12 @@
 from langchain_milvus import Milvus
+from langchain_core.documents import Document
 from loguru import logger
 
+from quickly_rag.chat.cache.answer_cache import get_answer_cache
+from quickly_rag.enums.vector_enum import VectorStorageType
+from quickly_rag.vector.store.bm25_index import get_bm25_index
+from quickly_rag.vector.store.search_cache import get_search_cache
+
 
 # 1. 封装通用查询方法 (List)
 def list_documents(store: Milvus,
@@ -37,37 +43,60 @@ def list_documents(store: Milvus,
 
 
 # 2. 封装删除方法
+_DELETE_BATCH_SIZE = 1000
+
+
 def delete_documents(store: Milvus,
                      ids: list[str | int] = None,
-                     filter_expr: str = None):
+                     filter_expr: str = None) -> int:
     """
     使用 store.client 删除文档
     支持按 ID 删除，也支持按条件(filter)删除 (MilvusClient 的优势)
+    按条件删除时用 query_iterator 分页查出全部匹配的 pk 再按 ID 删除 (单次 query 最多返回 16384 条),
+    BM25 索引中的同一批文档一起删除
+    Returns:
+        删除的文档数量, 删除失败时记录日志并重新抛出异常
     """
     collection_name = store.collection_name
-
+    deleted = []
     try:
-        if ids:
-            # 方式A: 按 ID 删除
-            logger.info(f"正在从 [{collection_name}] 删除 ID: {ids}")
-            store.client.delete(
-                collection_name=collection_name,
-                ids=ids
-            )
-        elif filter_expr:
-            # 方式B: 按条件删除 (例如 source == 'xxx')
-            logger.info(f"正在从 [{collection_name}] 删除, 条件: {filter_expr}")
-            store.client.delete(
-                collection_name=collection_name,
-                filter=filter_expr
-            )
-        else:
+        if not ids and filter_expr:
+            logger.info(f"正在从 [{collection_name}] 查询待删除的文档, 条件: {filter_expr}")
+            ids = []
+            iterator = store.client.query_iterator(collection_name=collection_name, batch_size=_DELETE_BATCH_SIZE,
+                                                   filter=filter_expr, output_fields=[store._primary_field])
+            try:
+                # 先取完所有 pk 再删除, 避免边遍历边删除影响分页
+                while rows := iterator.next():
+                    ids.extend(row[store._primary_field] for row in rows)
+            finally:
+                iterator.close()
+            if not ids:
+                logger.info("没有满足条件的文档")
+                return 0
+        if not ids:
             logger.warning("删除操作必须提供 ids 或 filter_expr")
-
-        logger.success("删除操作执行完毕")
-
+            return 0
+
+        # 方式A: 按 ID 分批删除
+        logger.info(f"正在从 [{collection_name}] 删除 {len(ids)} 个文档")
+        for i in range(0, len(ids), _DELETE_BATCH_SIZE):
+            batch = ids[i:i + _DELETE_BATCH_SIZE]
+            store.client.delete(collection_name=collection_name, ids=batch)
+            deleted.extend(batch)
     except Exception as e:
         logger.error(f"删除失败: {e}")
+        raise
+    finally:
+        # 已经从 Milvus 删除的文档 (包括中途失败前删除的部分) 同步从 BM25 索引删除,
+        # 之前缓存的检索结果和答案可能引用了已删除的资料
+        if deleted:
+            get_bm25_index(VectorStorageType.MILVUS, collection_name).delete(deleted)
+            get_search_cache().invalidate(VectorStorageType.MILVUS, collection_name)
+            get_answer_cache().invalidate(VectorStorageType.MILVUS, collection_name)
+
+    logger.success("删除操作执行完毕")
+    return len(deleted)
 
 # 根据pk查询方法
 def get_document_by_id(store: Milvus, doc_id: int) -> dict | None:
@@ -92,3 +121,47 @@ def get_document_by_id(store: Milvus, doc_id: int) -> dict | None:
 
 
 
+
+
+# 多个向量一次检索
+def search_by_vectors(store: Milvus,
+                      vectors: list[list[float]],
+                      k: int = 4,
+                      filter_expr: str = "") -> list[list[tuple[Document, float]]]:
+    """
+    使用 store.client 一次请求检索多个向量 (Milvus 原生支持多向量检索)
+    filter_expr 为 Milvus 布尔表达式, 在索引内过滤
+    返回与 vectors 顺序一致的 (文档, 距离) 列表, 与 similarity_search_with_score 的结果格式相同
+    """
+    res = store.client.search(
+        collection_name=store.collection_name,
+        data=vectors,
+        anns_field=store._vector_field,
+        search_params=store.search_params or {},
+        limit=k,
+        filter=filter_expr,
+        output_fields=["*"]
+    )
+    results = []
+    for hits in res:
+        docs = []
+        for hit in hits:
+            entity = dict(hit.get("entity", {}))
+            entity.pop(store._vector_field, None)
+            text = entity.pop(store._text_field, "")
+            docs.append((Document(id=str(hit.get("id")), page_content=text, metadata=entity), hit.get("distance")))
+        results.append(docs)
+    return results
+
+
+# 根据 pk 批量读取向量
+def get_vectors_by_ids(store: Milvus, ids: list[str | int]) -> dict[str, list[float]]:
+    """
+    使用 store.client 读取文档的向量, 返回 {str(pk): 向量}
+    """
+    res = store.client.get(
+        collection_name=store.collection_name,
+        ids=[int(i) if str(i).isdigit() else i for i in ids],
+        output_fields=[store._vector_field]
+    )
+    return {str(row[store._primary_field]): list(row[store._vector_field]) for row in res}
@@ -0,0 +1,59 @@
+"""
+MMR (Maximal Marginal Relevance) 多样性筛选
+文档分块之间有重叠, 检索结果中经常有几段内容几乎相同, 只会浪费提示词的 token
+每一步选择 λ × 相关性 - (1 - λ) × 与已选片段的最大相似度 最高的片段, 与已选片段过于相似的片段直接丢弃
+检索参数 mmr_lambda 不为空时才会执行 (默认关闭): 每次检索多一次读取片段向量的请求 (读取不到时调用嵌入模型),
+没有重排分数时还要计算一次问题向量, 并且结果的顺序会改变
+"""
+import numpy as np
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def mmr_select(vectors: np.ndarray,
+               relevance: np.ndarray,
+               k: int,
+               lambda_mult: float = 0.7,
+               duplicate_threshold: float = 1.0) -> list[int]:
+    """
+    按 MMR 选择片段
+    Args:
+        vectors: 候选片段的向量, 形状为 (n, d)
+        relevance: 候选片段与问题的相关性, 形状为 (n,), 越大越相关
+        k: 最多选择的数量
+        lambda_mult: 相关性的权重, 1 表示只看相关性, 0 表示只看多样性
+        duplicate_threshold: 与已选片段的余弦相似度不小于该值的片段不再选择
+    Returns:
+        被选中片段的下标, 按选择顺序排列
+    """
+    n = len(vectors)
+    if n == 0 or k <= 0:
+        return []
+    unit = _normalize(np.asarray(vectors, dtype=np.float32))
+    similarity = unit @ unit.T
+    relevance = np.asarray(relevance, dtype=np.float32)
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[:, selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < k:
+        available &= max_similarity < duplicate_threshold
+        if not available.any():
+            break
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        chosen = int(np.argmax(scores))
+        selected.append(chosen)
+        available[chosen] = False
+        np.maximum(max_similarity, similarity[:, chosen], out=max_similarity)
+    return selected
+
+
+def cosine_relevance(vectors: np.ndarray, query_vector: np.ndarray) -> np.ndarray:
+    """候选片段与问题向量的余弦相似度"""
+    return _normalize(np.asarray(vectors, dtype=np.float32)) @ _normalize(np.asarray(query_vector, dtype=np.float32))
@@ -0,0 +1,335 @@
+"""
+NumPy 暴力检索向量库
+向量归一化后量化为 float16 或 int8 (每行一个缩放系数), 保存为连续的 .npy 矩阵并以 mmap 方式加载
+检索为分块的矩阵-向量乘法 + argpartition, 没有索引结构, 适合十万级以内的语料
+
+向量按段 (segment) 保存, 每段的文件写入后不再修改:
+1. 每次写入只新建一个段, 相邻两段大小接近时合并 (类似二进制计数), 入库的总 I/O 为 O(N log N)
+2. manifest.json 记录当前有效的段, 写完新段后整体替换 manifest, 其他进程要么看到旧的一组段, 要么看到新的一组段
+"""
+import json
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from loguru import logger
+
+from quickly_rag.enums.vector_enum import VectorQuantization
+from quickly_rag.vector.store.metadata_filter import parse_filter, to_sqlite_where
+from quickly_rag.vector.store.sqlite_docstore import SqliteDocstore
+
+
+class _Segment:
+    """一段向量: 量化后的向量、int8 每行的缩放系数、行对应的文档 row_id (递增)"""
+    __slots__ = ("name", "vectors", "scales", "row_ids")
+
+    def __init__(self, name: str, vectors: np.ndarray, scales: Optional[np.ndarray], row_ids: np.ndarray):
+        self.name = name
+        self.vectors = vectors
+        self.scales = scales
+        self.row_ids = row_ids
+
+    def __len__(self) -> int:
+        return len(self.row_ids)
+
+
+class QuicklyNumpyStore(VectorStore):
+    """
+    基于 NumPy 矩阵的 LangChain VectorStore 实现, 分数为余弦相似度 (越大越相似)
+    目录结构: manifest.json (当前有效的段) + 每段的 {段名}vectors.npy / {段名}scales.npy / {段名}row_ids.npy
+             + docstore.db (文档内容)
+    写入由一个进程负责, 其他进程检测到 manifest 更新后重新加载
+    """
+
+    _MANIFEST_FILE = "manifest.json"
+    _VECTORS_SUFFIX = "vectors.npy"
+    _SCALES_SUFFIX = "scales.npy"
+    _ROW_IDS_SUFFIX = "row_ids.npy"
+    _DOCSTORE_FILE = "docstore.db"
+    _FORMAT_VERSION = 1
+    # 每次参与乘法的行数, 限制反量化时临时 float32 矩阵的大小
+    _BLOCK_ROWS = 16384
+    # 检查其他进程是否更新了 manifest 的最小间隔(秒)
+    _RELOAD_CHECK_SECONDS = 1.0
+
+    def __init__(self, embedding: Embeddings, persist_dir: str | Path,
+                 quantization: VectorQuantization = VectorQuantization.FLOAT16):
+        """
+        Args:
+            embedding: 嵌入模型
+            persist_dir: 向量和文档的保存目录
+            quantization: 向量的保存精度 FLOAT16 (内存减半) 或 INT8 (内存为 float32 的四分之一)
+        """
+        self.embedding = embedding
+        self.persist_dir = Path(persist_dir)
+        self.quantization = quantization
+        self.persist_dir.mkdir(parents=True, exist_ok=True)
+
+        # 当前的 (段列表, 全部段的 row_id); 整体替换, 检索时取一次引用即可在锁外计算
+        self._state: tuple[tuple[_Segment, ...], np.ndarray] = ((), np.empty(0, dtype=np.int64))
+        self._manifest_mtime = 0
+        self._checked_at = 0.0
+        # 只保护写入和重新加载, 检索不持有
+        self._lock = threading.RLock()
+        self.docstore = SqliteDocstore(self.persist_dir / self._DOCSTORE_FILE)
+        self._load()
+
+    # ------------------------------------------------------------------ 文件
+
+    def _path(self, name: str) -> Path:
+        return self.persist_dir / name
+
+    def _read_manifest(self) -> Optional[dict]:
+        manifest_path = self._path(self._MANIFEST_FILE)
+        if manifest_path.exists():
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        # 旧版本只有一组 vectors.npy / scales.npy / row_ids.npy, 作为段名为空的一段读取
+        if self._path(self._VECTORS_SUFFIX).exists():
+            return {"quantization": self.quantization.value, "segments": [""]}
+        return None
+
+    def _load_segment(self, name: str) -> _Segment:
+        vectors = np.load(self._path(name + self._VECTORS_SUFFIX), mmap_mode="r")
+        scales_path = self._path(name + self._SCALES_SUFFIX)
+        scales = np.load(scales_path, mmap_mode="r") if scales_path.exists() else None
+        return _Segment(name, vectors, scales, np.load(self._path(name + self._ROW_IDS_SUFFIX), mmap_mode="r"))
+
+    def _load(self) -> None:
+        """按 manifest 以 mmap 方式加载全部段, 多个进程共享操作系统页缓存"""
+        with self._lock:
+            manifest_path = self._path(self._MANIFEST_FILE)
+            mtime = manifest_path.stat().st_mtime_ns if manifest_path.exists() else 0
+            manifest = self._read_manifest()
+            if manifest is None:
+                return
+            if manifest["quantization"] != self.quantization.value:
+                raise ValueError(f"向量文件精度为 {manifest['quantization']}, 与配置的 {self.quantization.value} 不一致: "
+                                 f"{self.persist_dir}")
+            self._set_segments(tuple(self._load_segment(name) for name in manifest["segments"]))
+            self._manifest_mtime = mtime
+            logger.info(f"[NumpyStore] 已加载 {self.index_size()} 个向量, {len(manifest['segments'])} 段 "
+                        f"({self.quantization.value}): {self.persist_dir}")
+
+    def _set_segments(self, segments: tuple[_Segment, ...]) -> None:
+        row_ids = np.concatenate([np.asarray(segment.row_ids) for segment in segments]) if segments \
+            else np.empty(0, dtype=np.int64)
+        self._state = (segments, row_ids)
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self._RELOAD_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        try:
+            mtime = self._path(self._MANIFEST_FILE).stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._manifest_mtime:
+            self._load()
+
+    def _write_segment(self, vectors: np.ndarray, scales: Optional[np.ndarray], row_ids: np.ndarray) -> str:
+        """写入一个新段 (文件名唯一, manifest 引用它之前不会被读取), 返回段名"""
+        name = f"seg-{uuid.uuid4().hex}-"
+        arrays = [(self._ROW_IDS_SUFFIX, row_ids), (self._VECTORS_SUFFIX, vectors)]
+        if scales is not None:
+            arrays.append((self._SCALES_SUFFIX, scales))
+        for suffix, array in arrays:
+            with open(self._path(name + suffix), "wb") as f:
+                np.save(f, array)
+        return name
+
+    def _commit_segments(self, names: List[str], replaced: Iterable[str]) -> None:
+        """替换 manifest 使新的一组段生效, 再删除不再引用的段文件"""
+        tmp_path = self._path(self._MANIFEST_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self._FORMAT_VERSION, "quantization": self.quantization.value, "segments": names}, f)
+        tmp_path.replace(self._path(self._MANIFEST_FILE))
+        self._load()
+        for name in set(replaced) - set(names):
+            for suffix in (self._VECTORS_SUFFIX, self._SCALES_SUFFIX, self._ROW_IDS_SUFFIX):
+                try:
+                    # 已经 mmap 旧文件的进程不受影响 (Windows 上文件被占用时留到下次)
+                    self._path(name + suffix).unlink(missing_ok=True)
+                except OSError as e:
+                    logger.debug(f"[NumpyStore] 旧段文件暂时无法删除: {e}")
+
+    def _merge(self, segments: List[_Segment]) -> tuple[np.ndarray, Optional[np.ndarray], np.ndarray]:
+        vectors = np.concatenate([np.asarray(segment.vectors) for segment in segments])
+        row_ids = np.concatenate([np.asarray(segment.row_ids) for segment in segments])
+        scales = np.concatenate([np.asarray(segment.scales) for segment in segments]) \
+            if segments[0].scales is not None else None
+        return vectors, scales, row_ids
+
+    # ------------------------------------------------------------------ 量化
+
+    def _quantize(self, matrix: np.ndarray) -> tuple[np.ndarray, Optional[np.ndarray]]:
+        if self.quantization == VectorQuantization.INT8:
+            scales = np.abs(matrix).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return matrix.astype(np.float16), None
+
+    @staticmethod
+    def _normalize(vectors: List[List[float]]) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _scores(self, segments: tuple[_Segment, ...], total: int, queries: np.ndarray) -> np.ndarray:
+        """分块反量化并计算与问题向量的内积, 返回 (向量数量, 问题数量) 的分数矩阵"""
+        scores = np.empty((total, len(queries)), dtype=np.float32)
+        offset = 0
+        for segment in segments:
+            for start in range(0, len(segment), self._BLOCK_ROWS):
+                block = np.asarray(segment.vectors[start:start + self._BLOCK_ROWS], dtype=np.float32)
+                scores[offset + start:offset + start + len(block)] = block @ queries.T
+            if segment.scales is not None:
+                scores[offset:offset + len(segment)] *= np.asarray(segment.scales)[:, None]
+            offset += len(segment)
+        return scores
+
+    # ------------------------------------------------------------------ VectorStore
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    def index_size(self) -> int:
+        """向量数量"""
+        return len(self._state[1])
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  *, ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = [doc_id or str(uuid.uuid4()) for doc_id in ids] if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors, scales = self._quantize(self._normalize(self.embedding.embed_documents(texts)))
+
+        with self._lock, self.docstore.transaction():
+            row_ids = np.asarray(self.docstore.add(ids, texts, metadatas), dtype=np.int64)
+            segments = list(self._state[0])
+            if segments and segments[0].vectors.shape[1] != vectors.shape[1]:
+                raise ValueError(f"向量维度 {vectors.shape[1]} 与已有向量的维度 {segments[0].vectors.shape[1]} 不一致")
+            # 新的一批向量写成一段; 前一段不比它大时合并, 段的数量保持在 O(log N)
+            replaced = []
+            while segments and len(segments[-1]) <= len(row_ids):
+                previous = segments.pop()
+                replaced.append(previous.name)
+                previous_vectors, previous_scales, previous_row_ids = self._merge([previous])
+                vectors = np.concatenate([previous_vectors, vectors])
+                row_ids = np.concatenate([previous_row_ids, row_ids])
+                if scales is not None:
+                    scales = np.concatenate([previous_scales, scales])
+            name = self._write_segment(vectors, scales, row_ids)
+            self._commit_segments([segment.name for segment in segments] + [name], replaced)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """按文档 id 删除, 只重写包含被删除文档的段"""
+        if not ids:
+            return False
+        with self._lock:
+            deleted = self.docstore.delete(ids)
+            segments = self._state[0]
+            if not deleted or not segments:
+                return True
+            names, replaced = [], []
+            for segment in segments:
+                keep = ~np.isin(segment.row_ids, deleted)
+                if keep.all():
+                    names.append(segment.name)
+                    continue
+                replaced.append(segment.name)
+                if keep.any():
+                    vectors, scales, row_ids = self._merge([segment])
+                    names.append(self._write_segment(vectors[keep], scales[keep] if scales is not None else None,
+                                                     row_ids[keep]))
+            self._commit_segments(names, replaced)
+        return True
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vectors([embedding], k, **kwargs)[0]
+
+    def similarity_search_with_score_by_vectors(self, embeddings: List[List[float]], k: int = 4,
+                                                **kwargs: Any) -> List[List[Tuple[Document, float]]]:
+        """
+        多个问题向量一次矩阵乘法完成检索, 返回与 embeddings 顺序一致的结果
+        kwargs 中的 filter 为元数据过滤表达式 (字符串或 parse_filter 的结果), 不满足条件的行分数置为 -inf
+        """
+        self._maybe_reload()
+        # 只取一次当前段的引用, 写入时整体替换, 矩阵乘法在锁外执行, 并发检索互不阻塞
+        segments, row_ids = self._state
+        if not len(row_ids) or k <= 0:
+            return [[] for _ in embeddings]
+        scores = self._scores(segments, len(row_ids), self._normalize(embeddings))
+        candidates = len(scores)
+        filter_node = kwargs.get("filter")
+        if filter_node is not None:
+            filter_node = parse_filter(filter_node) if isinstance(filter_node, str) else filter_node
+            mask = np.isin(row_ids, self.docstore.filter_row_ids(*to_sqlite_where(filter_node)))
+            scores[~mask] = -np.inf
+            candidates = int(mask.sum())
+        k = min(k, candidates)
+        if k <= 0:
+            return [[] for _ in embeddings]
+        # argpartition 取出每个问题的 top-k (O(n)), 只对这 k 个排序
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+        hits_per_query = []
+        for column in range(scores.shape[1]):
+            column_top = top[:, column]
+            column_top = column_top[np.argsort(-scores[column_top, column])]
+            hits_per_query.append([(int(row_ids[i]), float(scores[i, column])) for i in column_top])
+        documents = self.docstore.get(list({row_id for hits in hits_per_query for row_id, _ in hits}))
+        return [[(documents[row_id], score) for row_id, score in hits if row_id in documents]
+                for hits in hits_per_query]
+
+    def get_vectors_by_ids(self, ids: List[str]) -> dict[str, List[float]]:
+        """按文档 id 读取反量化后的向量 (已归一化)"""
+        segments, _ = self._state
+        row_ids = self.docstore.row_ids(ids)
+        vectors = {}
+        for segment in segments:
+            # row_id 自增写入, 合并和删除时保持顺序, 可以在每一段中二分查找所在的行
+            positions = np.searchsorted(segment.row_ids, list(row_ids.values()))
+            for doc_id, row_id, position in zip(row_ids, row_ids.values(), positions):
+                if position < len(segment) and segment.row_ids[position] == row_id:
+                    vector = np.asarray(segment.vectors[position], dtype=np.float32)
+                    if segment.scales is not None:
+                        vector *= segment.scales[position]
+                    vectors[doc_id] = vector.tolist()
+        return vectors
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   *, ids: Optional[List[str]] = None, **kwargs: Any) -> "QuicklyNumpyStore":
+        store = cls(embedding=embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    def close(self) -> None:
+        self.docstore.close()
@@ -0,0 +1,132 @@
+"""
+检索结果缓存
+缓存 search_by_scores 最终的 VectorSearchResult 列表, 键中包含集合的版本号
+文档入库或删除时版本号加一, 旧版本的缓存自然不再命中, 不会返回过时的结果
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+from quickly_rag.config.document_config import default_search_cache_size, default_search_cache_ttl_seconds
+from quickly_rag.core.search_base import VectorSearchParams, VectorSearchResult
+from quickly_rag.enums.vector_enum import VectorStorageType
+from quickly_rag.provider.embedding_cache import normalize_query
+
+
+class CollectionVersions:
+    """进程内记录每个 (向量库类型, 集合) 的数据版本"""
+
+    def __init__(self):
+        self._versions: dict[tuple[VectorStorageType, str], int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, vectorstore_type: VectorStorageType, collection_name: str) -> int:
+        return self._versions.get((vectorstore_type, collection_name), 0)
+
+    def bump(self, vectorstore_type: VectorStorageType, collection_name: str) -> int:
+        """集合数据发生变化, 版本号加一并返回新的版本号"""
+        with self._lock:
+            version = self._versions.get((vectorstore_type, collection_name), 0) + 1
+            self._versions[(vectorstore_type, collection_name)] = version
+            return version
+
+
+# 联邦检索缓存键的标记, 与普通检索的缓存键区分
+_FEDERATED = object()
+
+
+class SearchResultCache:
+    """检索结果的 LRU + TTL 缓存"""
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 600):
+        """
+        Args:
+            max_entries: 最多缓存的检索结果数量, 0 表示不缓存
+            ttl_seconds: 检索结果的有效期(秒)
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.versions = CollectionVersions()
+        self._entries: OrderedDict[tuple, tuple[float, list[VectorSearchResult]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def make_key(self, search_params: VectorSearchParams, collection_name: str) -> tuple:
+        return (
+            normalize_query(search_params.query),
+            search_params.top_k,
+            search_params.score,
+            search_params.filter_strategy,
+            search_params.vectorstore_type,
+            collection_name,
+            self.versions.get(search_params.vectorstore_type, collection_name),
+            search_params.hybrid,
+            search_params.rerank_oversample,
+            search_params.rerank_max_documents,
+            search_params.rerank_skip_gap,
+            search_params.mmr_lambda,
+            search_params.mmr_top_k,
+            search_params.mmr_duplicate_threshold,
+            search_params.filter_expr,
+        )
+
+    def make_federated_key(self, search_params: VectorSearchParams,
+                           targets: list[tuple[VectorStorageType, str]]) -> tuple:
+        """联邦检索的缓存键, 包含每个目标集合的版本号, 任意一个集合变化后都不再命中"""
+        return (_FEDERATED, self.make_key(search_params, ""),
+                tuple((vectorstore_type, collection_name, self.versions.get(vectorstore_type, collection_name))
+                      for vectorstore_type, collection_name in targets))
+
+    @staticmethod
+    def _key_uses(key: tuple, vectorstore_type: VectorStorageType, collection_name: str) -> bool:
+        if key[0] is _FEDERATED:
+            return any(target[0] == vectorstore_type and target[1] == collection_name for target in key[2])
+        return key[4] == vectorstore_type and key[5] == collection_name
+
+    def get(self, key: tuple) -> Optional[list[VectorSearchResult]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return [result.model_copy() for result in entry[1]]
+
+    def put(self, key: tuple, results: list[VectorSearchResult]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), [result.model_copy() for result in results])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, vectorstore_type: VectorStorageType, collection_name: str) -> None:
+        """集合数据发生变化: 版本号加一, 并丢弃该集合旧版本的缓存"""
+        self.versions.bump(vectorstore_type, collection_name)
+        with self._lock:
+            for key in [k for k in self._entries if self._key_uses(k, vectorstore_type, collection_name)]:
+                del self._entries[key]
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 4) if total else 0.0,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_search_cache() -> SearchResultCache:
+    """获取进程内共享的检索结果缓存"""
+    return SearchResultCache(max_entries=default_search_cache_size, ttl_seconds=default_search_cache_ttl_seconds)
@@ -0,0 +1,132 @@
+"""
+本地向量库共用的 SQLite 文档库
+向量索引只保存整数 id, 文档内容和元数据按 id 保存在这里, 检索时只读取 top-k 对应的行
+"""
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterator, List, Sequence
+
+from langchain_core.documents import Document
+
+# 单条语句绑定参数数量的上限, 旧版本 SQLite 的 SQLITE_MAX_VARIABLE_NUMBER 默认为 999
+_MAX_VARIABLES = 500
+
+
+def _chunks(values: Sequence, size: int = _MAX_VARIABLES) -> Iterator[Sequence]:
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+class SqliteDocstore:
+    """
+    以自增整数 row_id 对应索引中向量 id 的文档库
+    每个线程复用自己的连接, WAL 模式下多个进程可以同时读取
+    所有线程的连接都登记在 _conns 中, close() 时一起关闭
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._conns: set[sqlite3.Connection] = set()
+        self._conns_lock = threading.Lock()
+        conn = self._conn()
+        with conn:
+            conn.execute("""
+                         CREATE TABLE IF NOT EXISTS documents
+                         (
+                             row_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+                             doc_id   TEXT NOT NULL UNIQUE,
+                             text     TEXT NOT NULL,
+                             metadata TEXT
+                         )
+                         """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # close() 之后线程里残留的连接已经关闭, 不在 _conns 中, 重新建立
+        if conn is None or conn not in self._conns:
+            # 连接只在创建它的线程中使用, 关闭可能发生在其他线程, 因此关闭同线程检查
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._conns_lock:
+                self._conns.add(conn)
+            self._local.conn = conn
+        return conn
+
+    def transaction(self) -> sqlite3.Connection:
+        """
+        当前线程的连接, 作为上下文管理器使用: 正常退出时提交, 出现异常时回滚
+        写入索引的代码放在同一个事务中, 索引写入失败时文档一起回滚
+        """
+        return self._conn()
+
+    def add(self, doc_ids: List[str], texts: List[str], metadatas: List[dict]) -> List[int]:
+        """写入文档 (在 transaction() 中调用), 返回对应的 row_id"""
+        conn = self._conn()
+        row_ids = []
+        for doc_id, text, metadata in zip(doc_ids, texts, metadatas):
+            cursor = conn.execute("INSERT INTO documents (doc_id, text, metadata) VALUES (?, ?, ?)",
+                                  (doc_id, text, json.dumps(metadata, ensure_ascii=False, default=str)))
+            row_ids.append(cursor.lastrowid)
+        return row_ids
+
+    def get(self, row_ids: List[int]) -> dict[int, Document]:
+        """按 row_id 读取文档, 已删除的 row_id 不会出现在结果中"""
+        conn = self._conn()
+        rows = []
+        for chunk in _chunks(row_ids):
+            placeholders = ",".join("?" * len(chunk))
+            rows.extend(conn.execute(
+                f"SELECT row_id, doc_id, text, metadata FROM documents WHERE row_id IN ({placeholders})",
+                chunk).fetchall())
+        return {row_id: Document(id=doc_id, page_content=text, metadata=json.loads(metadata) if metadata else {})
+                for row_id, doc_id, text, metadata in rows}
+
+    def row_ids(self, doc_ids: List[str]) -> dict[str, int]:
+        """文档 id 对应的 row_id, 不存在的文档不会出现在结果中"""
+        conn = self._conn()
+        result = {}
+        for chunk in _chunks(doc_ids):
+            placeholders = ",".join("?" * len(chunk))
+            result.update(conn.execute(f"SELECT doc_id, row_id FROM documents WHERE doc_id IN ({placeholders})",
+                                       chunk).fetchall())
+        return result
+
+    def count(self) -> int:
+        """文档数量"""
+        return self._conn().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def filter_row_ids(self, where: str, params: list) -> List[int]:
+        """满足 WHERE 条件 (metadata_filter.to_sqlite_where 的编译结果) 的文档 row_id"""
+        rows = self._conn().execute(f"SELECT row_id FROM documents WHERE {where}", params).fetchall()
+        return [row[0] for row in rows]
+
+    def filter_doc_ids(self, where: str, params: list) -> List[str]:
+        """满足 WHERE 条件的文档 id, 按条件删除前先取出 id"""
+        rows = self._conn().execute(f"SELECT doc_id FROM documents WHERE {where}", params).fetchall()
+        return [row[0] for row in rows]
+
+    def delete(self, doc_ids: List[str]) -> List[int]:
+        """按文档 id 删除, 返回被删除文档的 row_id"""
+        conn = self._conn()
+        rows = []
+        # 分批执行但放在同一个事务中, 要么全部删除要么全部回滚
+        with conn:
+            for chunk in _chunks(doc_ids):
+                placeholders = ",".join("?" * len(chunk))
+                rows.extend(conn.execute(f"SELECT row_id FROM documents WHERE doc_id IN ({placeholders})",
+                                         chunk).fetchall())
+                conn.execute(f"DELETE FROM documents WHERE doc_id IN ({placeholders})", chunk)
+        return [row[0] for row in rows]
+
+    def close(self) -> None:
+        """关闭所有线程的连接, 之后再使用时各线程重新建立连接"""
+        with self._conns_lock:
+            conns, self._conns = self._conns, set()
+        for conn in conns:
+            conn.close()
+        self._local.conn = None
@@ -1,11 +1,46 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+
+import numpy as np
+from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_milvus import Milvus
 from loguru import logger
 
+from quickly_rag.chat.cache.answer_cache import get_answer_cache
+from quickly_rag.config.document_config import default_rrf_k, default_async_search_workers, \
+    default_federated_search_workers
 from quickly_rag.config.vector_config import default_embedding_database_type
-from quickly_rag.core.search_base import VectorSearchResult, VectorSearchParams
+from quickly_rag.core.search_base import VectorSearchResult, VectorSearchParams, VectorSearchTarget
 from quickly_rag.enums.vector_enum import VectorStorageType
+from quickly_rag.provider.embedding_model_provider import QuicklyEmbeddingModelProvider
+from quickly_rag.provider.rerank_cache import get_rerank_cache
 from quickly_rag.provider.reranker_provider import QuicklyRerankerProvider
-from quickly_rag.provider.vector_store_provider import QuicklyVectorStoreProvider
+from quickly_rag.provider.vector_store_provider import QuicklyVectorStoreProvider, get_vector_store_registry
+from quickly_rag.vector.store.adaptive_rerank import candidate_count, should_skip_rerank, rerank_documents, \
+    get_rerank_stats
+from quickly_rag.vector.store.bm25_index import get_bm25_index
+from quickly_rag.vector.store.faiss_store import QuicklyFaissStore
+from quickly_rag.vector.store.milvus_util import search_by_vectors as search_milvus_by_vectors, \
+    get_vectors_by_ids as get_milvus_vectors_by_ids, delete_documents as delete_milvus_documents
+from quickly_rag.vector.store.metadata_filter import FilterNode, parse_filter, to_chroma_where, to_milvus_expr, \
+    to_sqlite_where
+from quickly_rag.vector.store.mmr import mmr_select, cosine_relevance
+from quickly_rag.vector.store.numpy_store import QuicklyNumpyStore
+from quickly_rag.vector.store.search_cache import get_search_cache
+
+# 多路召回并行执行使用的线程池
+_search_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="quickly-rag-search")
+# 异步检索中阻塞调用使用的线程池, 大小固定, 并发请求再多也不会无限占用线程
+_async_search_executor = ThreadPoolExecutor(max_workers=default_async_search_workers,
+                                            thread_name_prefix="quickly-rag-async-search")
+# 联邦检索同时查询多个集合使用的线程池, 与 _search_executor 分开, 避免各集合内部提交的 BM25 检索等待自己
+_federated_executor = ThreadPoolExecutor(max_workers=default_federated_search_workers,
+                                         thread_name_prefix="quickly-rag-federated-search")
 
 
 # 将输入数据转换为文档对象列表
@@ -22,77 +57,177 @@ def _normalize_documents(documents: list[Document] | Document | str) -> list[Doc
 
 # 获取向量存储库
 def get_vectorstore_model(
-        vectorstore_type: VectorStorageType = default_embedding_database_type) -> QuicklyVectorStoreProvider:
-    return QuicklyVectorStoreProvider(vectorstore_type)
+        vectorstore_type: VectorStorageType = default_embedding_database_type,
+        collection_name: str = None) -> QuicklyVectorStoreProvider:
+    return get_vector_store_registry().get(vectorstore_type, collection_name)
 
 
-# 只用来存储向量 可以传入存储库的类型 默认使用默认的向量存储库
+# 只用来存储向量 可以传入存储库的类型和集合名称 默认使用默认的向量存储库和集合
 def store_vector_by_documents(documents: list[Document] | Document | str,
-                              vectorstore_type: VectorStorageType = default_embedding_database_type) -> QuicklyVectorStoreProvider:
-    vectorstore_model = get_vectorstore_model(vectorstore_type)
+                              vectorstore_type: VectorStorageType = default_embedding_database_type,
+                              collection_name: Optional[str] = None) -> QuicklyVectorStoreProvider:
+    vectorstore_model = get_vectorstore_model(vectorstore_type, collection_name)
     normalized_docs = _normalize_documents(documents)
 
     # 对文档进行分批处理，每批最多32个文档，避免超过Milvus的限制
     batch_size = 256
+    stored_ids = []
     for i in range(0, len(normalized_docs), batch_size):
         batch_docs = normalized_docs[i:i + batch_size]
-        vectorstore_model.vector_store.add_documents(batch_docs)
-        print(
+        stored_ids.extend(vectorstore_model.vector_store.add_documents(batch_docs))
+        logger.info(
             f"已存储文档批次 {i // batch_size + 1}/{(len(normalized_docs) - 1) // batch_size + 1}，包含 {len(batch_docs)} 个文档")
+    if isinstance(vectorstore_model.vector_store, QuicklyFaissStore):
+        # FAISS 索引文件按时间间隔保存, 全部批次写完后立即保存一次
+        vectorstore_model.vector_store.flush()
+
+    # 同步写入 BM25 关键词索引, 供混合检索使用
+    get_bm25_index(vectorstore_type, vectorstore_model.vector_store_collection_name).add_documents(
+        normalized_docs, stored_ids)
 
+    # 文档变化后, 之前缓存的检索结果和答案可能已经过时
+    get_search_cache().invalidate(vectorstore_type, vectorstore_model.vector_store_collection_name)
+    get_answer_cache().invalidate(vectorstore_type, vectorstore_model.vector_store_collection_name)
     return vectorstore_model
 
 
+# 删除文档 可以按 id 删除, 也可以按元数据过滤表达式删除, 向量库、BM25 索引和缓存一起更新
+def delete_vector_documents(ids: list[str] = None,
+                            filter_expr: str = None,
+                            vectorstore_type: VectorStorageType = default_embedding_database_type,
+                            collection_name: str = None) -> None:
+    """
+    Args:
+        ids: 文档在向量库中的 id
+        filter_expr: 元数据过滤表达式 (metadata_filter 的语法), 先查出匹配的文档 id 再删除
+        vectorstore_type: 向量存储库类型
+        collection_name: 集合名称, 为空时使用默认集合
+    """
+    if not ids and not filter_expr:
+        logger.warning("删除操作必须提供 ids 或 filter_expr")
+        return
+    vectorstore_model = get_vectorstore_model(vectorstore_type, collection_name)
+    vector_store = vectorstore_model.vector_store
+    filter_node = parse_filter(filter_expr) if filter_expr and not ids else None
+    if isinstance(vector_store, Milvus):
+        # Milvus 的删除方法会同步删除 BM25 索引并清理缓存
+        delete_milvus_documents(vector_store, ids=ids,
+                                filter_expr=to_milvus_expr(filter_node) if filter_node is not None else None)
+        return
+
+    if filter_node is not None:
+        if isinstance(vector_store, (QuicklyFaissStore, QuicklyNumpyStore)):
+            ids = vector_store.docstore.filter_doc_ids(*to_sqlite_where(filter_node))
+        elif isinstance(vector_store, Chroma):
+            ids = vector_store._collection.get(where=to_chroma_where(filter_node), include=[])["ids"]
+        else:
+            raise ValueError(f"{type(vector_store).__name__} 不支持按条件删除")
+    if ids:
+        vector_store.delete(ids)
+        if isinstance(vector_store, QuicklyFaissStore):
+            vector_store.flush()
+    bm25_index = get_bm25_index(vectorstore_type, vectorstore_model.vector_store_collection_name)
+    removed = bm25_index.delete(ids or [])
+    if filter_node is not None:
+        # 同一个条件再删除一次, 没有记录向量库 id 的 BM25 文档也会被删除
+        removed += len(bm25_index.delete_where(filter_node))
+    if not ids and not removed:
+        logger.info("没有满足条件的文档")
+        return
+
+    # 文档被删除后, 之前缓存的检索结果和答案可能引用了已删除的资料
+    get_search_cache().invalidate(vectorstore_type, vectorstore_model.vector_store_collection_name)
+    get_answer_cache().invalidate(vectorstore_type, vectorstore_model.vector_store_collection_name)
+    logger.info(f"已从 {vectorstore_type.value}/{vectorstore_model.vector_store_collection_name} 删除 "
+                f"{len(ids or [])} 个文档")
+
+
 # 将重排模型和向量检索的结果合并格式化
 def format_vectorstore_result(is_ranker: bool, ranker_arr: list[dict], scores: list[tuple[Document, float]]) -> list[VectorSearchResult]:
     results = []
     if is_ranker:
         for i in ranker_arr:
-            results.append(VectorSearchResult(text=i['document'].get('text'), relevance_score=i['relevance_score'],
-                                              score=scores[int(i['index'])][1]))
+            # 重排请求不返回文档内容, 按 index 对应回召回的候选文档
+            doc, score = scores[int(i['index'])]
+            results.append(VectorSearchResult(text=doc.page_content, relevance_score=i['relevance_score'], score=score))
     else:
         for i in scores:
             results.append(VectorSearchResult(text=i[0].page_content, relevance_score=0, score=i[1]))
     return results
 
 
-# 根据传入的字段名(target_field)动态过滤结果
+# 根据传入的字段名(target_field)动态过滤结果, 没有该分数的结果 (只被 BM25 召回的文档没有向量分数) 不参与过滤
 def filter_results_dynamic(results: list[VectorSearchResult],
                            threshold: float,
                            target_field: str) -> list[VectorSearchResult]:
     filtered_data = []
     for res in results:
         val = getattr(res, target_field, 0.0)
-        if val >= threshold:
+        if val is None or val >= threshold:
             filtered_data.append(res)
     return filtered_data
 
 
-# 向量检索的方法, 但是因为直接检索效果不好, 但是用算法优化又会有其他的开销, 但是不优化了
-def search_by_scores(search_params :VectorSearchParams) -> list[VectorSearchResult]:
-    vectorstore_model = get_vectorstore_model(search_params.vectorstore_type)
+# 将多路召回的结果按排名用 RRF (Reciprocal Rank Fusion) 融合
+def reciprocal_rank_fusion(result_lists: list[list[tuple[Document, float]]], k: int,
+                           rrf_k: int = default_rrf_k) -> list[tuple[Document, Optional[float]]]:
+    """
+    RRF 融合, 文档按内容去重, 融合分数 = Σ 1 / (rrf_k + 排名)
+    返回的分数沿用第一路 (向量检索) 的分数, 只出现在其他路的文档没有向量分数, 为 None
+    (向量库的分数可能是距离也可能是相似度, 任何固定的数值都会被分数过滤误判)
+    """
+    fused: dict[str, float] = {}
+    documents: dict[str, tuple[Document, Optional[float]]] = {}
+    for list_index, results in enumerate(result_lists):
+        for rank, (doc, score) in enumerate(results, start=1):
+            key = doc.page_content
+            fused[key] = fused.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            if key not in documents:
+                documents[key] = (doc, score if list_index == 0 else None)
+    ranked = sorted(fused, key=fused.get, reverse=True)[:k]
+    return [documents[key] for key in ranked]
 
-    # 如果你想使用带有文本过滤的混合搜索，可以使用如下表达式：
-    scores = vectorstore_model.vector_store.similarity_search_with_score(
-        search_params.query,
-        k=search_params.top_k,
-        # expr='text like "%%大数据%%" and text like "%%应用%%" '  # 正确的LIKE语法  ---->暂时不用
-    )
 
-    # 使用重排模型查询 防止重排模型未配置时会查询报错
-    is_ranker = False
-    ranker_arr = []
-    try:
-        reranker = QuicklyRerankerProvider()
-        documents = [doc.page_content for doc, score in scores]
+# 解析检索参数中的元数据过滤表达式
+def _parse_search_filter(search_params: VectorSearchParams) -> Optional[FilterNode]:
+    return parse_filter(search_params.filter_expr) if search_params.filter_expr else None
 
-        if len(documents) > 0:
-            ranker_arr = reranker.rerank(search_params.query, documents, top_n=search_params.top_k)
-            is_ranker = True
-    except Exception as e:
-        is_ranker = False
-        logger.warning(f"重排模型查询出错-使用默认召回查询: {e}")
 
+# 把过滤条件编译成各向量库检索方法的参数, 在索引内完成过滤
+def _filter_kwargs(vector_store: VectorStore, filter_node: Optional[FilterNode]) -> dict:
+    if filter_node is None:
+        return {}
+    if isinstance(vector_store, Milvus):
+        return {"expr": to_milvus_expr(filter_node)}
+    if isinstance(vector_store, Chroma):
+        return {"filter": to_chroma_where(filter_node)}
+    if isinstance(vector_store, (QuicklyFaissStore, QuicklyNumpyStore)):
+        return {"filter": filter_node}
+    raise ValueError(f"{type(vector_store).__name__} 不支持元数据过滤")
+
+
+# 召回候选文档: 向量检索, 开启混合检索时并行执行 BM25 检索并融合
+# 返回 (候选文档, 向量检索结果), 向量检索结果用于判断是否可以跳过重排
+def _retrieve_candidates(vectorstore_model: QuicklyVectorStoreProvider, search_params: VectorSearchParams
+                         ) -> tuple[list[tuple[Document, float]], list[tuple[Document, float]]]:
+    k = candidate_count(search_params)
+    filter_node = _parse_search_filter(search_params)
+    search_kwargs = _filter_kwargs(vectorstore_model.vector_store, filter_node)
+    bm25_index = get_bm25_index(search_params.vectorstore_type, vectorstore_model.vector_store_collection_name)
+    if not search_params.hybrid or not len(bm25_index):
+        vector_results = vectorstore_model.vector_store.similarity_search_with_score(
+            search_params.query, k=k, **search_kwargs)
+        return vector_results, vector_results
+
+    bm25_future = _search_executor.submit(bm25_index.search, search_params.query, k, filter_node)
+    vector_results = vectorstore_model.vector_store.similarity_search_with_score(
+        search_params.query, k=k, **search_kwargs)
+    return reciprocal_rank_fusion([vector_results, bm25_future.result()], k), vector_results
+
+
+# 按过滤策略过滤重排或召回的结果
+def _filter_results(search_params: VectorSearchParams, is_ranker: bool, ranker_arr: list[dict],
+                    scores: list[tuple[Document, float]]) -> list[VectorSearchResult]:
     all_results = format_vectorstore_result(is_ranker, ranker_arr, scores)
 
     if search_params.filter_strategy.value == "auto":
@@ -107,14 +242,471 @@ def search_by_scores(search_params :VectorSearchParams) -> list[VectorSearchResu
         # 强制指定了要过滤的字段
         target_field = search_params.filter_strategy.value
 
-    # 3. 执行动态过滤
-    final_results = filter_results_dynamic(all_results, search_params.score, target_field)
+    # 执行动态过滤
+    return filter_results_dynamic(all_results, search_params.score, target_field)
+
+
+# 查询重排分数缓存, 返回每个文档缓存的分数 (未缓存为 None) 和需要发送给重排模型的文档位置
+def _lookup_rerank_scores(model: str, query: str, documents: list[str]) -> tuple[list[float | None], list[int]]:
+    scores = get_rerank_cache().get_many(model, query, documents)
+    return scores, [i for i, score in enumerate(scores) if score is None]
+
+
+# 合并重排模型返回的分数并写入缓存, 按分数取前 top_n 个, 格式与重排模型返回的结果相同
+def _merge_rerank_scores(model: str, query: str, documents: list[str], scores: list[float | None],
+                         missing: list[int], ranker_arr: list[dict], top_n: int) -> list[dict]:
+    fresh = {missing[int(i['index'])]: i['relevance_score'] for i in ranker_arr}
+    get_rerank_cache().put_many(model, query, [documents[i] for i in fresh], list(fresh.values()))
+    for position, score in fresh.items():
+        scores[position] = score
+    ranked = sorted((i for i, score in enumerate(scores) if score is not None), key=lambda i: scores[i], reverse=True)
+    return [{"index": i, "relevance_score": scores[i]} for i in ranked[:top_n]]
+
+
+# 把向量检索结果的分数换算成 [0, 1] 的相关性 (越大越相似), 向量库没有提供换算方法时返回 None
+def _relevance_results(vector_store: VectorStore, vector_results: list[tuple[Document, float]]
+                       ) -> Optional[list[tuple[Document, float]]]:
+    try:
+        relevance_fn = vector_store._select_relevance_score_fn()
+    except (NotImplementedError, ValueError):
+        return None
+    return [(doc, min(1.0, max(0.0, float(relevance_fn(score))))) for doc, score in vector_results]
+
+
+# 重排召回的候选文档并按过滤策略过滤, 排名已经确定时跳过重排
+# relevance_results 为换算成相关性的向量检索结果 (_relevance_results), 用于判断是否可以跳过重排
+def _rerank_and_filter(search_params: VectorSearchParams, candidates: list[tuple[Document, float]],
+                       relevance_results: Optional[list[tuple[Document, float]]]) -> list[VectorSearchResult]:
+    if should_skip_rerank(search_params, candidates, relevance_results):
+        get_rerank_stats().record(len(candidates), skipped=True)
+        return _filter_results(search_params, False, [], candidates[:search_params.top_k])
+
+    # 使用重排模型查询 防止重排模型未配置时会查询报错
+    is_ranker = False
+    ranker_arr = []
+    documents = rerank_documents(search_params, candidates)
+    try:
+        reranker = QuicklyRerankerProvider()
+        # 只把没有缓存分数的文档发送给重排模型, 需要全部文档的分数才能与缓存合并, 因此不传 top_n
+        scores, missing = _lookup_rerank_scores(reranker.model, search_params.query, documents)
+        fresh_arr = reranker.rerank(search_params.query, [documents[i] for i in missing]) if missing else []
+        ranker_arr = _merge_rerank_scores(reranker.model, search_params.query, documents, scores, missing,
+                                          fresh_arr, search_params.top_k)
+        is_ranker = True
+    except Exception as e:
+        missing = []
+        is_ranker = False
+        logger.warning(f"重排模型查询出错-使用默认召回查询: {e}")
+
+    get_rerank_stats().record(len(candidates), len(missing), failed=not is_ranker)
+    return _filter_results(search_params, is_ranker, ranker_arr,
+                           candidates if is_ranker else candidates[:search_params.top_k])
+
+
+# 读取文档的向量: 优先从向量库读取, 读取不到的 (只被 BM25 召回、向量库无法读取) 重新计算
+def _document_vectors(vector_store: VectorStore, documents: list[Document]) -> np.ndarray:
+    ids = [str(doc.id or doc.metadata.get("pk") or "") for doc in documents]
+    known_ids = [doc_id for doc_id in ids if doc_id]
+    vectors = {}
+    try:
+        if known_ids and isinstance(vector_store, (QuicklyFaissStore, QuicklyNumpyStore)):
+            vectors = vector_store.get_vectors_by_ids(known_ids)
+        elif known_ids and isinstance(vector_store, Milvus):
+            vectors = get_milvus_vectors_by_ids(vector_store, known_ids)
+        elif known_ids and isinstance(vector_store, Chroma):
+            res = vector_store._collection.get(ids=known_ids, include=["embeddings"])
+            vectors = dict(zip(res["ids"], res["embeddings"]))
+    except Exception as e:
+        logger.warning(f"读取文档向量失败, 重新计算向量: {e}")
+
+    missing = [i for i, doc_id in enumerate(ids) if doc_id not in vectors]
+    computed = {}
+    if missing:
+        embeddings = vector_store.embeddings.embed_documents([documents[i].page_content for i in missing])
+        computed = dict(zip(missing, embeddings))
+    return np.asarray([computed[i] if i in computed else vectors[doc_id] for i, doc_id in enumerate(ids)],
+                      dtype=np.float32)
+
+
+# 按片段向量做 MMR 选择, vectors 与 results 一一对应
+def _mmr_select_results(search_params: VectorSearchParams, results: list[VectorSearchResult], vectors: np.ndarray,
+                        embeddings: Embeddings) -> list[VectorSearchResult]:
+    # 重排过的结果用重排分数作为相关性; 否则用与问题向量的余弦相似度 (各向量库的分数含义不同, 不能直接比较)
+    if any(res.relevance_score for res in results):
+        relevance = np.asarray([res.relevance_score for res in results], dtype=np.float32)
+    else:
+        relevance = cosine_relevance(vectors, np.asarray(embeddings.embed_query(search_params.query)))
+
+    selected = mmr_select(vectors, relevance, search_params.mmr_top_k or len(results),
+                          search_params.mmr_lambda, search_params.mmr_duplicate_threshold)
+    selected_results = [results[i] for i in selected]
+    logger.info(f"MMR 筛选: {len(results)} -> {len(selected_results)} 个片段, "
+                f"{sum(len(res.text) for res in results)} -> {sum(len(res.text) for res in selected_results)} 个字符")
+    return selected_results
+
+
+# MMR 多样性筛选: 去掉与已选片段重复的片段, 减少提示词中的重复内容
+def _apply_mmr(vectorstore_model: QuicklyVectorStoreProvider, search_params: VectorSearchParams,
+               results: list[VectorSearchResult], candidates: list[tuple[Document, float]]) -> list[VectorSearchResult]:
+    if search_params.mmr_lambda is None or len(results) <= 1:
+        return results
+    vector_store = vectorstore_model.vector_store
+    documents_by_text = {doc.page_content: doc for doc, _ in candidates}
+    documents = [documents_by_text.get(res.text) or Document(page_content=res.text) for res in results]
+    return _mmr_select_results(search_params, results, _document_vectors(vector_store, documents),
+                               vector_store.embeddings)
+
+
+# 重排、过滤, 再做 MMR 筛选
+def _rerank_and_select(vectorstore_model: QuicklyVectorStoreProvider, search_params: VectorSearchParams,
+                       candidates: list[tuple[Document, float]],
+                       vector_results: list[tuple[Document, float]]) -> list[VectorSearchResult]:
+    results = _rerank_and_filter(search_params, candidates,
+                                 _relevance_results(vectorstore_model.vector_store, vector_results))
+    return _apply_mmr(vectorstore_model, search_params, results, candidates)
+
+
+# 向量检索的方法, 但是因为直接检索效果不好, 但是用算法优化又会有其他的开销, 但是不优化了
+def search_by_scores(search_params :VectorSearchParams) -> list[VectorSearchResult]:
+    vectorstore_model = get_vectorstore_model(search_params.vectorstore_type)
+
+    # 语料没有变化时, 相同的检索参数直接返回缓存的结果
+    search_cache = get_search_cache()
+    cache_key = search_cache.make_key(search_params, vectorstore_model.vector_store_collection_name)
+    cached_results = search_cache.get(cache_key)
+    if cached_results is not None:
+        return cached_results
+
+    candidates, vector_results = _retrieve_candidates(vectorstore_model, search_params)
+    final_results = _rerank_and_select(vectorstore_model, search_params, candidates, vector_results)
+    search_cache.put(cache_key, final_results)
 
     # 格式化并且合并两种查询的结果
     return final_results
 
 
-if __name__ == '__main__':
-    parms = VectorSearchParams(query='财税融合大数据应用赛项是什么', score=0.4, filter_strategy=ScoreField.RELEVANCE)
-    print(search_by_scores(parms))
+# 批量获取问题向量: 项目的嵌入模型走问题向量缓存, 未命中的问题合并为一次 embed_documents 请求
+def _embed_queries(embeddings: Embeddings, queries: list[str]) -> list[list[float]]:
+    if isinstance(embeddings, QuicklyEmbeddingModelProvider):
+        return embeddings.embed_queries(queries)
+    return embeddings.embed_documents(queries)
+
+
+# 多个问题向量一次检索: Milvus 多向量检索, Chroma 一次 query, 本地向量库矩阵检索, 其他向量库逐个检索
+def _similarity_search_by_vectors(vector_store: VectorStore, vectors: list[list[float]], k: int,
+                                  filter_node: Optional[FilterNode] = None) -> list[list[tuple[Document, float]]]:
+    search_kwargs = _filter_kwargs(vector_store, filter_node)
+    if isinstance(vector_store, (QuicklyFaissStore, QuicklyNumpyStore)):
+        return vector_store.similarity_search_with_score_by_vectors(vectors, k, **search_kwargs)
+    if isinstance(vector_store, Milvus):
+        return search_milvus_by_vectors(vector_store, vectors, k, search_kwargs.get("expr", ""))
+    if isinstance(vector_store, Chroma):
+        res = vector_store._collection.query(query_embeddings=vectors, n_results=k, where=search_kwargs.get("filter"),
+                                             include=["documents", "metadatas", "distances"])
+        return [[(Document(id=doc_id, page_content=text, metadata=metadata or {}), distance)
+                 for doc_id, text, metadata, distance in zip(ids, texts, metadatas, distances)]
+                for ids, texts, metadatas, distances in
+                zip(res["ids"], res["documents"], res["metadatas"], res["distances"])]
+    return list(_search_executor.map(
+        lambda vector: vector_store.similarity_search_with_score_by_vector(vector, k, **search_kwargs), vectors))
+
+
+# 批量检索: 评测和常见问题预热时一次处理多个问题, 结果与传入顺序一致
+def search_by_scores_many(search_params_list: list[VectorSearchParams]) -> list[list[VectorSearchResult]]:
+    """
+    与逐个调用 search_by_scores 的结果相同, 但是
+    1. 同一个向量库的问题只请求一次嵌入模型 (embed_documents 批量计算)
+    2. 同一个向量库的问题向量一次检索 (Milvus 多向量检索 / 本地向量库矩阵检索)
+    3. BM25 检索和重排在线程池中并发执行
+    """
+    search_cache = get_search_cache()
+    results: list[list[VectorSearchResult] | None] = [None] * len(search_params_list)
 
+    # 先查检索结果缓存, 未命中的问题按 (向量库, 过滤表达式) 分组
+    pending: dict[tuple[VectorStorageType, Optional[str]], list[tuple[int, tuple]]] = {}
+    for position, search_params in enumerate(search_params_list):
+        vectorstore_model = get_vectorstore_model(search_params.vectorstore_type)
+        cache_key = search_cache.make_key(search_params, vectorstore_model.vector_store_collection_name)
+        cached_results = search_cache.get(cache_key)
+        if cached_results is not None:
+            results[position] = cached_results
+        else:
+            pending.setdefault((search_params.vectorstore_type, search_params.filter_expr), []).append(
+                (position, cache_key))
+
+    # 每个向量库: 批量计算问题向量, 一次检索出所有问题的候选, 混合检索的 BM25 并行执行
+    candidates: dict[int, tuple[list[tuple[Document, float]], list[tuple[Document, float]]]] = {}
+    for (vectorstore_type, filter_expr), items in pending.items():
+        vectorstore_model = get_vectorstore_model(vectorstore_type)
+        vector_store = vectorstore_model.vector_store
+        bm25_index = get_bm25_index(vectorstore_type, vectorstore_model.vector_store_collection_name)
+        params = [search_params_list[position] for position, _ in items]
+        filter_node = parse_filter(filter_expr) if filter_expr else None
+
+        bm25_futures = {position: _search_executor.submit(bm25_index.search, search_params.query,
+                                                          candidate_count(search_params), filter_node)
+                        for (position, _), search_params in zip(items, params)
+                        if search_params.hybrid and len(bm25_index)}
+        vectors = _embed_queries(vector_store.embeddings, [search_params.query for search_params in params])
+        vector_results = _similarity_search_by_vectors(vector_store, vectors,
+                                                       max(candidate_count(search_params) for search_params in params),
+                                                       filter_node)
+        for (position, _), search_params, scores in zip(items, params, vector_results):
+            k = candidate_count(search_params)
+            scores = scores[:k]
+            if position in bm25_futures:
+                candidates[position] = (reciprocal_rank_fusion([scores, bm25_futures[position].result()], k), scores)
+            else:
+                candidates[position] = (scores, scores)
+
+    # 并发重排
+    rerank_futures = {position: _search_executor.submit(
+        _rerank_and_select, get_vectorstore_model(search_params_list[position].vectorstore_type),
+        search_params_list[position], *retrieved) for position, retrieved in candidates.items()}
+    for items in pending.values():
+        for position, cache_key in items:
+            results[position] = rerank_futures[position].result()
+            search_cache.put(cache_key, results[position])
+    return results
+
+
+# 在异步检索的线程池中执行阻塞的函数
+async def _arun_blocking(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_async_search_executor, partial(func, *args))
+
+
+# 异步向量检索: 向量库有原生异步方法时直接使用, 否则在有界的线程池中执行
+async def _asimilarity_search_by_vector(vector_store: VectorStore, vector: list[float], k: int,
+                                        filter_node: Optional[FilterNode] = None) -> list[tuple[Document, float]]:
+    native_search = getattr(vector_store, "asimilarity_search_with_score_by_vector", None)
+    if native_search is not None:
+        return await native_search(vector, k=k, **_filter_kwargs(vector_store, filter_node))
+    return (await _arun_blocking(_similarity_search_by_vectors, vector_store, [vector], k, filter_node))[0]
+
+
+# 异步召回候选文档: 问题向量检索和 BM25 检索并发执行, 返回值与 _retrieve_candidates 相同
+async def _aretrieve_candidates(vectorstore_model: QuicklyVectorStoreProvider, search_params: VectorSearchParams
+                                ) -> tuple[list[tuple[Document, float]], list[tuple[Document, float]]]:
+    vector_store = vectorstore_model.vector_store
+    k = candidate_count(search_params)
+    filter_node = _parse_search_filter(search_params)
+
+    async def vector_search() -> list[tuple[Document, float]]:
+        vector = await vector_store.embeddings.aembed_query(search_params.query)
+        return await _asimilarity_search_by_vector(vector_store, vector, k, filter_node)
+
+    bm25_index = await _arun_blocking(get_bm25_index, search_params.vectorstore_type,
+                                      vectorstore_model.vector_store_collection_name)
+    if not search_params.hybrid or not len(bm25_index):
+        vector_results = await vector_search()
+        return vector_results, vector_results
+
+    vector_results, bm25_results = await asyncio.gather(
+        vector_search(), _arun_blocking(bm25_index.search, search_params.query, k, filter_node))
+    return reciprocal_rank_fusion([vector_results, bm25_results], k), vector_results
+
+
+# 异步重排召回的候选文档并按过滤策略过滤, 排名已经确定时跳过重排
+async def _arerank_and_filter(search_params: VectorSearchParams, candidates: list[tuple[Document, float]],
+                              relevance_results: Optional[list[tuple[Document, float]]]
+                              ) -> list[VectorSearchResult]:
+    if should_skip_rerank(search_params, candidates, relevance_results):
+        get_rerank_stats().record(len(candidates), skipped=True)
+        return _filter_results(search_params, False, [], candidates[:search_params.top_k])
+
+    is_ranker = False
+    ranker_arr = []
+    documents = rerank_documents(search_params, candidates)
+    try:
+        reranker = QuicklyRerankerProvider()
+        scores, missing = _lookup_rerank_scores(reranker.model, search_params.query, documents)
+        fresh_arr = await reranker.arerank(search_params.query, [documents[i] for i in missing]) if missing else []
+        ranker_arr = _merge_rerank_scores(reranker.model, search_params.query, documents, scores, missing,
+                                          fresh_arr, search_params.top_k)
+        is_ranker = True
+    except Exception as e:
+        missing = []
+        is_ranker = False
+        logger.warning(f"重排模型查询出错-使用默认召回查询: {e}")
+
+    get_rerank_stats().record(len(candidates), len(missing), failed=not is_ranker)
+    return _filter_results(search_params, is_ranker, ranker_arr,
+                           candidates if is_ranker else candidates[:search_params.top_k])
+
+
+# search_by_scores 的异步版本, 不阻塞事件循环, 任务被取消时正在等待的嵌入、检索和重排请求一起取消
+async def asearch_by_scores(search_params: VectorSearchParams) -> list[VectorSearchResult]:
+    vectorstore_model = await _arun_blocking(get_vectorstore_model, search_params.vectorstore_type)
+
+    # 语料没有变化时, 相同的检索参数直接返回缓存的结果
+    search_cache = get_search_cache()
+    cache_key = search_cache.make_key(search_params, vectorstore_model.vector_store_collection_name)
+    cached_results = search_cache.get(cache_key)
+    if cached_results is not None:
+        return cached_results
+
+    candidates, vector_results = await _aretrieve_candidates(vectorstore_model, search_params)
+    final_results = await _arerank_and_filter(
+        search_params, candidates, _relevance_results(vectorstore_model.vector_store, vector_results))
+    final_results = await _arun_blocking(_apply_mmr, vectorstore_model, search_params, final_results, candidates)
+    search_cache.put(cache_key, final_results)
+    return final_results
+
+
+
+# ---------------------------------------------------------------------- 联邦检索
+
+# 把一个集合召回的分数换算到 [0, 1], 越大越相似, 不同向量库 (距离 / 相似度) 的结果才能合并排序
+def _normalize_scores(vector_store: VectorStore, candidates: list[tuple[Document, Optional[float]]],
+                      vector_results: list[tuple[Document, float]]) -> list[tuple[Document, Optional[float]]]:
+    relevance_results = _relevance_results(vector_store, vector_results)
+    if relevance_results is not None:
+        vector_scores = {doc.page_content: score for doc, score in relevance_results}
+    else:
+        # 向量库没有提供换算方法时按排名换算, 向量检索结果已按相似程度从高到低排列
+        vector_scores = {doc.page_content: 1.0 - rank / len(vector_results)
+                         for rank, (doc, _) in enumerate(vector_results)}
+    # 只被 BM25 召回的文档没有向量分数, 与单个集合的检索一样为 None
+    return [(doc, vector_scores.get(doc.page_content)) for doc, _ in candidates]
+
+
+# 合并多个集合的候选文档: 按内容去重保留最高分, 按换算后的分数排序截取候选数量, 没有向量分数的排在最后
+def _merge_federated_candidates(search_params: VectorSearchParams,
+                                target_candidates: list[list[tuple[Document, Optional[float]]]]
+                                ) -> tuple[list[tuple[Document, Optional[float]]], list[int]]:
+    """返回合并后的候选文档和每个候选文档来自第几个集合"""
+    def rank_key(score: Optional[float]) -> tuple[bool, float]:
+        return score is not None, score or 0.0
+
+    best: dict[str, tuple[Document, Optional[float], int]] = {}
+    for target_index, candidates in enumerate(target_candidates):
+        for doc, score in candidates:
+            current = best.get(doc.page_content)
+            if current is None or rank_key(score) > rank_key(current[1]):
+                best[doc.page_content] = (doc, score, target_index)
+    ranked = sorted(best.values(), key=lambda item: rank_key(item[1]), reverse=True)[:candidate_count(search_params)]
+    return [(doc, score) for doc, score, _ in ranked], [target_index for _, _, target_index in ranked]
+
+
+# 有向量分数的候选文档, 用于判断是否可以跳过重排
+def _scored_candidates(candidates: list[tuple[Document, Optional[float]]]) -> list[tuple[Document, float]]:
+    return [(doc, score) for doc, score in candidates if score is not None]
+
+
+# 联邦检索的 MMR 筛选: 各集合的片段向量分别读取, 嵌入模型不同的向量不在同一空间, 此时跳过
+def _apply_federated_mmr(targets: list[VectorSearchTarget], vectorstore_models: list[QuicklyVectorStoreProvider],
+                         search_params: VectorSearchParams, results: list[VectorSearchResult],
+                         candidates: list[tuple[Document, float]], sources: list[int]) -> list[VectorSearchResult]:
+    if search_params.mmr_lambda is None or len(results) <= 1:
+        return results
+    if len({QuicklyVectorStoreProvider.embedding_name(target.vectorstore_type) for target in targets}) > 1:
+        logger.info("[FederatedSearch] 各集合使用的嵌入模型不同, 跳过 MMR 筛选")
+        return results
+
+    candidate_positions = {doc.page_content: position for position, (doc, _) in enumerate(candidates)}
+    groups: dict[int, list[int]] = {}
+    for result_index, res in enumerate(results):
+        groups.setdefault(sources[candidate_positions[res.text]], []).append(result_index)
+    vectors: list[np.ndarray | None] = [None] * len(results)
+    for target_index, result_indexes in groups.items():
+        documents = [candidates[candidate_positions[results[i].text]][0] for i in result_indexes]
+        for i, vector in zip(result_indexes,
+                             _document_vectors(vectorstore_models[target_index].vector_store, documents)):
+            vectors[i] = vector
+    return _mmr_select_results(search_params, results, np.stack(vectors), vectorstore_models[0].vector_store.embeddings)
+
+
+# 联邦检索的检索结果缓存键, 任意一个集合的语料变化后失效
+def _federated_cache_key(search_params: VectorSearchParams, vectorstore_models: list[QuicklyVectorStoreProvider],
+                         targets: list[VectorSearchTarget]) -> tuple:
+    return get_search_cache().make_federated_key(
+        search_params, [(target.vectorstore_type, vectorstore_model.vector_store_collection_name)
+                        for target, vectorstore_model in zip(targets, vectorstore_models)])
+
+
+# 召回一个集合的候选文档并换算分数, 单个集合出错时不影响其他集合
+def _retrieve_target_candidates(vectorstore_model: QuicklyVectorStoreProvider,
+                                search_params: VectorSearchParams) -> list[tuple[Document, Optional[float]]]:
+    try:
+        candidates, vector_results = _retrieve_candidates(vectorstore_model, search_params)
+    except Exception as e:
+        logger.warning(f"[FederatedSearch] 集合 {search_params.vectorstore_type.value}/"
+                       f"{vectorstore_model.vector_store_collection_name} 检索失败, 忽略该集合: {e}")
+        return []
+    return _normalize_scores(vectorstore_model.vector_store, candidates, vector_results)
+
+
+def federated_search(search_params: VectorSearchParams,
+                     targets: list[VectorSearchTarget]) -> list[VectorSearchResult]:
+    """
+    联邦检索: 同时检索分布在多个向量库 / 集合中的知识库, 合并后只重排一次
+    1. 各集合在线程池中并行召回, 总耗时接近最慢的一个集合
+    2. 各集合的分数换算到 [0, 1] (越大越相似) 后合并, 相同内容的片段只保留一个
+    3. 合并后的候选文档一起重排、过滤, 再做 MMR 筛选
+    search_params 中的 vectorstore_type 不起作用, 返回结果的 score 为换算后的分数
+
+    与单个集合的 search_by_scores 不同, 向量分数一律是换算后的相关性:
+    filter_strategy 为 VECTOR (或 AUTO 且重排失败) 时, score 阈值按 [0, 1] 的相关性比较, 越大越严格,
+    不再是向量库原始的距离或相似度, 单集合检索中为距离设置的阈值不能直接沿用
+    没有提供换算方法的向量库按排名换算 (第一名为 1), 只被 BM25 召回的片段 score 为 None, 不参与分数过滤
+    """
+    if not targets:
+        return []
+    vectorstore_models = [get_vectorstore_model(target.vectorstore_type, target.collection_name) for target in targets]
+
+    search_cache = get_search_cache()
+    cache_key = _federated_cache_key(search_params, vectorstore_models, targets)
+    cached_results = search_cache.get(cache_key)
+    if cached_results is not None:
+        return cached_results
+
+    futures = [_federated_executor.submit(
+        _retrieve_target_candidates, vectorstore_model,
+        search_params.model_copy(update={"vectorstore_type": target.vectorstore_type}))
+        for target, vectorstore_model in zip(targets, vectorstore_models)]
+    candidates, sources = _merge_federated_candidates(search_params, [future.result() for future in futures])
+
+    # 换算后的分数已按相似程度排列, 同时作为判断是否可以跳过重排的向量检索结果
+    final_results = _rerank_and_filter(search_params, candidates, _scored_candidates(candidates))
+    final_results = _apply_federated_mmr(targets, vectorstore_models, search_params, final_results, candidates, sources)
+    search_cache.put(cache_key, final_results)
+    return final_results
+
+
+# 异步召回一个集合的候选文档并换算分数, 单个集合出错时不影响其他集合
+async def _aretrieve_target_candidates(vectorstore_model: QuicklyVectorStoreProvider,
+                                       search_params: VectorSearchParams) -> list[tuple[Document, Optional[float]]]:
+    try:
+        candidates, vector_results = await _aretrieve_candidates(vectorstore_model, search_params)
+    except Exception as e:
+        logger.warning(f"[FederatedSearch] 集合 {search_params.vectorstore_type.value}/"
+                       f"{vectorstore_model.vector_store_collection_name} 检索失败, 忽略该集合: {e}")
+        return []
+    return _normalize_scores(vectorstore_model.vector_store, candidates, vector_results)
+
+
+# federated_search 的异步版本, 各集合的召回并发执行
+async def afederated_search(search_params: VectorSearchParams,
+                            targets: list[VectorSearchTarget]) -> list[VectorSearchResult]:
+    if not targets:
+        return []
+    vectorstore_models = await asyncio.gather(*(
+        _arun_blocking(get_vectorstore_model, target.vectorstore_type, target.collection_name) for target in targets))
+
+    search_cache = get_search_cache()
+    cache_key = _federated_cache_key(search_params, vectorstore_models, targets)
+    cached_results = search_cache.get(cache_key)
+    if cached_results is not None:
+        return cached_results
+
+    target_candidates = await asyncio.gather(*(
+        _aretrieve_target_candidates(vectorstore_model,
+                                     search_params.model_copy(update={"vectorstore_type": target.vectorstore_type}))
+        for target, vectorstore_model in zip(targets, vectorstore_models)))
+    candidates, sources = _merge_federated_candidates(search_params, list(target_candidates))
+
+    final_results = await _arerank_and_filter(search_params, candidates, _scored_candidates(candidates))
+    final_results = await _arun_blocking(_apply_federated_mmr, targets, list(vectorstore_models), search_params,
+                                         final_results, candidates, sources)
+    search_cache.put(cache_key, final_results)
+    return final_results
@@ -0,0 +1,8 @@
+"""
+测试不请求真实的模型服务和 Milvus, 导入配置前填入占位的环境变量 (已有的 .env 或环境变量优先)
+"""
+import os
+
+os.environ.setdefault("SILICONFLOW_API_KEY", "test")
+os.environ.setdefault("ALIYUN_API_KEY", "test")
+os.environ.setdefault("MILVUS_URL", "http://127.0.0.1:19530")
@@ -0,0 +1,47 @@
+"""
+BM25Index 测试
+"""
+import json
+import time
+
+from langchain_core.documents import Document
+
+from quickly_rag.vector.store.bm25_index import BM25Index
+
+
+def _saved_ids(path) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [doc["id"] for doc in json.load(f)["docs"]]
+
+
+def test_search_and_delete():
+    index = BM25Index()
+    index.add_documents([Document(page_content="全国职业院校技能大赛"), Document(page_content="machine learning")],
+                        ids=["a", "b"])
+    assert index.search("技能大赛", k=1)[0][0].id == "a"
+    assert index.delete(["a"]) == 1
+    assert [doc.id for doc, _ in index.search("技能大赛 learning", k=2)] == ["b"]
+
+
+def test_saves_are_throttled_and_flushed(tmp_path, monkeypatch):
+    monkeypatch.setattr(BM25Index, "_SAVE_INTERVAL_SECONDS", 0.3)
+    path = tmp_path / "bm25.json"
+    index = BM25Index(path)
+    saves = []
+    original_save = index._save
+    monkeypatch.setattr(index, "_save", lambda: (saves.append(1), original_save()))
+
+    for i in range(50):
+        index.add_documents([Document(page_content=f"doc {i}")], ids=[str(i)])
+    index.delete(["0"])
+    # 第一批立即保存, 之后的修改合并到定时器的一次保存中
+    assert len(saves) == 1
+    assert _saved_ids(path) == ["0"]
+
+    time.sleep(0.5)
+    assert len(saves) == 2
+    assert _saved_ids(path) == [str(i) for i in range(1, 50)]
+
+    index.add_documents([Document(page_content="doc 50")], ids=["50"])
+    index.flush()
+    assert BM25Index(path).search("50", k=1)[0][0].id == "50"
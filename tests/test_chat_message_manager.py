@@ -0,0 +1,28 @@
+"""
+ChatMessageManager 保存游标测试
+"""
+from quickly_rag.chat.message.chat_message_manager import ChatMessageManager
+
+
+def test_failed_write_is_restored():
+    manager = ChatMessageManager()
+    manager.add_human_message("q1")
+    records = manager.take_unsaved_messages()
+    manager.add_ai_message("a1")
+    manager.restore_unsaved(records)
+    assert [m.content for m in manager.get_unsaved_messages()] == ["q1", "a1"]
+    manager.mark_saved(1)
+    assert [m.content for m in manager.get_unsaved_messages()] == ["a1"]
+
+
+def test_clear_drops_in_flight_writes():
+    manager = ChatMessageManager()
+    manager.add_human_message("q1")
+    records = manager.take_unsaved_messages()
+    manager.clear_messages()
+    assert not manager.has_pending_writes()
+
+    # 清空之前取出的消息写入失败, 不会重新出现在未保存列表中
+    manager.add_human_message("q2")
+    manager.restore_unsaved(records)
+    assert [m.content for m in manager.get_unsaved_messages()] == ["q2"]
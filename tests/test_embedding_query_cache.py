@@ -0,0 +1,53 @@
+"""
+问题向量缓存测试, 替换 DashScope 客户端, 不请求真实的嵌入服务
+"""
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("dashscope")
+
+from quickly_rag.enums.platform_enum import PlatformEmbeddingType
+from quickly_rag.provider import embedding_model_provider
+from quickly_rag.provider.embedding_cache import QueryEmbeddingCache
+from quickly_rag.provider.embedding_model_provider import QuicklyEmbeddingModelProvider
+
+
+class FakeDashScopeClient:
+    """按 text_type 返回不同的向量, 记录每次请求的模式"""
+
+    def __init__(self):
+        self.text_types = []
+
+    def call(self, input, text_type, model):
+        texts = input if isinstance(input, list) else [input]
+        self.text_types.append(text_type)
+        offset = 0.0 if text_type == "query" else 100.0
+        return SimpleNamespace(status_code=200, output={
+            "embeddings": [{"embedding": [offset + len(text), 1.0]} for text in texts]})
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    cache = QueryEmbeddingCache(max_entries=16)
+    monkeypatch.setattr(embedding_model_provider, "get_query_embedding_cache", lambda: cache)
+    provider = QuicklyEmbeddingModelProvider(PlatformEmbeddingType.ALIYUN)
+    client = FakeDashScopeClient()
+    monkeypatch.setattr(provider._embeddings_model, "client", client)
+    return provider, client
+
+
+def test_embed_queries_uses_query_mode(provider):
+    provider, client = provider
+    batch = provider.embed_queries(["a", "bb"])
+    assert client.text_types == ["query"]
+    # 批量结果与逐条 embed_query 一致, 并且命中同一份缓存
+    assert batch == [provider.embed_query("a"), provider.embed_query("bb")]
+    assert client.text_types == ["query"]
+
+
+def test_embed_query_after_embed_queries_hits_cache(provider):
+    provider, client = provider
+    single = provider.embed_query("abc")
+    assert provider.embed_queries(["abc"]) == [single]
+    assert client.text_types == ["query"]
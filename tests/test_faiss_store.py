@@ -0,0 +1,84 @@
+"""
+QuicklyFaissStore 测试, 使用按文本生成固定向量的嵌入模型, 不请求真实的嵌入服务
+"""
+import zlib
+
+import faiss
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from quickly_rag.enums.vector_enum import VectorIndexType
+from quickly_rag.vector.store.faiss_store import QuicklyFaissStore
+
+DIMENSION = 32
+
+
+class HashEmbeddings(Embeddings):
+    """同一段文本总是得到同一个向量, 不同文本的向量几乎正交"""
+
+    @staticmethod
+    def _vector(text: str) -> list[float]:
+        return np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(DIMENSION).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._vector(text)
+
+
+def _store(path, index_type: VectorIndexType) -> QuicklyFaissStore:
+    return QuicklyFaissStore(HashEmbeddings(), path, index_type=index_type, dimension=DIMENSION,
+                             nlist=4, ivf_min_train_size=100, nprobe=4)
+
+
+def _top1(store: QuicklyFaissStore, text: str) -> tuple[str, float]:
+    doc, score = store.similarity_search_with_score(text, k=1)[0]
+    return doc.page_content, score
+
+
+@pytest.mark.parametrize("index_type", [VectorIndexType.FLAT, VectorIndexType.IVF_FLAT, VectorIndexType.HNSW])
+def test_delete_then_search(tmp_path, index_type):
+    store = _store(tmp_path, index_type)
+    texts = [f"x{i}" for i in range(300)]
+    ids = []
+    for i in range(0, len(texts), 50):
+        ids.extend(store.add_texts(texts[i:i + 50]))
+    store.delete(ids[:5])
+    assert store.index_size() == 295
+
+    for text in ("x5", "x6", "x150", "x299"):
+        content, score = _top1(store, text)
+        assert content == text
+        assert score == pytest.approx(1.0, abs=1e-4)
+    for text in ("x0", "x4"):
+        assert _top1(store, text)[0] != text
+    # 删除后每个问题仍然能取回 k 个结果
+    assert len(store.similarity_search_with_score("x0", k=10)) == 10
+    assert set(store.get_vectors_by_ids(ids[4:6])) == {ids[5]}
+    store.close()
+
+    # 保存后的索引重新加载 (mmap), 结果不变
+    reloaded = _store(tmp_path, index_type)
+    assert reloaded.index_size() == 295
+    assert _top1(reloaded, "x150")[0] == "x150"
+    assert _top1(reloaded, "x0")[0] != "x0"
+    reloaded.close()
+
+
+def test_ivf_trains_after_min_train_size(tmp_path):
+    store = _store(tmp_path, VectorIndexType.IVF_FLAT)
+    store.add_texts([f"x{i}" for i in range(60)])
+    assert not isinstance(store._base_index(store._index), faiss.IndexIVF)
+    store.add_texts([f"x{i}" for i in range(60, 120)])
+    assert isinstance(store._base_index(store._index), faiss.IndexIVF)
+    assert _top1(store, "x10")[0] == "x10"
+    store.close()
+
+
+def test_rejects_wrong_dimension(tmp_path):
+    store = QuicklyFaissStore(HashEmbeddings(), tmp_path, dimension=DIMENSION + 1)
+    with pytest.raises(ValueError):
+        store.add_texts(["x"])
+    store.close()
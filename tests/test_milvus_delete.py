@@ -0,0 +1,72 @@
+"""
+milvus_util.delete_documents 测试, 使用假的 MilvusClient, 不连接真实的 Milvus
+"""
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+
+from quickly_rag.vector.store import milvus_util
+from quickly_rag.vector.store.bm25_index import BM25Index
+
+
+class FakeIterator:
+    def __init__(self, rows, batch_size):
+        self._pages = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+        self.closed = False
+
+    def next(self):
+        return self._pages.pop(0) if self._pages else []
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    def __init__(self, pks, fail_after: int = None):
+        self.pks = list(pks)
+        self.deleted = []
+        self.fail_after = fail_after
+        self.iterator = None
+
+    def query_iterator(self, collection_name, batch_size, filter, output_fields):
+        self.iterator = FakeIterator([{"pk": pk} for pk in self.pks], batch_size)
+        return self.iterator
+
+    def delete(self, collection_name, ids):
+        if self.fail_after is not None and len(self.deleted) >= self.fail_after:
+            raise RuntimeError("milvus unavailable")
+        self.deleted.extend(ids)
+
+
+@pytest.fixture
+def bm25(monkeypatch):
+    index = BM25Index()
+    monkeypatch.setattr(milvus_util, "get_bm25_index", lambda *args: index)
+    return index
+
+
+def _store(client):
+    return SimpleNamespace(collection_name="test", client=client, _primary_field="pk")
+
+
+def test_filter_delete_pages_past_query_limit(bm25):
+    pks = list(range(20000))
+    bm25.add_documents([Document(page_content=f"doc {pk}") for pk in pks[:3]], ids=pks[:3])
+    client = FakeClient(pks)
+
+    assert milvus_util.delete_documents(_store(client), filter_expr="source == 'a'") == 20000
+    assert client.deleted == pks
+    assert client.iterator.closed
+    assert len(bm25) == 0
+
+
+def test_delete_failure_is_raised_and_bm25_keeps_undeleted(bm25):
+    pks = list(range(2500))
+    bm25.add_documents([Document(page_content=f"doc {pk}") for pk in pks], ids=pks)
+    client = FakeClient(pks, fail_after=1000)
+
+    with pytest.raises(RuntimeError):
+        milvus_util.delete_documents(_store(client), ids=pks)
+    # 失败前已经从 Milvus 删除的文档同步从 BM25 删除
+    assert len(bm25) == 1500
@@ -0,0 +1,123 @@
+"""
+RedisSessionBackend 测试, 使用 fakeredis 代替真实的 Redis 服务
+多个 worker 通过同一个 FakeServer 共享数据, 模拟多进程部署
+"""
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from quickly_rag.chat.message.chat_message_manager import ChatMessageManager, MessageType
+from quickly_rag.chat.message.chat_session_manager import ChatSessionManager
+from quickly_rag.chat.message.session_backend import RedisSessionBackend
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def _backend(server, ttl_seconds: int = 3600) -> RedisSessionBackend:
+    return RedisSessionBackend(ttl_seconds=ttl_seconds, key_prefix="test:session",
+                               client=fakeredis.FakeRedis(server=server, decode_responses=True))
+
+
+def _manager(server, near_cache_seconds: float) -> ChatSessionManager:
+    return ChatSessionManager(default_max_messages=10, backend=_backend(server),
+                              near_cache_seconds=near_cache_seconds)
+
+
+def test_save_and_load(server):
+    backend = _backend(server)
+    manager = ChatMessageManager(max_messages=4)
+    manager.add_human_message("q1")
+    manager.add_ai_message("a1")
+    backend.save("s1", manager)
+    assert manager.get_unsaved_messages() == []
+
+    # 再次保存只追加新消息, 超出 max_messages 的旧消息被裁掉
+    for i in range(2, 4):
+        manager.add_human_message(f"q{i}")
+        manager.add_ai_message(f"a{i}")
+    backend.save("s1", manager)
+
+    data = backend.load("s1", window=10)
+    assert [m["content"] for m in data["messages"]] == ["q2", "a2", "q3", "a3"]
+    assert data["max_messages"] == 4
+    assert [m["content"] for m in backend.load("s1", window=2)["messages"]] == ["q3", "a3"]
+
+    restored = ChatMessageManager.from_dict(data)
+    assert [m.role for m in restored.messages] == [MessageType.HUMAN, MessageType.AI] * 2
+    assert backend.load("missing", window=10) is None
+
+
+def test_save_refreshes_ttl_on_both_keys(server):
+    backend = _backend(server, ttl_seconds=60)
+    manager = ChatMessageManager()
+    manager.add_human_message("q")
+    backend.save("s1", manager)
+
+    client = fakeredis.FakeRedis(server=server)
+    assert 0 < client.ttl("test:session:s1:meta") <= 60
+    assert 0 < client.ttl("test:session:s1:messages") <= 60
+
+
+def test_delete_and_delete_expired(server):
+    backend = _backend(server, ttl_seconds=1)
+    for session_id in ("s1", "s2"):
+        manager = ChatMessageManager()
+        manager.add_human_message("q")
+        backend.save(session_id, manager)
+
+    backend.delete("s1")
+    assert backend.load("s1", window=10) is None
+    assert backend.load("s2", window=10) is not None
+
+    # 过期由 Redis 的 EXPIRE 负责, delete_expired 不需要扫描
+    assert backend.delete_expired(cutoff=None) == 0
+    time.sleep(1.1)
+    assert backend.load("s2", window=10) is None
+
+
+def test_near_cache_reloads_after_other_worker_writes(server):
+    worker_a = _manager(server, near_cache_seconds=0.2)
+    worker_b = _manager(server, near_cache_seconds=0.2)
+    try:
+        session_a = worker_a.get_session("s1")
+        with worker_a.session_lock("s1"):
+            session_a.add_human_message("from a")
+            assert worker_a.save_session("s1", session_a)
+
+        session_b = worker_b.get_session("s1")
+        assert [m.content for m in session_b.messages] == ["from a"]
+        with worker_b.session_lock("s1"):
+            session_b.add_ai_message("from b")
+            assert worker_b.save_session("s1", session_b)
+
+        # 有效期内 worker A 仍然使用自己的近端缓存
+        assert [m.content for m in worker_a.get_session("s1").messages] == ["from a"]
+
+        time.sleep(0.25)
+        assert [m.content for m in worker_a.get_session("s1").messages] == ["from a", "from b"]
+        assert worker_a.stats()["stale"] == 1
+    finally:
+        worker_a.close()
+        worker_b.close()
+
+
+def test_near_cache_disabled_trusts_local_copy(server):
+    worker_a = _manager(server, near_cache_seconds=0)
+    worker_b = _manager(server, near_cache_seconds=0)
+    try:
+        worker_a.get_session("s1")
+        session_b = worker_b.get_session("s1")
+        with worker_b.session_lock("s1"):
+            session_b.add_human_message("from b")
+            assert worker_b.save_session("s1", session_b)
+
+        # 近端缓存有效期为 0 时始终信任进程内缓存, 看不到其他 worker 的写入
+        assert list(worker_a.get_session("s1").messages) == []
+    finally:
+        worker_a.close()
+        worker_b.close()
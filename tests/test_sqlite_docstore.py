@@ -0,0 +1,39 @@
+"""
+SqliteDocstore 测试
+"""
+import sqlite3
+import threading
+
+import pytest
+
+from quickly_rag.vector.store.sqlite_docstore import SqliteDocstore
+
+
+def test_large_id_lists_are_chunked(tmp_path):
+    docstore = SqliteDocstore(tmp_path / "docstore.db")
+    doc_ids = [f"d{i}" for i in range(2500)]
+    with docstore.transaction():
+        row_ids = docstore.add(doc_ids, doc_ids, [{}] * len(doc_ids))
+
+    assert len(docstore.get(row_ids)) == 2500
+    assert docstore.row_ids(doc_ids) == dict(zip(doc_ids, row_ids))
+    assert sorted(docstore.delete(doc_ids[:2000])) == row_ids[:2000]
+    assert docstore.count() == 500
+    docstore.close()
+
+
+def test_close_closes_connections_of_all_threads(tmp_path):
+    docstore = SqliteDocstore(tmp_path / "docstore.db")
+    conns = []
+    worker = threading.Thread(target=lambda: conns.append(docstore.transaction()))
+    worker.start()
+    worker.join()
+    conns.append(docstore.transaction())
+
+    docstore.close()
+    for conn in conns:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+    # 关闭后再次使用会重新建立连接
+    assert docstore.count() == 0
+    docstore.close()